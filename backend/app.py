@@ -1,7 +1,10 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, abort, g
 from flask_cors import CORS
+from sqlalchemy.orm import configure_mappers
 from datetime import datetime, timedelta
+import hashlib
 import os
+import random
 import jwt
 from functools import wraps
 from dotenv import load_dotenv
@@ -18,25 +21,91 @@ app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
 
-CORS(app)  # Enable CORS for React frontend
+# Enable CORS for React frontend; the frontend echoes replicas.STICKY_HEADER to read its own writes
+CORS(app, expose_headers=['X-Read-Primary-Until'])
 
 # Import models and initialize db
-from models import db, Exercise, Workout, WorkoutExercise, User
+from models import db, Exercise, Workout, User, UserShard
+from serializers import (
+    load_workouts, load_workout, load_workout_page, iter_workouts, serialize_workout, serialize_workouts,
+    stream_workouts_json, stream_workouts_ndjson, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+)
+import stats
+import progression
+import schema
+from catalog import catalog, bump_version, serialize_exercise, sync_muscles
+import search
+import fastjson
+import auth_cache
+import passwords
+import workouts
+import versions
+import sync
+import batch
+import metrics
+import compression
+import replicas
+import shards
+app.json = fastjson.FastJSONProvider(app)  # jsonify() through orjson when it is installed
+metrics.init_app(app)
+compression.init_app(app)
+replicas.configure(app)  # Optional DATABASE_READ_URLS and per-engine pool sizes
+shards.configure(app)  # Optional DATABASE_SHARD_URLS
 db.init_app(app)
+replicas.init_app(app, db)
 
 # JWT helper functions
+# Spread token expiry over a window so logins don't all come back at the same time
+TOKEN_EXPIRY_JITTER = int(os.getenv('TOKEN_EXPIRY_JITTER', str(12 * 3600)))  # Seconds
+
 def generate_token(user_id):
     """Generate JWT token"""
     payload = {
         'user_id': user_id,
-        'exp': datetime.utcnow() + timedelta(days=7)
+        'exp': datetime.utcnow() + timedelta(days=7, seconds=random.randint(0, TOKEN_EXPIRY_JITTER))
     }
     token = jwt.encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
     # Ensure token is a string (PyJWT 2.0+ returns string by default)
     return token if isinstance(token, str) else token.decode('utf-8')
 
-def token_required(f):
-    """Decorator to protect routes"""
+def decode_token(token):
+    """Verify a JWT and return (user_id, exp), using the verified-token cache"""
+    if auth_cache.ENABLED:
+        cached = auth_cache.tokens.get(token)
+        if cached is not None:
+            if cached[1] <= datetime.utcnow().timestamp():
+                auth_cache.invalidate_token(token)
+                raise jwt.ExpiredSignatureError('Signature has expired')
+            return cached
+    data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+    verified = (data['user_id'], data['exp'])
+    if auth_cache.ENABLED:
+        auth_cache.tokens.set(token, verified, ttl=data['exp'] - datetime.utcnow().timestamp())
+    return verified
+
+def load_current_user(user_id):
+    """Load the user behind a token, using the user record cache"""
+    if auth_cache.ENABLED:
+        cached = auth_cache.users.get(user_id)
+        if cached is not None:
+            return cached
+    user = db.session.get(User, user_id)
+    if not user:
+        return None
+    snapshot = auth_cache.CachedUser(user.id, user.username, user.email)
+    if auth_cache.ENABLED:
+        auth_cache.users.set(user_id, snapshot)
+    return snapshot
+
+def token_required(f=None, *, load_user=True):
+    """Decorator to protect routes
+
+    Handlers receive the current user as their first argument. With load_user=False
+    they only get an object exposing .id and no users lookup is made.
+    """
+    if f is None:
+        return lambda func: token_required(func, load_user=load_user)
+
     @wraps(f)
     def decorated(*args, **kwargs):
         token = None
@@ -51,10 +120,14 @@ def token_required(f):
             return jsonify({'error': 'Token is missing'}), 401
         
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = User.query.get(data['user_id'])
-            if not current_user:
-                return jsonify({'error': 'User not found'}), 401
+            user_id, _ = decode_token(token)
+            g.user_id = user_id  # Read-your-writes routing to the primary
+            if load_user:
+                current_user = load_current_user(user_id)
+                if not current_user:
+                    return jsonify({'error': 'User not found'}), 401
+            else:
+                current_user = auth_cache.UserRef(user_id)
         except jwt.ExpiredSignatureError:
             return jsonify({'error': 'Token has expired'}), 401
         except jwt.InvalidTokenError:
@@ -63,54 +136,39 @@ def token_required(f):
         return f(current_user, *args, **kwargs)
     return decorated
 
+def password_pool_busy(error):
+    """503 response telling clients when to retry a login/registration"""
+    response = jsonify({'error': str(error)})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
 # Initialize database
 def init_database():
-    """Initialize database tables and seed data"""
+    """Bring the schema up to date and seed exercises (development server only)"""
     try:
         with app.app_context():
-            db.create_all()
-            # Seed initial exercises if database is empty
-            if Exercise.query.count() == 0:
-                seed_exercises()
+            # One primary key lookup when the database is already current
+            if not schema.check():
+                schema.migrate()
     except Exception as e:
         print(f"Database initialization error: {e}")
-        # Don't fail if tables already exist
 
-def seed_exercises():
-    """Seed the database with initial exercises"""
+def warm_up():
+    """Do the work the first request would otherwise pay for
+
+    Configures the ORM mappers and loads the exercise catalog. Under gunicorn
+    preload this runs once in the master, and forked workers inherit the result.
+    """
     with app.app_context():
-        exercises_data = [
-            {'name': 'Push-ups', 'category': 'Chest', 'muscle': 'Chest, Triceps', 
-             'description': 'Classic bodyweight exercise for upper body strength', 
-             'image': 'https://images.unsplash.com/photo-1571019613454-1cb2f99b2d8b?w=400&h=300&fit=crop'},
-            {'name': 'Squats', 'category': 'Legs', 'muscle': 'Quadriceps, Glutes', 
-             'description': 'Fundamental lower body exercise', 
-             'image': 'https://images.unsplash.com/photo-1549060279-7e168fcee0c2?w=400&h=300&fit=crop'},
-            {'name': 'Pull-ups', 'category': 'Back', 'muscle': 'Lats, Biceps', 
-             'description': 'Upper body pulling exercise', 
-             'image': 'https://images.unsplash.com/photo-1517836357463-d25dfeac3438?w=400&h=300&fit=crop'},
-            {'name': 'Deadlifts', 'category': 'Back', 'muscle': 'Hamstrings, Glutes, Back', 
-             'description': 'Compound movement for posterior chain', 
-             'image': 'https://images.unsplash.com/photo-1517836357463-d25dfeac3438?w=400&h=300&fit=crop'},
-            {'name': 'Bench Press', 'category': 'Chest', 'muscle': 'Chest, Shoulders, Triceps', 
-             'description': 'Classic chest building exercise', 
-             'image': 'https://images.unsplash.com/photo-1571019613454-1cb2f99b2d8b?w=400&h=300&fit=crop'},
-            {'name': 'Plank', 'category': 'Core', 'muscle': 'Abs, Core', 
-             'description': 'Isometric core strengthening exercise', 
-             'image': 'https://images.unsplash.com/photo-1571019613454-1cb2f99b2d8b?w=400&h=300&fit=crop'},
-            {'name': 'Lunges', 'category': 'Legs', 'muscle': 'Quadriceps, Glutes', 
-             'description': 'Unilateral leg exercise', 
-             'image': 'https://images.unsplash.com/photo-1549060279-7e168fcee0c2?w=400&h=300&fit=crop'},
-            {'name': 'Shoulder Press', 'category': 'Shoulders', 'muscle': 'Deltoids, Triceps', 
-             'description': 'Overhead pressing movement', 
-             'image': 'https://images.unsplash.com/photo-1571019613454-1cb2f99b2d8b?w=400&h=300&fit=crop'},
-        ]
-        
-        for ex_data in exercises_data:
-            exercise = Exercise(**ex_data)
-            db.session.add(exercise)
-        
-        db.session.commit()
+        try:
+            configure_mappers()
+            if schema.check():
+                catalog.refresh(force=True)
+        except Exception as e:
+            # Never keep a worker from starting; the first request will retry
+            app.logger.warning('Warm-up failed: %s', e)
+        finally:
+            db.session.remove()
 
 # Authentication endpoints
 @app.route('/api/auth/register', methods=['POST'])
@@ -145,7 +203,11 @@ def register():
         user.set_password(data['password'])
         
         db.session.add(user)
+        if shards.SHARD_URLS:
+            db.session.flush()
+            db.session.add(UserShard(user_id=user.id, shard=shards.placement(user.id)))
         db.session.commit()
+        g.user_id = user.id
         
         token = generate_token(user.id)
         
@@ -158,6 +220,9 @@ def register():
                 'email': user.email
             }
         }), 201
+    except passwords.PasswordPoolBusy as e:
+        db.session.rollback()
+        return password_pool_busy(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -181,6 +246,11 @@ def login():
         if not user or not user.check_password(password):
             return jsonify({'error': 'Invalid username or password'}), 401
         
+        # Transparently upgrade hashes made with a different bcrypt cost
+        if user.password_needs_rehash():
+            user.set_password(password)
+            db.session.commit()
+        
         token = generate_token(user.id)
         
         return jsonify({
@@ -192,6 +262,9 @@ def login():
                 'email': user.email
             }
         }), 200
+    except passwords.PasswordPoolBusy as e:
+        db.session.rollback()
+        return password_pool_busy(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -206,34 +279,70 @@ def get_current_user(current_user):
     }), 200
 
 # Exercise endpoints
+SEARCH_ARGS = ('q', 'category', 'muscle', 'limit', 'offset')
+
+def _list_arg(name):
+    """Values of a repeated and/or comma-separated query parameter"""
+    return [value.strip() for arg in request.args.getlist(name) for value in arg.split(',') if value.strip()]
+
+def _int_arg(name, default, minimum):
+    """An integer query parameter of at least minimum; raises ValueError instead of
+    falling back to the default when it is present but is not one"""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        number = None
+    if number is None or number < minimum:
+        raise ValueError(f"{name} must be {'a positive' if minimum > 0 else 'a non-negative'} integer")
+    return number
+
 @app.route('/api/exercises', methods=['GET'])
 def get_exercises():
-    """Get all exercises"""
+    """Get all exercises (served from the catalog cache with a strong ETag)
+
+    Any of these query parameters switches to a search, answered from the
+    worker's in-memory index and returned as
+    {'exercises': [...], 'total': n, 'nextOffset': ..., 'facets': {...}}:
+    - q: name words, each matched exactly, as a prefix or fuzzily
+    - category / muscle: facet filters, repeated or comma-separated
+    - limit / offset: paging over the ranked results
+    """
     try:
-        exercises = Exercise.query.all()
-        return jsonify([{
-            'id': ex.id,
-            'name': ex.name,
-            'category': ex.category,
-            'muscle': ex.muscle,
-            'description': ex.description,
-            'image': ex.image
-        } for ex in exercises])
+        if any(name in request.args for name in SEARCH_ARGS):
+            try:
+                limit = min(_int_arg('limit', search.DEFAULT_LIMIT, 1), search.MAX_LIMIT)
+                offset = _int_arg('offset', 0, 0)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            exercises, total, facets = catalog.search(
+                request.args.get('q', ''), _list_arg('category'), _list_arg('muscle'), limit, offset)
+            response = Response(fastjson.extend({
+                'total': total,
+                'nextOffset': offset + limit if offset + limit < total else None,
+                'facets': facets
+            }, exercises=fastjson.array(exercises)), mimetype='application/json')
+            # Results only change with the catalog
+            response.set_etag(hashlib.sha256(
+                f'{catalog.etag}?{request.query_string.decode()}'.encode('utf-8')).hexdigest()[:32])
+            return response.make_conditional(request)
+
+        catalog.refresh()
+        response = Response(catalog.body, mimetype='application/json')
+        response.set_etag(catalog.etag)
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/exercises/<int:exercise_id>', methods=['GET'])
 def get_exercise(exercise_id):
     """Get a specific exercise"""
-    exercise = Exercise.query.get_or_404(exercise_id)
-    return jsonify({
-        'id': exercise.id,
-        'name': exercise.name,
-        'category': exercise.category,
-        'muscle': exercise.muscle,
-        'description': exercise.description,
-        'image': exercise.image
-    })
+    exercise = catalog.fragment(exercise_id)
+    if exercise is None:
+        abort(404)
+    return Response(exercise, mimetype='application/json')
 
 @app.route('/api/exercises', methods=['POST'])
 def create_exercise():
@@ -254,7 +363,11 @@ def create_exercise():
             image=data.get('image', 'https://images.unsplash.com/photo-1571019613454-1cb2f99b2d8b?w=400&h=300&fit=crop') # Default image URL
         )
         db.session.add(exercise)
+        db.session.flush()
+        sync_muscles([(exercise.id, exercise.muscle)])
+        version = bump_version()
         db.session.commit()
+        catalog.add(serialize_exercise(exercise, search.normalize_muscles(exercise.muscle)), version)
         return jsonify({'id': exercise.id, 'message': 'Exercise created successfully'}), 201
     except Exception as e:
         db.session.rollback()
@@ -262,112 +375,146 @@ def create_exercise():
 
 # Workout endpoints
 @app.route('/api/workouts', methods=['GET'])
-@token_required
+@token_required(load_user=False)
+@versions.conditional
 def get_workouts(current_user):
-    """Get all workouts with their exercises for current user"""
+    """Get all workouts with their exercises for current user
+
+    Optional query parameters:
+    - limit / cursor: keyset pagination, returns {'workouts': [...], 'nextCursor': ...}
+    - stream=json|ndjson: stream the full history as a chunked JSON array or NDJSON
+    """
     try:
-        workouts = Workout.query.filter_by(user_id=current_user.id).order_by(Workout.date.desc()).all()
-        result = []
-        
-        for workout in workouts:
-            workout_exercises = WorkoutExercise.query.filter_by(workout_id=workout.id).all()
-            exercises = []
-            for we in workout_exercises:
-                exercise = Exercise.query.get(we.exercise_id)
-                exercises.append({
-                    'exerciseId': we.exercise_id,
-                    'exerciseName': exercise.name if exercise else 'Unknown',
-                    'exerciseImage': exercise.image if exercise else '💪',
-                    'sets': we.sets,
-                    'reps': we.reps,
-                    'weight': we.weight,
-                    'notes': we.notes
-                })
-            
-            result.append({
-                'id': workout.id,
-                'name': workout.name,
-                'date': workout.date.isoformat(),
-                'duration': workout.duration,
-                'exercises': exercises
+        stream = request.args.get('stream')
+        if stream:
+            if stream not in ('json', 'ndjson'):
+                return jsonify({'error': 'stream must be "json" or "ndjson"'}), 400
+            workouts = iter_workouts(current_user.id)
+            if stream == 'ndjson':
+                body, mimetype = stream_workouts_ndjson(workouts), 'application/x-ndjson'
+            else:
+                body, mimetype = stream_workouts_json(workouts), 'application/json'
+            return Response(stream_with_context(body), mimetype=mimetype)
+
+        if 'limit' in request.args or 'cursor' in request.args:
+            try:
+                limit = min(_int_arg('limit', DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+                workouts, next_cursor = load_workout_page(
+                    current_user.id, limit, request.args.get('cursor'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            return jsonify({
+                'workouts': serialize_workouts(workouts),
+                'nextCursor': next_cursor
             })
-        
-        return jsonify(result)
+
+        workouts = load_workouts(current_user.id)
+        return jsonify(serialize_workouts(workouts))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/workouts/changes', methods=['GET'])
+@token_required(load_user=False)
+@versions.conditional
+def get_workout_changes(current_user):
+    """Workouts written and deleted since a sync token
+
+    Query parameters: since (the nextToken of the previous sync; omit it for a full
+    sync) and limit. Returns {'upserts': [...], 'deletions': [ids], 'nextToken': ...,
+    'hasMore': ...}; while hasMore is true, fetch again with nextToken. Clients apply
+    deletions before upserts. A token the server cannot continue from gets 410 Gone.
+    """
+    try:
+        try:
+            limit = min(_int_arg('limit', sync.DEFAULT_LIMIT, 1), sync.MAX_LIMIT)
+            workouts, deleted, next_token, has_more = sync.load_changes(
+                current_user.id, request.args.get('since'), limit)
+        except sync.StaleToken as e:
+            return jsonify({'error': str(e)}), 410
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({
+            'upserts': serialize_workouts(workouts),
+            'deletions': deleted,
+            'nextToken': next_token,
+            'hasMore': has_more
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/workouts/<int:workout_id>', methods=['GET'])
-@token_required
+@token_required(load_user=False)
+@versions.conditional
 def get_workout(current_user, workout_id):
     """Get a specific workout"""
-    workout = Workout.query.filter_by(id=workout_id, user_id=current_user.id).first_or_404()
-    workout_exercises = WorkoutExercise.query.filter_by(workout_id=workout.id).all()
-    exercises = []
-    
-    for we in workout_exercises:
-        exercise = Exercise.query.get(we.exercise_id)
-        exercises.append({
-            'exerciseId': we.exercise_id,
-            'exerciseName': exercise.name if exercise else 'Unknown',
-            'exerciseImage': exercise.image if exercise else '💪',
-            'sets': we.sets,
-            'reps': we.reps,
-            'weight': we.weight,
-            'notes': we.notes
-        })
-    
-    return jsonify({
-        'id': workout.id,
-        'name': workout.name,
-        'date': workout.date.isoformat(),
-        'duration': workout.duration,
-        'exercises': exercises
-    })
+    workout = load_workout(current_user.id, workout_id)
+    return jsonify(serialize_workout(workout))
 
 @app.route('/api/workouts', methods=['POST'])
-@token_required
+@token_required(load_user=False)
 def create_workout(current_user):
     try:
         data = request.json
-        if not data or 'name' not in data:
+        if not isinstance(data, dict) or 'name' not in data:
             return jsonify({'error': 'Workout name is required'}), 400
         
-        date_str = data.get('date', datetime.utcnow().isoformat())
-        if 'Z' in date_str:
-            date_str = date_str.replace('Z', '+00:00')
         try:
-            workout_date = datetime.fromisoformat(date_str)
-        except ValueError:
-            workout_date = datetime.utcnow()
-        
-        workout = Workout(
-            name=data['name'],
-            date=workout_date,
-            duration=data.get('duration'),
-            user_id=current_user.id
-        )
-        db.session.add(workout)
-        db.session.flush()
-        
-        for ex_data in data.get('exercises', []):
-            workout_exercise = WorkoutExercise(
-                workout_id=workout.id,
-                exercise_id=ex_data['exerciseId'],
-                sets=ex_data['sets'],
-                reps=ex_data['reps'],
-                weight=ex_data.get('weight'),
-                notes=ex_data.get('notes', '')
-            )
-            db.session.add(workout_exercise)
-        
+            workout = workouts.create(current_user.id, data)
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
         db.session.commit()
         return jsonify({'id': workout.id, 'message': 'Workout created successfully'}), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/workouts/import', methods=['POST'])
+@token_required(load_user=False)
+def import_workouts(current_user):
+    """Bulk import workouts from a JSON array, NDJSON or CSV body (or a multipart 'file' upload)"""
+    import importer  # Deferred: only needed by bulk imports
+    try:
+        if request.mimetype == 'multipart/form-data':
+            upload = request.files.get('file')
+            if not upload:
+                return jsonify({'error': 'No file provided'}), 400
+            mimetype = upload.mimetype
+            if upload.filename.endswith('.csv'):
+                mimetype = 'text/csv'
+            elif upload.filename.endswith(('.ndjson', '.jsonl')):
+                mimetype = 'application/x-ndjson'
+            elif upload.filename.endswith('.json'):
+                mimetype = 'application/json'
+            records = importer.iter_records(mimetype, upload.stream)
+        else:
+            records = importer.iter_records(request.mimetype, request.stream)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 415
+    
+    try:
+        return jsonify(importer.import_workouts(current_user.id, records))
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/workouts/export', methods=['GET'])
+@token_required(load_user=False)
+def export_workouts(current_user):
+    """Stream the full workout history of current user as NDJSON or CSV"""
+    import exporter  # Deferred: only needed by exports
+    format = request.args.get('format', 'ndjson')
+    if format not in exporter.FORMATS:
+        return jsonify({'error': 'format must be "ndjson" or "csv"'}), 400
+    
+    rows = exporter.iter_rows(exporter.export_query(user_id=current_user.id))
+    response = Response(stream_with_context(exporter.export_lines(rows, format)),
+                        mimetype=exporter.FORMATS[format])
+    response.headers['Content-Disposition'] = f'attachment; filename=workouts.{format}'
+    return response
+
 @app.route('/api/workouts/<int:workout_id>', methods=['PUT'])
-@token_required
+@token_required(load_user=False)
 def update_workout(current_user, workout_id):
     """Update a workout"""
     try:
@@ -375,69 +522,218 @@ def update_workout(current_user, workout_id):
         data = request.json
         if not data:
             return jsonify({'error': 'No data provided'}), 400
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Body must be a JSON object'}), 400
         
-        workout.name = data.get('name', workout.name)
-        if 'date' in data:
-            date_str = data['date']
-            if 'Z' in date_str:
-                date_str = date_str.replace('Z', '+00:00')
-            try:
-                workout.date = datetime.fromisoformat(date_str)
-            except ValueError:
-                pass  # Keep existing date if parsing fails
-        workout.duration = data.get('duration', workout.duration)
-        
-        # Update exercises if provided
-        if 'exercises' in data:
-            # Delete existing workout exercises
-            WorkoutExercise.query.filter_by(workout_id=workout.id).delete()
-            
-            # Add new exercises
-            for ex_data in data['exercises']:
-                workout_exercise = WorkoutExercise(
-                    workout_id=workout.id,
-                    exercise_id=ex_data['exerciseId'],
-                    sets=ex_data['sets'],
-                    reps=ex_data['reps'],
-                    weight=ex_data.get('weight'),
-                    notes=ex_data.get('notes', '')
-                )
-                db.session.add(workout_exercise)
-        
+        # Exercises, if provided, are updated touching only the rows that changed
+        try:
+            workouts.update(workout, data)
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+        except KeyError as e:
+            db.session.rollback()
+            return jsonify({'error': f'Exercise entry {e.args[0]} not found in this workout'}), 400
         db.session.commit()
         return jsonify({'message': 'Workout updated successfully'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/workouts/<int:workout_id>', methods=['PATCH'])
+@token_required(load_user=False)
+def patch_workout(current_user, workout_id):
+    """Partially update a workout
+
+    Accepts any of name/date/duration plus an optional 'exercises' object with
+    'update' (entries with an id and the fields to change), 'add' and 'remove' (ids).
+    """
+    workout = Workout.query.filter_by(id=workout_id, user_id=current_user.id).first_or_404()
+    try:
+        data = request.json
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Body must be a JSON object'}), 400
+        
+        try:
+            workouts.patch(workout, data)
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+        except KeyError as e:
+            db.session.rollback()
+            return jsonify({'error': f'Exercise entry {e.args[0]} not found in this workout'}), 400
+        db.session.commit()
+        return jsonify(serialize_workout(workout))
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/workouts/<int:workout_id>', methods=['DELETE'])
-@token_required
+@token_required(load_user=False)
 def delete_workout(current_user, workout_id):
     """Delete a workout"""
     try:
         workout = Workout.query.filter_by(id=workout_id, user_id=current_user.id).first_or_404()
-        
-        # Delete associated workout exercises
-        WorkoutExercise.query.filter_by(workout_id=workout.id).delete()
-        
-        # Delete workout
-        db.session.delete(workout)
+        workouts.delete(workout)
         db.session.commit()
         return jsonify({'message': 'Workout deleted successfully'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/batch', methods=['POST'])
+@token_required(load_user=False)
+def run_batch(current_user):
+    """Run several workout operations in order with one token check and one commit
+
+    Body: {'mode': 'transaction' (default, all or nothing) or 'savepoint' (each
+    operation applied or rolled back on its own), 'operations': [{'op': 'create',
+    'update', 'patch' or 'delete', 'workoutId': id, or "$N" for the workout created
+    by operation N, 'data': the body of the single-workout route, 'idempotencyKey':
+    optional client-generated key}]}. Returns {'committed': ..., 'results': [...]}
+    with one {'status', 'body' or 'error'} per operation, marked 'replayed' when it
+    comes from an earlier request with the same idempotency key.
+    """
+    try:
+        try:
+            mode, operations = batch.parse(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        committed, results = batch.run(current_user.id, mode, operations)
+        if committed:
+            db.session.commit()
+        return jsonify({'mode': mode, 'committed': committed, 'results': results})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+# Statistics endpoints
+@app.route('/api/stats', methods=['GET'])
+@token_required(load_user=False)
+@versions.conditional(period=progression.utc_today)  # thisWeekWorkouts covers the last 7 days
+def get_stats(current_user):
+    """Get dashboard statistics for current user from the rollups and running totals"""
+    try:
+        days = min(_int_arg('days', stats.DEFAULT_DAYS, 1), stats.MAX_DAYS)
+        return jsonify(stats.get_stats(current_user.id, days))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Progression endpoints
+@app.route('/api/records', methods=['GET'])
+@token_required(load_user=False)
+@versions.conditional(period=progression.current_week)  # Series end at the current week
+def get_records(current_user):
+    """Get personal records of current user, optionally for one exercise (?exerciseId=)"""
+    try:
+        exercise_id = _int_arg('exerciseId', None, 1)
+        return jsonify(progression.get_records(current_user.id, exercise_id))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/exercises/<int:exercise_id>/progress', methods=['GET'])
+@token_required(load_user=False)
+@versions.conditional(period=progression.current_week)  # Series end at the current week
+def get_exercise_progress(current_user, exercise_id):
+    """Get records and weekly volume series of current user for one exercise"""
+    if catalog.get(exercise_id) is None:
+        return jsonify({'error': 'Exercise not found'}), 404
+    try:
+        try:
+            weeks = min(_int_arg('weeks', progression.DEFAULT_WEEKS, 1), progression.MAX_WEEKS)
+            window = min(_int_arg('window', progression.DEFAULT_WINDOW, 1), progression.MAX_WINDOW)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        series = progression.get_series(current_user.id, exercise_id, weeks, window)
+        records = progression.get_records(current_user.id, exercise_id)
+        series['records'] = records[0] if records else {'exerciseId': exercise_id}
+        return jsonify(series)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Leaderboard endpoints
+def _leaderboard_exercise(leaderboards, metric):
+    """Validated ?exerciseId= of a leaderboard request; returns (exercise id, error response)"""
+    if metric not in leaderboards.METRICS:
+        return None, (jsonify({'error': f"Unknown leaderboard, use one of: {', '.join(leaderboards.METRICS)}"}), 404)
+    try:
+        exercise_id = _int_arg('exerciseId', None, 1)
+    except ValueError as e:
+        return None, (jsonify({'error': str(e)}), 400)
+    if exercise_id is None:
+        if metric != leaderboards.WEEKLY_VOLUME:
+            return None, (jsonify({'error': 'exerciseId is required'}), 400)
+        return leaderboards.ALL_EXERCISES, None
+    if catalog.get(exercise_id) is None:
+        return None, (jsonify({'error': 'Exercise not found'}), 404)
+    return exercise_id, None
+
+@app.route('/api/leaderboards/<metric>', methods=['GET'])
+@token_required(load_user=False)
+def get_leaderboard(current_user, metric):
+    """Get the top users of a metric (estimated1RM, maxWeight, bestVolume, weeklyVolume) for one exercise
+
+    weeklyVolume ranks the current week, without ?exerciseId= by the total of all exercises.
+    Served from a snapshot refreshed every LEADERBOARD_REFRESH_INTERVAL seconds.
+    """
+    import leaderboards  # Deferred: only leaderboards need NumPy
+    exercise_id, error = _leaderboard_exercise(leaderboards, metric)
+    if error:
+        return error
+    try:
+        limit = min(_int_arg('limit', leaderboards.DEFAULT_LIMIT, 1), leaderboards.MAX_LIMIT)
+        return jsonify(leaderboards.get_leaderboard(metric, exercise_id, limit))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/leaderboards/<metric>/me', methods=['GET'])
+@token_required(load_user=False)
+def get_leaderboard_rank(current_user, metric):
+    """Get the current user's value of a metric with its rank and percentile among all users"""
+    import leaderboards  # Deferred: only leaderboards need NumPy
+    exercise_id, error = _leaderboard_exercise(leaderboards, metric)
+    if error:
+        return error
+    try:
+        return jsonify(leaderboards.get_rank(current_user.id, metric, exercise_id))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Health check
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'message': 'Fitness Tracker API is running'})
+    health = {'status': 'healthy', 'message': 'Fitness Tracker API is running'}
+    if replicas.replica_set.keys:
+        health['replicas'] = replicas.replica_set.status()
+    return jsonify(health)
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Request, SQL and bcrypt metrics of all workers in Prometheus text format"""
+    metrics_token = os.getenv('METRICS_TOKEN')
+    if metrics_token and request.headers.get('Authorization') != f'Bearer {metrics_token}':
+        return jsonify({'error': 'Invalid metrics token'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/health/passwords', methods=['GET'])
+def password_pool_health():
+    """Password hashing pool queue depth and latency percentiles"""
+    return jsonify(passwords.stats())
 
 if __name__ == '__main__':
     # Only initialize database if not in production (handled by gunicorn)
     if os.environ.get('FLASK_ENV') != 'production':
         init_database()
+    warm_up()
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') != 'production'
     app.run(debug=debug, host='0.0.0.0', port=port)
@@ -0,0 +1,79 @@
+"""
+Bounded TTL caches used by token_required
+Verified tokens and user records are kept for a short time so protected
+requests can skip jwt.decode and the users lookup
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+ENABLED = os.getenv('AUTH_CACHE_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+TTL = float(os.getenv('AUTH_CACHE_TTL', '60'))
+MAX_SIZE = int(os.getenv('AUTH_CACHE_SIZE', '10000'))
+
+# Detached snapshot of the User fields handlers read
+CachedUser = namedtuple('CachedUser', ['id', 'username', 'email'])
+
+# Passed to handlers that only need the id (token_required(load_user=False))
+UserRef = namedtuple('UserRef', ['id'])
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a time-to-live"""
+
+    def __init__(self, max_size=MAX_SIZE, ttl=TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value or None if missing or expired"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store a value, evicting the least recently used entry when full"""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        """Remove a single entry"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+# token -> (user_id, exp timestamp)
+tokens = TTLCache()
+# user_id -> CachedUser
+users = TTLCache()
+
+def invalidate_token(token):
+    """Drop a single verified token, e.g. on logout"""
+    tokens.pop(token)
+
+def clear():
+    """Drop everything cached by token_required"""
+    tokens.clear()
+    users.clear()
@@ -0,0 +1,164 @@
+"""
+Batched workout operations
+POST /api/batch runs an ordered list of create/update/patch/delete operations
+for one user with one token check and one commit, so a client replaying a queue
+of offline edits pays for one request instead of one per edit. In 'transaction'
+mode the batch is all or nothing; in 'savepoint' mode each operation runs in its
+own SAVEPOINT and a failing one is rolled back alone.
+
+An operation may carry a client-generated idempotency key. The result of a
+successful keyed operation is stored in the same transaction as its changes, so
+a batch retried after a lost response replays the stored result instead of
+creating the workout twice. Keys expire after IDEMPOTENCY_KEY_TTL hours.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import delete
+from models import db, Workout, IdempotencyKey
+from serializers import serialize_workout
+import fastjson
+import workouts
+
+MAX_OPERATIONS = int(os.getenv('BATCH_MAX_OPERATIONS', '100'))
+KEY_TTL = timedelta(hours=float(os.getenv('IDEMPOTENCY_KEY_TTL', '24')))
+MAX_KEY_LENGTH = 100
+
+MODES = ('transaction', 'savepoint')
+OPERATIONS = ('create', 'update', 'patch', 'delete')
+
+class OperationError(Exception):
+    """An operation the client has to fix; its result gets this status and message"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def parse(body):
+    """Validate a batch request body; returns (mode, operations) or raises ValueError"""
+    if not isinstance(body, dict):
+        raise ValueError('No data provided')
+    mode = body.get('mode', 'transaction')
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of: {', '.join(MODES)}")
+    operations = body.get('operations')
+    if not isinstance(operations, list) or not operations:
+        raise ValueError('operations must be a non-empty list')
+    if len(operations) > MAX_OPERATIONS:
+        raise ValueError(f'A batch can hold at most {MAX_OPERATIONS} operations')
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            raise ValueError(f"Operation {index}: op must be one of: {', '.join(OPERATIONS)}")
+        key = operation.get('idempotencyKey')
+        if key is not None and (not isinstance(key, str) or not 0 < len(key) <= MAX_KEY_LENGTH):
+            raise ValueError(f'Operation {index}: idempotencyKey must be a string of 1-{MAX_KEY_LENGTH} characters')
+    return mode, operations
+
+def fingerprint(operation):
+    """Hash of what an operation does, to refuse a key reused for another one"""
+    canonical = json.dumps({name: operation.get(name) for name in ('op', 'workoutId', 'data')},
+                           sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def _workout_id(operation, results):
+    """Workout id of an operation; "$N" names the workout created by operation N of the batch"""
+    workout_id = operation.get('workoutId')
+    if isinstance(workout_id, str) and workout_id.startswith('$') and workout_id[1:].isdigit():
+        index = int(workout_id[1:])
+        if index >= len(results) or 'id' not in (results[index].get('body') or {}):
+            raise OperationError(400, f'workoutId {workout_id} does not name an earlier create operation')
+        return results[index]['body']['id']
+    if not isinstance(workout_id, int) or isinstance(workout_id, bool):
+        raise OperationError(400, 'workoutId is required')
+    return workout_id
+
+def apply(user_id, operation, results):
+    """Run one operation against the session; returns (status, response body)"""
+    data = operation.get('data') or {}
+    if not isinstance(data, dict):
+        raise OperationError(400, 'data must be an object')
+    if operation['op'] == 'create':
+        if 'name' not in data:
+            raise OperationError(400, 'Workout name is required')
+        try:
+            workout = workouts.create(user_id, data)
+        except ValueError as e:
+            raise OperationError(400, str(e))
+        return 201, {'id': workout.id, 'message': 'Workout created successfully'}
+
+    workout = Workout.query.filter_by(id=_workout_id(operation, results), user_id=user_id).first()
+    if workout is None:
+        raise OperationError(404, 'Workout not found')
+    if operation['op'] == 'delete':
+        workouts.delete(workout)
+        return 200, {'message': 'Workout deleted successfully'}
+    if not data:
+        raise OperationError(400, 'No data provided')
+    try:
+        if operation['op'] == 'update':
+            workouts.update(workout, data)
+            return 200, {'message': 'Workout updated successfully'}
+        workouts.patch(workout, data)
+    except ValueError as e:
+        raise OperationError(400, str(e))
+    except KeyError as e:
+        raise OperationError(400, f'Exercise entry {e.args[0]} not found in this workout')
+    return 200, serialize_workout(workout)
+
+def _stored_keys(user_id, operations):
+    """Unexpired stored results of the batch's idempotency keys, by key; drops the user's expired ones"""
+    keys = {operation['idempotencyKey'] for operation in operations if operation.get('idempotencyKey')}
+    if not keys:
+        return {}
+    table = IdempotencyKey.__table__
+    db.session.execute(delete(table).where(
+        table.c.user_id == user_id, table.c.created_at < datetime.utcnow() - KEY_TTL))
+    return {row.key: row for row in IdempotencyKey.query.filter(
+        IdempotencyKey.user_id == user_id, IdempotencyKey.key.in_(keys))}
+
+def run(user_id, mode, operations):
+    """Run a parsed batch in order; returns (committed, results), the caller commits
+
+    Each result has the HTTP status the single-workout route would have answered
+    with and its body, or an error; replayed results are marked. In transaction
+    mode the first failure rolls back the whole batch and every other operation
+    gets 424 Failed Dependency.
+    """
+    stored = _stored_keys(user_id, operations)
+    results = []
+    for index, operation in enumerate(operations):
+        key = operation.get('idempotencyKey')
+        operation_fingerprint = fingerprint(operation) if key else None
+        if key in stored:
+            if stored[key].fingerprint != operation_fingerprint:
+                result = {'status': 422, 'error': 'Idempotency key was already used for a different operation'}
+            else:
+                result = {'status': stored[key].status, 'body': fastjson.loads(stored[key].response),
+                          'replayed': True}
+        else:
+            savepoint = db.session.begin_nested() if mode == 'savepoint' else None
+            try:
+                status, body = apply(user_id, operation, results)
+                record = None
+                if key:
+                    record = IdempotencyKey(user_id=user_id, key=key, fingerprint=operation_fingerprint,
+                                            status=status, response=fastjson.dumps(body).decode('utf-8'))
+                    db.session.add(record)
+                db.session.flush()
+                if savepoint is not None:
+                    savepoint.commit()
+                if record is not None:
+                    stored[key] = record  # A repeated key later in the batch replays this result
+                result = {'status': status, 'body': body}
+            except Exception as e:
+                if savepoint is not None:
+                    savepoint.rollback()
+                result = {'status': e.status if isinstance(e, OperationError) else 500, 'error': str(e)}
+        results.append(result)
+
+        if mode == 'transaction' and 'error' in result:
+            db.session.rollback()
+            skipped = {'status': 424, 'error': f'Not applied: operation {index} failed'}
+            return False, [result if position == index else dict(skipped) for position in range(len(operations))]
+    return True, results
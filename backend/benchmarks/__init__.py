@@ -0,0 +1,4 @@
+"""
+Benchmark scripts for the Flask API
+Run them from the backend directory, e.g. `python -m benchmarks.auth`
+"""
@@ -0,0 +1,43 @@
+"""
+Compare requests/sec on protected endpoints with the token_required cache on and off
+Usage: python -m benchmarks.auth [--requests 2000]
+"""
+import argparse
+import json
+import time
+from benchmarks.common import setup_app, register
+
+ENDPOINTS = ['/api/auth/me', '/api/stats']
+
+def run(client, headers, path, requests):
+    """Issue the same GET repeatedly and return requests/sec"""
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return requests / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--database-url', help='Defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    app = setup_app(args.database_url)
+    import auth_cache
+    client = app.test_client()
+    headers = register(client, f'bench-{time.time_ns()}')
+
+    results = {}
+    for enabled in (False, True):
+        auth_cache.ENABLED = enabled
+        auth_cache.clear()
+        mode = 'cache_on' if enabled else 'cache_off'
+        results[mode] = {path: round(run(client, headers, path, args.requests), 1) for path in ENDPOINTS}
+    results['speedup'] = {
+        path: round(results['cache_on'][path] / results['cache_off'][path], 2) for path in ENDPOINTS
+    }
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+"""
+Shared setup for benchmarks: a throwaway SQLite database and the Flask test client
+"""
+import os
+import tempfile
+
+def scratch_database_url():
+    """URL of a new SQLite file in a temporary directory"""
+    return 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='fitness-bench-'), 'bench.db')
+
+def setup_app(database_url=None):
+    """Import the app against a scratch database (never the one from .env) and migrate it"""
+    os.environ['DATABASE_URL'] = database_url or scratch_database_url()
+
+    import app as app_module
+    import schema
+    with app_module.app.app_context():
+        schema.migrate()
+    return app_module.app
+
+def register(client, username, password='benchmark-password'):
+    """Register a user and return the Authorization header for it"""
+    response = client.post('/api/auth/register', json={'username': username, 'password': password})
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
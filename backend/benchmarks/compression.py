@@ -0,0 +1,61 @@
+"""
+Compression level benchmark for a large workout history
+Encodes one user's history (1,000 workouts by default) the way GET /api/workouts
+sends it and compresses it with every gzip level and brotli quality. Reports the
+compressed size, ratio and median milliseconds per payload as JSON, to choose
+COMPRESS_GZIP_LEVEL and COMPRESS_BROTLI_QUALITY.
+
+Usage: python -m benchmarks.compression [--workouts 1000] [--repeat 10]
+"""
+import argparse
+import json
+import statistics
+import time
+from benchmarks.common import scratch_database_url, setup_app
+from benchmarks.serialization import load_history
+
+GZIP_LEVELS = range(1, 10)
+BROTLI_QUALITIES = range(0, 10)  # 10 and 11 take seconds per payload; for static assets only
+
+def _measure(factory, body, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        compress, finish = factory()
+        data = compress(body) + finish()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {'bytes': len(data), 'ratio': round(len(body) / len(data), 2),
+            'ms': round(statistics.median(timings), 3)}
+
+def run(body, repeat):
+    """Size and time per encoder setting; returns the report dict"""
+    import compression
+
+    report = {'bytes': len(body), 'repeat': repeat, 'defaults': {
+        'gzip': compression.GZIP_LEVEL, 'br': compression.BROTLI_QUALITY}, 'gzip': {}}
+    for level in GZIP_LEVELS:
+        report['gzip'][level] = _measure(lambda: compression.gzip_compressor(level), body, repeat)
+    if compression.brotli is not None:
+        report['br'] = {}
+        for quality in BROTLI_QUALITIES:
+            report['br'][quality] = _measure(lambda: compression.brotli_compressor(quality), body, repeat)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare compression levels on a large workout history')
+    parser.add_argument('--workouts', type=int, default=1000, help='Workouts in the payload')
+    parser.add_argument('--exercises', type=int, default=200, help='Catalog size')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    app = setup_app(scratch_database_url())
+    import fastjson
+    from serializers import serialize_workouts
+    with app.app_context():
+        body = fastjson.dumps(serialize_workouts(load_history(args.workouts, args.exercises, args.seed)))
+    print(json.dumps(run(body, args.repeat), indent=2))
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,145 @@
+"""
+Seeded synthetic dataset for benchmarks
+Builds users, a catalog larger than the default 8 exercises and realistic workout
+histories, then rebuilds the statistics rollups and progression tables. The same seed always produces
+the same data.
+Usage: python -m benchmarks.generate --database-url sqlite:///bench.db --users 200
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+PASSWORD = 'benchmark-password'
+CATEGORIES = {
+    'Chest': ['Chest', 'Triceps', 'Shoulders'],
+    'Back': ['Lats', 'Biceps', 'Back', 'Traps'],
+    'Legs': ['Quadriceps', 'Glutes', 'Hamstrings', 'Calves'],
+    'Shoulders': ['Deltoids', 'Triceps', 'Traps'],
+    'Arms': ['Biceps', 'Triceps', 'Forearms'],
+    'Core': ['Abs', 'Core', 'Obliques'],
+}
+MOVEMENTS = ['Press', 'Row', 'Curl', 'Extension', 'Raise', 'Squat', 'Lunge', 'Pulldown', 'Fly', 'Hold']
+VARIANTS = ['Barbell', 'Dumbbell', 'Cable', 'Machine', 'Kettlebell', 'Band', 'Bodyweight', 'Smith']
+IMAGE = 'https://images.unsplash.com/photo-1571019613454-1cb2f99b2d8b?w=400&h=300&fit=crop'
+BATCH_SIZE = 5000
+
+def username(index):
+    return f'bench-user-{index}'
+
+def _batches(rows, size=BATCH_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def generate(users=100, workouts_per_user=150, exercises=200, seed=42, days=730):
+    """Fill the current app's database with synthetic data; returns a summary dict"""
+    from sqlalchemy import insert
+    from models import db, User, Exercise, Workout, WorkoutExercise, UserDataVersion
+    from catalog import bump_version, sync_muscles
+    import passwords
+    import stats
+    import progression
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+
+    # Catalog
+    catalog_rows = []
+    for i in range(exercises):
+        category = rng.choice(list(CATEGORIES))
+        catalog_rows.append({
+            'name': f'{rng.choice(VARIANTS)} {category} {rng.choice(MOVEMENTS)} {i}',
+            'category': category,
+            'muscle': ', '.join(rng.sample(CATEGORIES[category], 2)),
+            'description': f'Synthetic benchmark exercise {i}',
+            'image': IMAGE,
+            'created_at': datetime.utcnow()
+        })
+    db.session.execute(insert(Exercise.__table__), catalog_rows)
+    sync_muscles(db.session.query(Exercise.id, Exercise.muscle))
+    bump_version()
+    exercise_ids = [row.id for row in db.session.query(Exercise.id)]
+
+    # Users all share one password so hashing happens once
+    password_hash = passwords.hash_password(PASSWORD)
+    first_user = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    user_rows = [{
+        'username': username(first_user + i),
+        'email': f'{username(first_user + i)}@bench.local',
+        'password_hash': password_hash,
+        'created_at': datetime.utcnow()
+    } for i in range(users)]
+    result = db.session.execute(
+        insert(User.__table__).returning(User.__table__.c.id, sort_by_parameter_order=True), user_rows)
+    user_ids = result.scalars().all()
+
+    # Workout histories: a few favourite exercises per user, progressive weights
+    # Anchored at midnight so the same seed gives the same dates all day
+    now = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    workout_count = exercise_count = 0
+    for user_id in user_ids:
+        favourites = rng.sample(exercise_ids, min(len(exercise_ids), 12))
+        count = max(1, int(rng.gauss(workouts_per_user, workouts_per_user / 3)))
+        workout_rows, entries = [], []
+        for _ in range(count):
+            workout_rows.append({
+                'name': rng.choice(['Push Day', 'Pull Day', 'Leg Day', 'Full Body', 'Upper', 'Lower']),
+                'date': now - timedelta(days=rng.randrange(days), minutes=rng.randrange(24 * 60)),
+                'duration': rng.choice([None, 30, 45, 60, 75, 90]),
+                'user_id': user_id,
+                'created_at': now
+            })
+            entries.append([{
+                'exercise_id': rng.choice(favourites),
+                'sets': rng.randint(2, 5),
+                'reps': rng.randint(3, 15),
+                'weight': rng.choice([None, round(rng.uniform(5, 140) / 2.5) * 2.5]),
+                'notes': '',
+                'created_at': now
+            } for _ in range(rng.randint(3, 8))])
+        workouts_table = Workout.__table__
+        for offset, batch in enumerate(_batches(workout_rows)):
+            ids = db.session.execute(
+                insert(workouts_table).returning(workouts_table.c.id, sort_by_parameter_order=True), batch
+            ).scalars().all()
+            rows = [dict(entry, workout_id=workout_id)
+                    for workout_id, workout_entries in zip(ids, entries[offset * BATCH_SIZE:])
+                    for entry in workout_entries]
+            for exercise_batch in _batches(rows):
+                db.session.execute(insert(WorkoutExercise.__table__), exercise_batch)
+            exercise_count += len(rows)
+        workout_count += count
+        db.session.execute(insert(UserDataVersion.__table__),
+                           [{'user_id': user_id, 'version': 1, 'updated_at': now}])
+
+    stats.rebuild_rollups()
+    progression.rebuild_progress()
+    db.session.commit()
+    return {
+        'seed': seed,
+        'users': len(user_ids),
+        'userIds': [user_ids[0], user_ids[-1]] if user_ids else [],
+        'exercises': len(exercise_ids),
+        'workouts': workout_count,
+        'workoutExercises': exercise_count,
+        'seconds': round(time.perf_counter() - started, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic benchmark dataset')
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--workouts-per-user', type=int, default=150)
+    parser.add_argument('--exercises', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    from benchmarks.common import setup_app
+    app = setup_app(args.database_url)
+    with app.app_context():
+        summary = generate(args.users, args.workouts_per_user, args.exercises, args.seed)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Leaderboard snapshot benchmark at a million users
+Generates per-user-per-exercise metrics directly as arrays (1,000,000 users
+logging 4 exercises each by default, popular exercises more often), builds a
+leaderboards.Snapshot from them, publishes it to a temporary directory and times
+rank/percentile and top-10 lookups against the in-memory and the memory-mapped
+copy. Lookups are timed one call at a time and reported as median and p99
+microseconds; building, publishing and mapping in seconds, as JSON.
+Before timing, a small dataset is checked against a brute-force ranking; exits
+non-zero when they disagree.
+
+Usage: python -m benchmarks.leaderboards [--users 1000000] [--exercises-per-user 4] [--queries 20000]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+import leaderboards
+
+def generate(users, exercises, per_user, seed):
+    """{metric: (exercise_ids, user_ids, values)} with one row per user and logged exercise"""
+    rng = np.random.default_rng(seed)
+    popularity = 1 / np.arange(1, exercises + 1)
+    user_ids = np.repeat(np.arange(1, users + 1), per_user)
+    exercise_ids = rng.choice(np.arange(1, exercises + 1), size=len(user_ids), p=popularity / popularity.sum())
+    # A user logging an exercise twice has one row for it
+    pairs = np.unique(user_ids.astype(np.int64) * (exercises + 1) + exercise_ids)
+    user_ids, exercise_ids = pairs // (exercises + 1), pairs % (exercises + 1)
+    scale = rng.uniform(20, 150, exercises + 1)[exercise_ids]
+    # Loads in 0.5 kg steps, so equal values (shared ranks) are common
+    max_weight = np.round(scale * rng.lognormal(0, 0.35, len(pairs)) * 2) / 2
+    rows = {
+        'maxWeight': (exercise_ids, user_ids, max_weight),
+        'estimated1RM': (exercise_ids, user_ids, max_weight * rng.uniform(1.0, 1.4, len(pairs))),
+        'bestVolume': (exercise_ids, user_ids, max_weight * rng.integers(5, 60, len(pairs))),
+    }
+    volume = max_weight * rng.integers(0, 120, len(pairs))
+    totals = np.bincount(user_ids, weights=volume, minlength=users + 1)[1:]
+    rows['weeklyVolume'] = (np.concatenate((exercise_ids, np.full(users, leaderboards.ALL_EXERCISES))),
+                            np.concatenate((user_ids, np.arange(1, users + 1))),
+                            np.concatenate((volume, totals)))
+    return rows
+
+def verify(rows, snapshot):
+    """Compare every exercise's ranks and top 10 with a brute-force ranking; returns the mismatches"""
+    mismatches = []
+    for metric, (exercise_ids, user_ids, values) in rows.items():
+        for exercise_id in np.unique(exercise_ids):
+            kept = (exercise_ids == exercise_id) & (values > 0)
+            board, board_users = values[kept], user_ids[kept]
+            for value in list(board[:50]) + [board.max() + 1, board.min() / 2]:
+                below, equal = int((board < value).sum()), int((board == value).sum())
+                expected = {'rank': int((board > value).sum()) + 1,
+                            'percentile': round(100 * (below + equal / 2) / len(board), 1), 'total': len(board)}
+                if snapshot.rank(metric, exercise_id, value) != expected:
+                    mismatches.append((metric, int(exercise_id), float(value)))
+            order = sorted(range(len(board)), key=lambda i: (-board[i], board_users[i]))[:10]
+            expected = [(int((board > board[i]).sum()) + 1, int(board_users[i]), float(board[i])) for i in order]
+            if snapshot.top(metric, exercise_id, 10) != (expected, len(board)):
+                mismatches.append((metric, int(exercise_id), 'top'))
+    return mismatches
+
+def _time_calls(function, arguments):
+    """Median and p99 microseconds of one call per argument tuple"""
+    timings = np.empty(len(arguments))
+    for index, args in enumerate(arguments):
+        started = time.perf_counter_ns()
+        function(*args)
+        timings[index] = time.perf_counter_ns() - started
+    return {'median_us': round(float(np.median(timings)) / 1000, 2),
+            'p99_us': round(float(np.percentile(timings, 99)) / 1000, 2)}
+
+def run(users, exercises, per_user, queries, seed):
+    """Build, publish and query a snapshot; returns the report dict"""
+    report = {'users': users, 'exercises': exercises}
+    started = time.perf_counter()
+    rows = generate(users, exercises, per_user, seed)
+    report['generate_s'] = round(time.perf_counter() - started, 2)
+
+    started = time.perf_counter()
+    snapshot = leaderboards.Snapshot.from_rows(rows)
+    report['build_s'] = round(time.perf_counter() - started, 2)
+    report['rows'] = {metric: len(columns[0]) for metric, columns in snapshot.columns.items()}
+    report['bytes'] = sum(column.nbytes for columns in snapshot.columns.values() for column in columns)
+
+    directory = tempfile.mkdtemp(prefix='fitness-leaderboards-')
+    try:
+        started = time.perf_counter()
+        name = leaderboards.publish(snapshot, directory)
+        report['publish_s'] = round(time.perf_counter() - started, 2)
+        started = time.perf_counter()
+        mapped = leaderboards.load(os.path.join(directory, name))
+        report['map_s'] = round(time.perf_counter() - started, 4)
+
+        # Real values of random users, so lookups land inside busy and quiet leaderboards alike
+        rng = np.random.default_rng(seed + 1)
+        samples = {}
+        for metric, (exercise_ids, user_ids, values) in rows.items():
+            picked = rng.integers(0, len(values), queries)
+            samples[metric] = [(metric, int(exercise_ids[i]), float(values[i])) for i in picked]
+        for label, copy in (('memory', snapshot), ('mmap', mapped)):
+            report[label] = {}
+            for metric, arguments in samples.items():
+                report[label][metric] = {
+                    'rank': _time_calls(copy.rank, arguments),
+                    'top10': _time_calls(copy.top, [(metric, exercise_id, 10) for metric, exercise_id, _ in arguments]),
+                }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Time leaderboard percentile and top-K lookups at scale')
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--exercises', type=int, default=200, help='Catalog size')
+    parser.add_argument('--exercises-per-user', type=int, default=4)
+    parser.add_argument('--queries', type=int, default=20_000, help='Timed lookups per metric and kind')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    small = generate(2000, 20, args.exercises_per_user, args.seed)
+    mismatches = verify(small, leaderboards.Snapshot.from_rows(small))
+    print(f"{'✗' if mismatches else '✓'} {len(mismatches)} mismatches against a brute-force ranking", file=sys.stderr)
+    if mismatches:
+        print(mismatches[:10], file=sys.stderr)
+        return 1
+    print(json.dumps(run(args.users, args.exercises, args.exercises_per_user, args.queries, args.seed), indent=2))
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
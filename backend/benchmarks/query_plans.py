@@ -0,0 +1,214 @@
+"""
+Query plan regression check for the API's hot paths
+Calls every endpoint once against a generated dataset, captures the SQL it runs
+and EXPLAINs each statement. Exits non-zero when a statement reads a whole table
+or sorts rows, unless ALLOWED says why that is fine for that table, on every
+endpoint or on the one it names.
+On PostgreSQL sequential scans and sorts are disabled in the planner while
+explaining, so anything left over has no usable index regardless of table size.
+Usage: python -m benchmarks.query_plans [--database-url postgresql://...] [--verbose]
+"""
+import argparse
+import json
+import re
+import sys
+from sqlalchemy import event
+from benchmarks.common import scratch_database_url, setup_app
+from benchmarks import generate as dataset
+
+# (kind, table), or (endpoint name, kind, table) for that endpoint only -> why a full scan
+# or sort there is acceptable
+ALLOWED = {
+    ('scan', 'exercises'): 'The catalog cache loads every exercise on purpose',
+    ('scan', 'exercise_muscles'): 'The catalog cache loads every exercise on purpose',
+    # SQLite and PostgreSQL 17+ read IN lists in index order; older PostgreSQL sorts one page of entries
+    ('sort', 'workout_exercises'): 'selectinload orders the entries of one page of workouts',
+    ('sort', 'exercise_usage_stats'): "Top exercises are ranked among one user's exercises",
+    ('leaderboard', 'scan', 'personal_records'): "Leaderboard snapshots read every user's records on purpose",
+}
+
+# (name, method, path, body); {workout_id}, {new_id}, {cursor} and {sync_token} are filled in while running
+ENDPOINTS = [
+    ('login', 'POST', '/api/auth/login', {'username': '{username}', 'password': dataset.PASSWORD}),
+    ('current user', 'GET', '/api/auth/me', None),
+    ('exercises', 'GET', '/api/exercises', None),
+    ('exercise search', 'GET', '/api/exercises?q=press&muscle=chest&limit=20', None),
+    ('workouts', 'GET', '/api/workouts', None),
+    ('workouts page', 'GET', '/api/workouts?limit=20', None),
+    ('workouts next page', 'GET', '/api/workouts?limit=20&cursor={cursor}', None),
+    ('workouts stream', 'GET', '/api/workouts?stream=ndjson', None),
+    ('workout changes', 'GET', '/api/workouts/changes?limit=20', None),
+    ('workout changes next page', 'GET', '/api/workouts/changes?limit=20&since={sync_token}', None),
+    ('workout', 'GET', '/api/workouts/{workout_id}', None),
+    ('stats', 'GET', '/api/stats', None),
+    ('records', 'GET', '/api/records', None),
+    ('exercise progress', 'GET', '/api/exercises/{exercise_id}/progress', None),
+    ('leaderboard', 'GET', '/api/leaderboards/estimated1RM?exerciseId={exercise_id}', None),
+    ('leaderboard rank', 'GET', '/api/leaderboards/weeklyVolume/me', None),
+    ('export', 'GET', '/api/workouts/export?format=csv', None),
+    ('create workout', 'POST', '/api/workouts', {
+        'name': 'Plan check', 'duration': 30,
+        'exercises': [{'exerciseId': '{exercise_id}', 'sets': 3, 'reps': 10, 'weight': 40.0}]}),
+    ('update workout', 'PUT', '/api/workouts/{new_id}', {
+        'exercises': [{'exerciseId': '{exercise_id}', 'sets': 4, 'reps': 8, 'weight': 45.0}]}),
+    ('patch workout', 'PATCH', '/api/workouts/{new_id}', {'duration': 35}),
+    ('delete workout', 'DELETE', '/api/workouts/{new_id}', None),
+    ('batch', 'POST', '/api/batch', {'operations': [
+        {'op': 'create', 'idempotencyKey': 'plan-check', 'data': {
+            'name': 'Batch check', 'exercises': [{'exerciseId': '{exercise_id}', 'sets': 3, 'reps': 5}]}},
+        {'op': 'patch', 'workoutId': '$0', 'data': {'duration': 20}},
+        {'op': 'delete', 'workoutId': '$0'}]}),
+    ('workout changes after writes', 'GET', '/api/workouts/changes?since={sync_token}', None),
+]
+
+EXPLAINED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+_FROM = re.compile(r'\bFROM\s+"?(\w+)', re.IGNORECASE)
+
+def _fill(value, values):
+    if isinstance(value, str):
+        filled = value.format(**values)
+        return int(filled) if value.startswith('{') and filled.isdigit() else filled
+    if isinstance(value, dict):
+        return {key: _fill(item, values) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill(item, values) for item in value]
+    return value
+
+def _main_table(statement):
+    match = _FROM.search(statement)
+    return match.group(1) if match else None
+
+def explain_sqlite(cursor, statement, parameters):
+    """Return (plan lines, [(kind, table)]) from EXPLAIN QUERY PLAN"""
+    cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+    lines, findings = [], []
+    for row in cursor.fetchall():
+        detail = row[-1]
+        lines.append(detail)
+        if detail.startswith('SCAN ') and not detail.startswith(('SCAN CONSTANT', 'SCAN (')):
+            findings.append(('scan', detail.split()[1]))
+        elif detail.startswith('USE TEMP B-TREE'):
+            findings.append(('sort', _main_table(statement)))
+    return lines, findings
+
+def explain_postgresql(cursor, statement, parameters):
+    """Return (plan lines, [(kind, table)]) from EXPLAIN (FORMAT JSON)"""
+    cursor.execute('SET enable_seqscan = off')
+    cursor.execute('SET enable_sort = off')
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+    plan = cursor.fetchone()[0]
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    lines, findings = [], []
+
+    def walk(node, depth):
+        kind = node['Node Type']
+        relation = node.get('Relation Name')
+        lines.append('  ' * depth + kind + (f' on {relation}' if relation else ''))
+        if kind == 'Seq Scan':
+            findings.append(('scan', relation))
+        elif kind in ('Sort', 'Incremental Sort'):
+            findings.append(('sort', _main_table(statement)))
+        for child in node.get('Plans', []):
+            walk(child, depth + 1)
+
+    walk(plan[0]['Plan'], 0)
+    return lines, findings
+
+def check(app, username, verbose=False):
+    """Call every endpoint, explain the statements it ran; returns the violations"""
+    import app as app_module
+    from models import db, User, Workout, Exercise
+
+    with app.app_context():
+        engine = db.engine
+        user = User.query.filter_by(username=username).one()
+        values = {
+            'username': username,
+            'workout_id': db.session.query(Workout.id).filter_by(user_id=user.id).order_by(Workout.id).first()[0],
+            'exercise_id': db.session.query(Exercise.id).order_by(Exercise.id).first()[0],
+        }
+        token = app_module.generate_token(user.id)
+        db.session.remove()
+
+    explain = explain_postgresql if engine.dialect.name == 'postgresql' else explain_sqlite
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+            captured.append((statement, parameters))
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    violations = []
+    for name, method, path, body in ENDPOINTS:
+        captured.clear()
+        event.listen(engine, 'before_cursor_execute', capture)
+        try:
+            response = client.open(_fill(path, values), method=method, headers=headers, json=_fill(body, values))
+            data = response.get_data()
+        finally:
+            event.remove(engine, 'before_cursor_execute', capture)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{name}: {method} {path} returned {response.status_code}: {data[:200]!r}')
+        payload = response.get_json(silent=True) or {}
+        if name == 'workouts page':
+            values['cursor'] = payload['nextCursor']
+        elif name == 'workout changes':
+            values['sync_token'] = payload['nextToken']
+        elif name == 'create workout':
+            values['new_id'] = payload['id']
+
+        seen = set()
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            for statement, parameters in captured:
+                if statement in seen:
+                    continue
+                seen.add(statement)
+                lines, findings = explain(cursor, statement, parameters)
+                problems = [(kind, table) for kind, table in findings
+                            if (kind, table) not in ALLOWED and (name, kind, table) not in ALLOWED]
+                if verbose or problems:
+                    print(f'{name}: {" ".join(statement.split())[:160]}')
+                    for line in lines:
+                        print(f'    {line}')
+                for kind, table in problems:
+                    violations.append((name, kind, table, statement))
+            connection.rollback()
+        finally:
+            connection.close()
+        print(f"{'✗' if any(v[0] == name for v in violations) else '✓'} {name}: {len(seen)} statements")
+    return violations
+
+def main():
+    parser = argparse.ArgumentParser(description='Fail when hot API queries scan or sort whole tables')
+    parser.add_argument('--database-url', help='Defaults to a new temporary SQLite file')
+    parser.add_argument('--skip-generate', action='store_true', help='Reuse the data already in --database-url')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--workouts-per-user', type=int, default=300)
+    parser.add_argument('--exercises', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--verbose', action='store_true', help='Print every plan, not only failing ones')
+    args = parser.parse_args()
+
+    app = setup_app(args.database_url or scratch_database_url())
+    from models import db, User
+    with app.app_context():
+        if not args.skip_generate:
+            dataset.generate(args.users, args.workouts_per_user, args.exercises, args.seed)
+        # Fresh planner statistics, as production would have
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.exec_driver_sql('ANALYZE')
+        username = db.session.query(User.username).filter(
+            User.username.like('bench-user-%')).order_by(User.id).first()[0]
+        db.session.remove()
+
+    violations = check(app, username, args.verbose)
+    for name, kind, table, statement in violations:
+        print(f'✗ {name}: {kind} on {table}: {" ".join(statement.split())[:200]}')
+    print(f"{'✗' if violations else '✓'} {len(violations)} query plan problems")
+    return 1 if violations else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Read replica routing check with two SQLite files
+Creates a primary database and a replica that is only "replicated" when this
+script copies the primary into it, so every read shows where it was served
+from: a write is visible right away to its author (read-your-writes), missing
+for other readers until the next copy, and present on the replica after it.
+A second replica URL that cannot be opened must be skipped by the health check.
+Exits non-zero when a step does not behave that way.
+
+Usage: python -m benchmarks.replicas [--window 0.5]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from sqlalchemy import event
+
+def replicate(primary_path, replica_path):
+    """Copy the primary into the replica, as streaming replication would eventually do"""
+    source, target = sqlite3.connect(primary_path), sqlite3.connect(replica_path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Check read replica routing with SQLite files')
+    parser.add_argument('--window', type=float, default=0.5, help='READ_YOUR_WRITES_WINDOW in seconds')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='fitness-replicas-')
+    primary_path = os.path.join(directory, 'primary.db')
+    replica_path = os.path.join(directory, 'replica.db')
+    broken_url = 'sqlite:///' + os.path.join(directory, 'missing', 'replica.db')
+    # Read by replicas at import time, so they must be set before the app is imported
+    os.environ['DATABASE_READ_URLS'] = f'sqlite:///{replica_path},{broken_url}'
+    os.environ['READ_YOUR_WRITES_WINDOW'] = str(args.window)
+    os.environ['REPLICA_CHECK_INTERVAL'] = '60'
+
+    from benchmarks.common import setup_app, register
+    app = setup_app('sqlite:///' + primary_path)
+    from models import db
+    import replicas
+    replicate(primary_path, replica_path)
+
+    served = {}
+    with app.app_context():
+        for key, engine in db.engines.items():
+            def count(conn, cursor, statement, parameters, context, executemany, key=key or 'primary'):
+                served[key] = served.get(key, 0) + 1
+            event.listen(engine, 'before_cursor_execute', count)
+
+    author = app.test_client()
+    other = app.test_client(use_cookies=False)  # Relies on the in-process window only
+    headers = register(author, 'replica-check')
+    failures = []
+
+    def expect(name, condition):
+        print(f"{'✓' if condition else '✗'} {name}")
+        if not condition:
+            failures.append(name)
+
+    def workout_names(client, extra=None):
+        response = client.get('/api/workouts', headers=dict(headers, **(extra or {})))
+        assert response.status_code == 200, response.get_data()[:200]
+        return {workout['name'] for workout in response.get_json()}
+
+    # The user exists only on the primary, so these reads must stick to it
+    expect('new user can read its profile', author.get('/api/auth/me', headers=headers).status_code == 200)
+    author.post('/api/workouts', headers=headers, json={'name': 'first', 'exercises': []})
+    expect('author reads its write from the primary', 'first' in workout_names(author))
+    expect('same worker keeps the author on the primary without a cookie', 'first' in workout_names(other))
+    response = author.post('/api/workouts', headers=headers, json={'name': 'second', 'exercises': []})
+    echoed = {replicas.STICKY_HEADER: response.headers.get(replicas.STICKY_HEADER, '')}
+    replicas.recent_writers.clear()  # As if the next reads reached another worker
+    expect('the cookie keeps the author on the primary on other workers', 'second' in workout_names(author))
+    expect('the echoed header keeps a cookie-less client on the primary on other workers',
+           'second' in workout_names(other, echoed))
+    expect('a malformed header is ignored', 'second' not in workout_names(other, {replicas.STICKY_HEADER: 'soon'}))
+
+    time.sleep(args.window + 0.1)
+    served.clear()
+    expect('after the window reads go to the stale replica', 'first' not in workout_names(other))
+    expect('no reads on the primary after the window', 'primary' not in served)
+    expect('the unreachable replica is skipped', set(served) == {'replica_0'})
+
+    replicate(primary_path, replica_path)
+    expect('replicated write is served by the replica', 'first' in workout_names(other))
+    health = author.get('/api/health').get_json()
+    expect('health reports the broken replica', health.get('replicas') == {'replica_0': True, 'replica_1': False})
+
+    print(f"{'✗' if failures else '✓'} {len(failures)} routing problems")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,342 @@
+"""
+Load benchmark suite for the Flask API
+Generates a seeded dataset, drives the real app through typical scenarios and
+reports throughput, latency percentiles and SQL queries per request as JSON.
+
+Usage:
+  python -m benchmarks.run --output baseline.json
+  python -m benchmarks.run --driver gunicorn --workers 4 --baseline baseline.json
+
+The app is driven either in-process through the Flask test client or over HTTP
+against a gunicorn started for the run (--driver gunicorn) or an already running
+server (--url). Queries per request come from /api/metrics, so they are
+counted by the server itself. With --baseline, scenarios that got slower or
+issue more queries than the saved run are flagged and the exit code is 1.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from benchmarks.common import percentile, scratch_database_url, setup_app
+from benchmarks import generate as dataset
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ['login_storm', 'dashboard', 'history_paging', 'write_mix', 'catalog']
+
+# Relative change tolerated before a scenario counts as a regression
+DEFAULT_TOLERANCE = 0.15
+QUERY_TOLERANCE = 0.5  # Extra queries per request
+
+class TestClientDriver:
+    """Requests through the in-process Flask test client"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, headers=None, body=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, headers=headers or {}, json=body)
+        return response.status_code, response.get_data(), response.headers
+
+class HttpDriver:
+    """Requests over keep-alive HTTP connections, one per thread"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self._local = threading.local()
+
+    def request(self, method, path, headers=None, body=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            connection = getattr(self._local, 'connection', None)
+            if connection is None:
+                connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                connection.request(method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                return response.status, response.read(), dict(response.getheaders())
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+
+class Recorder:
+    """Wraps a driver and records the latency and status of every request"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def __call__(self, method, path, headers=None, body=None):
+        started = time.perf_counter()
+        try:
+            status, data, response_headers = self.driver.request(method, path, headers, body)
+        except Exception:
+            status, data, response_headers = 0, b'', {}
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.samples.append((elapsed, status))
+        return status, data, response_headers
+
+def _json(data):
+    try:
+        return json.loads(data)
+    except ValueError:
+        return None
+
+# Scenarios: each step makes one or more requests as a random user
+
+def login_storm(call, ctx, rng):
+    user = rng.choice(ctx['users'])
+    call('POST', '/api/auth/login', body={'username': user['username'], 'password': dataset.PASSWORD})
+
+def dashboard(call, ctx, rng):
+    headers = rng.choice(ctx['users'])['headers']
+    call('GET', '/api/auth/me', headers)
+    call('GET', '/api/stats', headers)
+    call('GET', '/api/workouts?limit=20', headers)
+
+def history_paging(call, ctx, rng, max_pages=10):
+    headers = rng.choice(ctx['users'])['headers']
+    path = '/api/workouts?limit=50'
+    for _ in range(max_pages):
+        status, data, _ = call('GET', path, headers)
+        page = _json(data) if status == 200 else None
+        if not page or not page.get('nextCursor'):
+            return
+        path = f"/api/workouts?limit=50&cursor={page['nextCursor']}"
+
+def write_mix(call, ctx, rng):
+    user = rng.choice(ctx['users'])
+    exercises = [{'exerciseId': rng.choice(ctx['exercise_ids']), 'sets': rng.randint(2, 5),
+                  'reps': rng.randint(3, 15), 'weight': rng.choice([None, 20.0, 40.0, 60.0])}
+                 for _ in range(rng.randint(3, 6))]
+    roll = rng.random()
+    with ctx['lock']:
+        created = user.setdefault('created', [])
+        target = None
+        if created and roll >= 0.4:
+            target = created.pop() if roll >= 0.8 else rng.choice(created)
+
+    if target is None:
+        status, data, _ = call('POST', '/api/workouts', user['headers'],
+                               {'name': 'Benchmark', 'duration': 45, 'exercises': exercises})
+        body = _json(data)
+        if status == 201 and body:
+            with ctx['lock']:
+                created.append(body['id'])
+    elif roll < 0.65:
+        call('PUT', f'/api/workouts/{target}', user['headers'], {'exercises': exercises})
+    elif roll < 0.8:
+        call('PATCH', f'/api/workouts/{target}', user['headers'], {'duration': rng.randint(20, 90)})
+    else:
+        call('DELETE', f'/api/workouts/{target}', user['headers'])
+
+def catalog(call, ctx, rng):
+    if ctx.get('catalog_etag') and rng.random() < 0.5:
+        call('GET', '/api/exercises', {'If-None-Match': ctx['catalog_etag']})
+    else:
+        status, _, headers = call('GET', '/api/exercises')
+        if status == 200:
+            ctx['catalog_etag'] = headers.get('ETag')
+
+def _scrape(driver):
+    """Total SQL statements and requests (excluding /api/metrics itself) reported by the server"""
+    headers = {}
+    if os.getenv('METRICS_TOKEN'):
+        headers['Authorization'] = f"Bearer {os.getenv('METRICS_TOKEN')}"
+    _, data, _ = driver.request('GET', '/api/metrics', headers)
+    statements = requests = 0
+    for line in data.decode('utf-8').splitlines():
+        if 'route="/api/metrics"' in line:
+            continue
+        if line.startswith('db_statements_total{'):
+            statements += float(line.rsplit(' ', 1)[1])
+        elif line.startswith('http_requests_total{'):
+            requests += float(line.rsplit(' ', 1)[1])
+    return statements, requests
+
+def run_scenario(name, driver, ctx, steps, concurrency, seed):
+    """Run `steps` iterations of a scenario and summarize them"""
+    step = globals()[name]
+    recorder = Recorder(driver)
+    before = _scrape(driver)
+
+    def worker(index):
+        rng = random.Random(f'{seed}-{name}-{index}')
+        for _ in range(steps // concurrency + (index < steps % concurrency)):
+            step(recorder, ctx, rng)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    seconds = time.perf_counter() - started
+    after = _scrape(driver)
+
+    latencies = sorted(elapsed for elapsed, _ in recorder.samples)
+    served = after[1] - before[1]
+    return {
+        'requests': len(recorder.samples),
+        'errors': sum(1 for _, status in recorder.samples if status == 0 or status >= 500),
+        'seconds': round(seconds, 3),
+        'throughput': round(len(recorder.samples) / seconds, 1) if seconds else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        'queries_per_request': round((after[0] - before[0]) / served, 2) if served else None,
+    }
+
+def compare(report, baseline, tolerance):
+    """List scenarios that are slower or issue more queries than in the baseline"""
+    regressions = []
+    for name, current in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        if previous['throughput'] and current['throughput'] < previous['throughput'] * (1 - tolerance):
+            regressions.append({'scenario': name, 'metric': 'throughput',
+                                'baseline': previous['throughput'], 'current': current['throughput']})
+        if previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append({'scenario': name, 'metric': 'p95_ms',
+                                'baseline': previous['p95_ms'], 'current': current['p95_ms']})
+        if previous['queries_per_request'] is not None and current['queries_per_request'] is not None \
+                and current['queries_per_request'] > previous['queries_per_request'] + QUERY_TOLERANCE:
+            regressions.append({'scenario': name, 'metric': 'queries_per_request',
+                                'baseline': previous['queries_per_request'],
+                                'current': current['queries_per_request']})
+    return regressions
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_gunicorn(database_url, workers, threads):
+    """Start gunicorn on a free port with metrics shared between its workers
+
+    Returns the process, its URL and the seconds until it answered its first request.
+    """
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, FLASK_ENV='production', GUNICORN_THREADS=str(threads),
+               METRICS_DIR=tempfile.mkdtemp(prefix='fitness-bench-metrics-'), METRICS_FLUSH_INTERVAL='0')
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '--workers', str(workers),
+         '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+        cwd=BACKEND_DIR, env=env
+    )
+    url = f'http://127.0.0.1:{port}'
+    driver = HttpDriver(url)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if driver.request('GET', '/api/health')[0] == 200:
+                return process, url, time.monotonic() - started
+        except OSError:
+            pass
+        time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError('gunicorn did not start')
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the API load benchmarks')
+    parser.add_argument('--database-url', help='Defaults to a new temporary SQLite file')
+    parser.add_argument('--skip-generate', action='store_true', help='Reuse the data already in --database-url')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--workouts-per-user', type=int, default=150)
+    parser.add_argument('--exercises', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--driver', choices=['testclient', 'gunicorn'], default='testclient')
+    parser.add_argument('--url', help='Benchmark an already running server instead')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--concurrency', type=int, default=1, help='Client threads')
+    parser.add_argument('--steps', type=int, default=100, help='Iterations per scenario')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='Scenario to run (repeatable, default all)')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--baseline', help='Compare against a saved report')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    database_url = args.database_url or scratch_database_url()
+    app = setup_app(database_url)
+    import app as app_module
+    from models import db, User, Exercise
+
+    with app.app_context():
+        summary = None
+        if not args.skip_generate:
+            summary = dataset.generate(args.users, args.workouts_per_user, args.exercises, args.seed)
+        users = [{'id': user.id, 'username': user.username,
+                  'headers': {'Authorization': f'Bearer {app_module.generate_token(user.id)}'}}
+                 for user in User.query.filter(User.username.like('bench-user-%')).order_by(User.id)]
+        exercise_ids = [row.id for row in db.session.query(Exercise.id)]
+    ctx = {'users': users, 'exercise_ids': exercise_ids, 'lock': threading.Lock()}
+
+    process = startup = None
+    if args.url:
+        driver_name, driver = 'http', HttpDriver(args.url)
+    elif args.driver == 'gunicorn':
+        process, url, startup = start_gunicorn(database_url, args.workers, args.threads)
+        driver_name, driver = 'gunicorn', HttpDriver(url)
+    else:
+        driver_name, driver = 'testclient', TestClientDriver(app)
+
+    try:
+        report = {
+            'meta': {
+                'driver': driver_name,
+                'workers': args.workers if driver_name == 'gunicorn' else None,
+                'concurrency': args.concurrency,
+                'steps': args.steps,
+                'seed': args.seed,
+                'database': database_url.split(':', 1)[0],
+            },
+            'dataset': summary,
+            'startup_seconds': round(startup, 3) if startup is not None else None,
+            'scenarios': {name: run_scenario(name, driver, ctx, args.steps, args.concurrency, args.seed)
+                          for name in args.scenario or SCENARIOS}
+        }
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('meta') != report['meta']:
+            report['warning'] = 'Baseline was recorded with different settings: ' + json.dumps(baseline.get('meta'))
+        report['regressions'] = compare(report, baseline, args.tolerance)
+        exit_code = 1 if report['regressions'] else 0
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
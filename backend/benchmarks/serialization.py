@@ -0,0 +1,104 @@
+"""
+Serialization benchmark for large workout and catalog payloads
+Loads one user's history (1,000 workouts by default) from a generated dataset
+and times turning it into a response body: the way GET /api/workouts did it
+before (isoformat() per row, then Flask's default provider) against the current
+serializers with every installed fastjson backend. The catalog body is timed
+the same way, encoding every entry against joining the cached fragments.
+Reports the median milliseconds per payload as JSON.
+
+Usage: python -m benchmarks.serialization [--workouts 1000] [--repeat 30]
+"""
+import argparse
+import json
+import statistics
+import time
+from benchmarks.common import scratch_database_url, setup_app
+from benchmarks import generate as dataset
+
+def _legacy_serialize_exercise(we, catalog):
+    exercise = catalog.get(we.exercise_id)
+    return {
+        'id': we.id,
+        'exerciseId': we.exercise_id,
+        'exerciseName': exercise['name'] if exercise else 'Unknown',
+        'exerciseImage': exercise['image'] if exercise else '💪',
+        'sets': we.sets,
+        'reps': we.reps,
+        'weight': we.weight,
+        'notes': we.notes
+    }
+
+def _legacy_serialize_workout(workout, catalog):
+    """The serializer before fastjson: instrumented attributes, isoformat() and a catalog lookup per row"""
+    return {
+        'id': workout.id,
+        'name': workout.name,
+        'date': workout.date.isoformat(),
+        'duration': workout.duration,
+        'exercises': [_legacy_serialize_exercise(we, catalog) for we in workout.workout_exercises]
+    }
+
+def _median_ms(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 3)
+
+def run(app, workouts, repeat):
+    """Time each way of encoding the payloads; returns the report dict"""
+    from flask.json.provider import DefaultJSONProvider
+    from serializers import serialize_workouts
+    from catalog import catalog
+    import fastjson
+
+    default_provider = DefaultJSONProvider(app)
+    report = {'workouts': len(workouts), 'repeat': repeat, 'backend': fastjson.BACKEND, 'workout_history': {},
+              'catalog': {'exercises': len(catalog.by_id)}}
+
+    history = report['workout_history']
+    history['before'] = _median_ms(lambda: default_provider.dumps(
+        [_legacy_serialize_workout(workout, catalog) for workout in workouts]).encode('utf-8'), repeat)
+    history['build_dicts'] = _median_ms(lambda: serialize_workouts(workouts), repeat)
+    payload = serialize_workouts(workouts)
+    for name, encode in fastjson.ENCODERS.items():
+        history[f'encode_{name}'] = _median_ms(lambda: encode(payload), repeat)
+        history[f'total_{name}'] = _median_ms(lambda: encode(serialize_workouts(workouts)), repeat)
+    history['bytes'] = len(fastjson.dumps(payload))
+
+    exercises = list(catalog.by_id.values())
+    report['catalog']['before'] = _median_ms(lambda: json.dumps(exercises).encode('utf-8'), repeat)
+    for name, encode in fastjson.ENCODERS.items():
+        report['catalog'][f'encode_{name}'] = _median_ms(lambda: fastjson.array(encode(ex) for ex in exercises), repeat)
+    report['catalog']['fragments'] = _median_ms(lambda: fastjson.array(catalog.fragments.values()), repeat)
+    return report
+
+def load_history(workouts, exercises, seed):
+    """Generate one user's history and load `workouts` of them; call inside an app context"""
+    from models import User
+    from serializers import load_workouts
+    from catalog import catalog
+
+    dataset.generate(1, workouts, exercises, seed)
+    catalog.refresh(force=True)
+    user_id = User.query.filter(User.username.like('bench-user-%')).first().id
+    return load_workouts(user_id)[:workouts]
+
+def main():
+    parser = argparse.ArgumentParser(description='Time JSON serialization of a large workout history')
+    parser.add_argument('--workouts', type=int, default=1000, help='Workouts in the payload')
+    parser.add_argument('--exercises', type=int, default=200, help='Catalog size')
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    app = setup_app(scratch_database_url())
+    with app.app_context():
+        workouts = load_history(args.workouts, args.exercises, args.seed)
+        print(json.dumps(run(app, workouts, args.repeat), indent=2))
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,170 @@
+"""
+Sharding check with three SQLite files
+DATABASE_URL doubles as shard 0 and two more files are shards 1 and 2. Users
+registered through the API must have their workout rows in their shard's file
+only, with the exercise catalog kept in DATABASE_URL; the API must behave as
+with one database; statements no shard can answer must raise ShardingError; and
+rebalance.py must move users between shards without changing what they see,
+telling delta sync clients about the new workout ids and keeping retried
+batches from replaying ids of the old shard, waiting once per batch of moves.
+Exits non-zero when a step does not behave that way.
+
+Usage: python -m benchmarks.shards [--users 9] [--workouts 4]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+def count_rows(path, table, user_id=None):
+    """Rows of a table in one SQLite file, None when the table does not exist there"""
+    connection = sqlite3.connect(path)
+    try:
+        if not connection.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,)).fetchone():
+            return None
+        if user_id is None:
+            return connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        return connection.execute(f'SELECT COUNT(*) FROM {table} WHERE user_id = ?', (user_id,)).fetchone()[0]
+    finally:
+        connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Check user-keyed sharding with SQLite files')
+    parser.add_argument('--users', type=int, default=9)
+    parser.add_argument('--workouts', type=int, default=4, help='Workouts per user')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='fitness-shards-')
+    paths = [os.path.join(directory, f'shard{index}.db') for index in range(3)]
+    # Read by shards at import time, so they must be set before the app is imported
+    os.environ['DATABASE_SHARD_URLS'] = ','.join('sqlite:///' + path for path in paths)
+    os.environ['SHARD_CACHE_TTL'] = '0.2'
+
+    from benchmarks.common import setup_app, register
+    app = setup_app('sqlite:///' + paths[0])
+    from models import db, Workout, User
+    import shards
+    import schema
+    import rebalance
+    from stats import check_rollups
+    from progression import check_progress
+
+    client = app.test_client()
+    failures = []
+
+    def expect(name, condition):
+        print(f"{'✓' if condition else '✗'} {name}")
+        if not condition:
+            failures.append(name)
+
+    def workouts_of(headers):
+        response = client.get('/api/workouts', headers=headers)
+        assert response.status_code == 200, response.get_data()[:200]
+        return sorted((workout['name'], len(workout['exercises'])) for workout in response.get_json())
+
+    def sync(headers, token=None):
+        response = client.get('/api/workouts/changes', headers=headers,
+                              query_string={'since': token} if token else {})
+        assert response.status_code == 200, response.get_data()[:200]
+        return response.get_json()
+
+    with app.app_context():
+        expect('every shard is migrated', schema.check())
+    expect('the catalog is only in DATABASE_URL',
+           [count_rows(path, 'exercises') is not None for path in paths] == [True, False, False])
+
+    users = {}
+    for index in range(args.users):
+        headers = register(client, f'shard-check-{index}')
+        user_id = client.get('/api/auth/me', headers=headers).get_json()['id']
+        for number in range(args.workouts):
+            response = client.post('/api/workouts', headers=headers, json={
+                'name': f'workout {number}', 'date': f'2026-01-{number + 1:02d}T10:00:00', 'duration': 30,
+                'exercises': [{'exerciseId': 1 + number % 3, 'sets': 3, 'reps': 10, 'weight': 20.0 + number}]
+            })
+            assert response.status_code == 201, response.get_data()[:200]
+        users[user_id] = headers
+
+    placed = all(count_rows(path, 'workouts', user_id) == (args.workouts if index == user_id % 3 else 0)
+                 for user_id in users for index, path in enumerate(paths))
+    expect('workouts are written to user_id % 3', placed)
+    expect('stats rows follow their workouts',
+           all(count_rows(paths[user_id % 3], 'daily_stats', user_id) > 0 for user_id in users))
+    user_id, headers = next((user_id, headers) for user_id, headers in users.items() if user_id % 3 == 1)
+    expected = workouts_of(headers)
+    expect('a user reads its workouts from its shard', len(expected) == args.workouts)
+    stats = client.get('/api/stats', headers=headers).get_json()
+    expect('stats name exercises from the global catalog',
+           stats['totalWorkouts'] == args.workouts and stats['mostUsedExercises'][0]['name'] == 'Push-ups')
+    expect('records are read from the shard', client.get('/api/records', headers=headers).status_code == 200)
+
+    with app.app_context():
+        try:
+            Workout.query.count()
+            expect('workout queries outside requests need shards.using()', False)
+        except shards.ShardingError:
+            expect('workout queries outside requests need shards.using()', True)
+        with shards.using(1):
+            try:
+                db.session.query(Workout.id).join(User, User.id == Workout.user_id).all()
+                expect('joining workouts with users is refused', False)
+            except shards.ShardingError:
+                expect('joining workouts with users is refused', True)
+            db.session.rollback()
+
+    token = sync(headers)['nextToken']
+    with app.app_context():
+        moved = rebalance.move_user(user_id, 2, wait=shards.CACHE_TTL)
+    expect('the user is moved', moved and count_rows(paths[1], 'workouts', user_id) == 0
+           and count_rows(paths[2], 'workouts', user_id) == args.workouts)
+    expect('the user sees the same workouts after the move', workouts_of(headers) == expected)
+    changes = sync(headers, token)
+    expect('delta sync replaces the moved workouts',
+           len(changes['deletions']) == args.workouts and len(changes['upserts']) == args.workouts
+           and not set(changes['deletions']) & {workout['id'] for workout in changes['upserts']})
+    response = client.post('/api/workouts', headers=headers, json={'name': 'after move', 'exercises': []})
+    expect('new workouts go to the new shard',
+           response.status_code == 201 and count_rows(paths[2], 'workouts', user_id) == args.workouts + 1)
+    with app.app_context(), shards.using(2):
+        expect('moved rollups match the moved workouts', not check_rollups(user_id) + check_progress(user_id))
+
+    # A batch retried after its user moved: the create replays with the new id, while the patch,
+    # whose stored result holds the old shard's entry ids, runs again
+    batch_headers = register(client, 'shard-check-batch')
+    batch_user = client.get('/api/auth/me', headers=batch_headers).get_json()['id']
+    batch = {'operations': [
+        {'op': 'create', 'idempotencyKey': 'move-create', 'data': {
+            'name': 'batched', 'exercises': [{'exerciseId': 1, 'sets': 3, 'reps': 5}]}},
+        {'op': 'patch', 'workoutId': '$0', 'idempotencyKey': 'move-patch', 'data': {'duration': 25}}]}
+    assert client.post('/api/batch', headers=batch_headers, json=batch).status_code == 200
+    with app.app_context():
+        rebalance.move_user(batch_user, (batch_user + 1) % 3, wait=shards.CACHE_TTL)
+    retried = client.post('/api/batch', headers=batch_headers, json=batch).get_json()['results']
+    workout_ids = {workout['id'] for workout in client.get('/api/workouts', headers=batch_headers).get_json()}
+    expect('a replayed create names the workout by its new id',
+           retried[0].get('replayed') and workout_ids == {retried[0]['body']['id']})
+    expect('a stored patch result is not replayed after a move',
+           not retried[1].get('replayed') and retried[1]['status'] == 200
+           and retried[1]['body']['id'] == retried[0]['body']['id'])
+
+    with app.app_context():
+        before = {database: sum(counts.values()) for database, counts in rebalance.workout_counts().items()}
+        moves = [(user_id, target) for user_id, _, target in rebalance.plan_balance(rebalance.workout_counts())]
+        started = time.monotonic()
+        outcomes = [outcome for _, _, outcome in rebalance.move_users(moves, wait=1.0, batch_size=len(moves) or 1)]
+        elapsed = time.monotonic() - started
+        after = {database: sum(counts.values()) for database, counts in rebalance.workout_counts().items()}
+    expect('balancing keeps every workout and narrows the spread',
+           all(outcome is True for outcome in outcomes) and sum(after.values()) == sum(before.values())
+           and max(after.values()) - min(after.values()) <= max(before.values()) - min(before.values()))
+    expect('a batch of moves waits once', 1.0 <= elapsed < 1.0 + 0.5 * len(moves) if len(moves) > 1 else True)
+    expect('every user still sees its workouts after balancing',
+           all(len(workouts_of(headers)) >= args.workouts for headers in users.values()))
+
+    print(f"{'✗' if failures else '✓'} {len(failures)} sharding problems")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+In-process cache of the exercise catalog
+The catalog is small and rarely changes, so each worker keeps a copy keyed by id
+together with a search index over it and every entry already encoded as JSON,
+so responses join those bytes instead of encoding exercises again. A single
+catalog_version row tells workers when their copy is stale; the worker that
+creates an exercise adds it in place.
+"""
+import hashlib
+import os
+import threading
+import time
+from sqlalchemy import delete, insert, select
+from models import db, Exercise, ExerciseMuscle, CatalogVersion
+from search import DEFAULT_LIMIT, ExerciseIndex, normalize_muscles
+import fastjson
+
+CATALOG_VERSION_ID = 1
+
+# How often (seconds) a worker re-reads the version row; 0 checks on every access
+CHECK_INTERVAL = float(os.getenv('CATALOG_CHECK_INTERVAL', '1.0'))
+
+def serialize_exercise(exercise, muscles):
+    """Convert an Exercise row and its normalized muscle groups to the API representation"""
+    return {
+        'id': exercise.id,
+        'name': exercise.name,
+        'category': exercise.category,
+        'muscle': exercise.muscle,
+        'description': exercise.description,
+        'image': exercise.image,
+        'muscles': muscles
+    }
+
+def sync_muscles(exercises):
+    """Rewrite the exercise_muscles rows of (exercise id, free-text muscle) pairs"""
+    exercises = list(exercises)
+    if not exercises:
+        return
+    table = ExerciseMuscle.__table__
+    db.session.execute(delete(table).where(table.c.exercise_id.in_([row[0] for row in exercises])))
+    rows = [{'exercise_id': exercise_id, 'muscle': muscle}
+            for exercise_id, text in exercises for muscle in normalize_muscles(text)]
+    if rows:
+        db.session.execute(insert(table), rows)
+
+def load_muscles():
+    """{exercise id: sorted muscle groups} for the whole catalog"""
+    muscles = {}
+    rows = db.session.execute(select(ExerciseMuscle.exercise_id, ExerciseMuscle.muscle)
+                              .order_by(ExerciseMuscle.exercise_id, ExerciseMuscle.muscle))
+    for exercise_id, muscle in rows:
+        muscles.setdefault(exercise_id, []).append(muscle)
+    return muscles
+
+def read_version():
+    """Read the current catalog version with a single primary key lookup"""
+    version = db.session.query(CatalogVersion.version).filter_by(id=CATALOG_VERSION_ID).scalar()
+    return version or 0
+
+def bump_version():
+    """Mark the catalog as changed; call inside the transaction that modifies exercises
+
+    Returns the new version.
+    """
+    updated = CatalogVersion.query.filter_by(id=CATALOG_VERSION_ID).update(
+        {'version': CatalogVersion.version + 1})
+    if not updated:
+        db.session.add(CatalogVersion(id=CATALOG_VERSION_ID, version=1))
+        return 1
+    return read_version()
+
+class ExerciseCatalog:
+    """Versioned snapshot of all exercises shared by the requests of one worker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self.by_id = {}
+        self.fragments = {}
+        self.index = ExerciseIndex()
+        self.body = b'[]'
+        self.etag = None
+
+    def invalidate(self):
+        """Force the next access to reload the catalog"""
+        with self._lock:
+            self._version = None
+
+    def refresh(self, force=False):
+        """Reload the catalog if the version row changed since the last load"""
+        now = time.monotonic()
+        if not force and self._version is not None and now - self._checked_at < CHECK_INTERVAL:
+            return
+        version = read_version()
+        self._checked_at = now
+        if version == self._version:
+            return
+        with self._lock:
+            muscles = load_muscles()
+            exercises = [serialize_exercise(ex, muscles.get(ex.id, []))
+                         for ex in Exercise.query.order_by(Exercise.id)]
+            fragments = {ex['id']: fastjson.dumps(ex) for ex in exercises}
+            body = fastjson.array(fragments.values())
+            self.by_id = {ex['id']: ex for ex in exercises}
+            self.fragments = fragments
+            self.index = ExerciseIndex(exercises)
+            self.body = body
+            self.etag = hashlib.sha256(body).hexdigest()[:32]
+            self._version = version
+
+    def add(self, exercise, version):
+        """Add a just-committed exercise without reloading the catalog
+
+        Only applies when this copy is exactly one version behind and the new id
+        sorts last; anything else (a concurrent change) falls back to a reload.
+        """
+        with self._lock:
+            if self._version != version - 1 or next(reversed(self.by_id), 0) >= exercise['id']:
+                self._version = None
+                return
+            fragment = fastjson.dumps(exercise)
+            body = self.body[:-1] + (b',' if self.by_id else b'') + fragment + b']'
+            self.by_id[exercise['id']] = exercise
+            self.fragments[exercise['id']] = fragment
+            self.index.add(exercise)
+            self.body = body
+            self.etag = hashlib.sha256(body).hexdigest()[:32]
+            self._version = version
+
+    def search(self, query='', categories=(), muscles=(), limit=DEFAULT_LIMIT, offset=0):
+        """One page of matching exercises; returns (encoded exercises, total, facets)"""
+        self.refresh()
+        with self._lock:
+            ids, total, facets = self.index.search(query, categories, muscles, limit, offset)
+            return [self.fragments[exercise_id] for exercise_id in ids], total, facets
+
+    def get(self, exercise_id):
+        """Look up an exercise by id, re-checking the version once on a miss"""
+        self.refresh()
+        exercise = self.by_id.get(exercise_id)
+        if exercise is None:
+            self.refresh(force=True)
+            exercise = self.by_id.get(exercise_id)
+        return exercise
+
+    def fragment(self, exercise_id):
+        """An exercise encoded as JSON, or None when it does not exist"""
+        if self.get(exercise_id) is None:
+            return None
+        return self.fragments.get(exercise_id)
+
+catalog = ExerciseCatalog()
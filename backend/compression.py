@@ -0,0 +1,115 @@
+"""
+Negotiated response compression
+Workout histories repeat the same exercise names and image URLs on every entry,
+so JSON, NDJSON and CSV bodies shrink 10x or more. Responses of those types are
+brotli- or gzip-encoded, whichever the client prefers in Accept-Encoding, once
+they reach COMPRESS_MIN_SIZE bytes; smaller ones (health checks, errors, 304s)
+go out as they are. Streamed responses are compressed chunk by chunk while they
+are sent. Bytes before and after compression and the CPU time it took are
+counted per route in /api/metrics.
+"""
+import os
+import time
+import zlib
+from flask import request
+import metrics
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip only without it
+    brotli = None
+
+ENABLED = os.getenv('COMPRESS', '1') != '0'
+# Bodies below this many bytes fit in a packet or two; compressing them costs more than it saves
+MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1400'))
+# Levels for dynamic responses, from python -m benchmarks.compression: on a 1,000-workout
+# history gzip 3 and brotli 4 reach 15-18x in 5-8 ms, higher levels double the CPU for a few percent
+GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', '3'))
+BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', '4'))
+
+COMPRESSIBLE_TYPES = {'application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html'}
+SKIPPED_STATUSES = {204, 206, 304}
+
+def gzip_compressor(level=None):
+    """(compress chunk, finish) functions of a streaming gzip encoder"""
+    # wbits 31: deflate with a gzip header and trailer
+    compressor = zlib.compressobj(GZIP_LEVEL if level is None else level, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+def brotli_compressor(quality=None):
+    """(compress chunk, finish) functions of a streaming brotli encoder"""
+    compressor = brotli.Compressor(mode=brotli.MODE_TEXT,
+                                   quality=BROTLI_QUALITY if quality is None else quality)
+    return compressor.process, compressor.finish
+
+# Content-Encoding -> compressor factory, preferred first when the client accepts several equally
+ENCODINGS = {}
+if brotli is not None:
+    ENCODINGS['br'] = brotli_compressor
+ENCODINGS['gzip'] = gzip_compressor
+
+def _compress_stream(chunks, compress, finish, labels):
+    """Compress an iterable response body while it is being sent"""
+    raw = sent = 0
+    cpu = 0.0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            started = time.thread_time()
+            data = compress(chunk)
+            cpu += time.thread_time() - started
+            raw += len(chunk)
+            sent += len(data)
+            # The encoder buffers small chunks; yield only when it has output
+            if data:
+                yield data
+        started = time.thread_time()
+        data = finish()
+        cpu += time.thread_time() - started
+        sent += len(data)
+        yield data
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+        metrics.observe_compression(labels, raw, sent, cpu)
+
+def _after_request(response):
+    if (not ENABLED or request.method == 'HEAD' or response.direct_passthrough
+            or response.status_code < 200 or response.status_code in SKIPPED_STATUSES
+            or response.mimetype not in COMPRESSIBLE_TYPES or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    labels = metrics.request_labels()
+
+    streamed = response.is_streamed
+    body = None if streamed else response.get_data()
+    encoding = request.accept_encodings.best_match(list(ENCODINGS))
+    if encoding is None or (body is not None and len(body) < MIN_SIZE):
+        if body is not None:
+            metrics.observe_compression(dict(labels, encoding='identity'), len(body), len(body), 0.0)
+        return response
+
+    labels['encoding'] = encoding
+    compress, finish = ENCODINGS[encoding]()
+    if streamed:
+        response.response = _compress_stream(response.response, compress, finish, labels)
+        response.headers.pop('Content-Length', None)
+    else:
+        started = time.thread_time()
+        data = compress(body) + finish()
+        metrics.observe_compression(labels, len(body), len(data), time.thread_time() - started)
+        response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+
+    # The encoded bytes differ from the identity ones, so a strong validator becomes weak;
+    # If-None-Match compares weakly, so conditional requests still match
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def init_app(app):
+    """Compress the responses of a Flask app; register after metrics so its timing includes this"""
+    app.after_request(_after_request)
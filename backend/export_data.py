@@ -0,0 +1,56 @@
+"""
+Offline workout export script
+Run this script to dump the workout history of all users, split into shards
+that are exported in parallel (one file per shard). With database sharding
+(shards.py) every export shard reads its users from each database in turn.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+def export_shard(shard, shards, format, output_dir):
+    """Export every user with user_id % shards == shard into one file"""
+    # Imported here so each worker process creates its own engine and connections
+    from app import app
+    import exporter
+    from shards import databases, using
+
+    def database_rows(query):
+        # A user's workouts are all in one database, so they stay together
+        for database in databases():
+            with using(database):
+                yield from exporter.iter_rows(query)
+
+    path = os.path.join(output_dir, f'workouts-{shard:03d}-of-{shards:03d}.{format}')
+    with app.app_context():
+        rows = database_rows(exporter.export_query(shard=shard, shards=shards))
+        lines = 0
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            for line in exporter.export_lines(rows, format, include_user=True):
+                f.write(line)
+                lines += 1
+    return path, lines
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the workouts of all users as NDJSON or CSV')
+    parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    parser.add_argument('--shards', type=int, default=os.cpu_count() or 1,
+                        help='Number of output files / parallel workers')
+    parser.add_argument('--output-dir', default='export')
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    started = time.perf_counter()
+    print(f"Exporting workouts in {args.shards} shards...")
+    with ProcessPoolExecutor(max_workers=args.shards, mp_context=get_context('spawn')) as pool:
+        futures = [pool.submit(export_shard, shard, args.shards, args.format, args.output_dir)
+                   for shard in range(args.shards)]
+        for future in futures:
+            path, lines = future.result()
+            print(f"✓ {path}: {lines} lines")
+    print(f"✓ Export finished in {time.perf_counter() - started:.1f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Streaming workout history export
+Workouts joined with their exercises are read row by row through a server-side
+cursor and written out as NDJSON (one workout per line) or CSV (one exercise per
+row, importable again through /api/workouts/import)
+"""
+import csv
+import io
+from sqlalchemy import select
+from models import db, Workout, WorkoutExercise
+from catalog import catalog
+from importer import CSV_COLUMNS
+import fastjson
+
+YIELD_PER = 1000
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+EXPORT_CSV_COLUMNS = ['userId'] + CSV_COLUMNS + ['exerciseName']
+
+def export_query(user_id=None, shard=None, shards=None):
+    """Select workouts left-joined with their exercise rows, grouped by workout
+
+    Either a single user or one shard (user_id % shards == shard) of all users.
+    """
+    query = select(
+        Workout.user_id, Workout.id, Workout.name, Workout.date, Workout.duration,
+        WorkoutExercise.id.label('entry_id'), WorkoutExercise.exercise_id,
+        WorkoutExercise.sets, WorkoutExercise.reps, WorkoutExercise.weight, WorkoutExercise.notes
+    ).outerjoin(WorkoutExercise, WorkoutExercise.workout_id == Workout.id)
+    if user_id is not None:
+        query = query.where(Workout.user_id == user_id).order_by(
+            Workout.date.desc(), Workout.id.desc(), WorkoutExercise.id)
+    else:
+        if shards:
+            query = query.where(Workout.user_id % shards == shard)
+        query = query.order_by(Workout.user_id, Workout.date.desc(), Workout.id.desc(), WorkoutExercise.id)
+    return query
+
+def iter_rows(query, yield_per=YIELD_PER):
+    """Execute an export query through a server-side cursor"""
+    return db.session.execute(query.execution_options(yield_per=yield_per))
+
+def _exercise(row):
+    exercise = catalog.get(row.exercise_id)
+    return {
+        'id': row.entry_id,
+        'exerciseId': row.exercise_id,
+        'exerciseName': exercise['name'] if exercise else 'Unknown',
+        'exerciseImage': exercise['image'] if exercise else '💪',
+        'sets': row.sets,
+        'reps': row.reps,
+        'weight': row.weight,
+        'notes': row.notes
+    }
+
+def iter_workouts(rows, include_user=False):
+    """Fold consecutive join rows into workout dicts shaped like GET /api/workouts"""
+    current = None
+    for row in rows:
+        if current is None or current['id'] != row.id:
+            if current is not None:
+                yield current
+            current = {
+                'id': row.id,
+                'name': row.name,
+                'date': row.date.isoformat(),
+                'duration': row.duration,
+                'exercises': []
+            }
+            if include_user:
+                current['userId'] = row.user_id
+        if row.exercise_id is not None:
+            current['exercises'].append(_exercise(row))
+    if current is not None:
+        yield current
+
+def ndjson_lines(rows, include_user=False):
+    """Yield one JSON line per workout"""
+    for workout in iter_workouts(rows, include_user):
+        yield fastjson.dumps(workout).decode('utf-8') + '\n'
+
+def csv_lines(rows):
+    """Yield a CSV header and one line per exercise row (workouts without exercises get one blank row)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    yield line(EXPORT_CSV_COLUMNS)
+    for row in rows:
+        exercise = catalog.get(row.exercise_id) if row.exercise_id is not None else None
+        yield line([
+            row.user_id, row.id, row.name, row.date.isoformat(), row.duration,
+            row.exercise_id, row.sets, row.reps, row.weight, row.notes,
+            exercise['name'] if exercise else ''
+        ])
+
+def export_lines(rows, format, include_user=False):
+    """Encode export rows in the requested format"""
+    if format == 'csv':
+        return csv_lines(rows)
+    return ndjson_lines(rows, include_user)
@@ -0,0 +1,71 @@
+"""
+JSON encoding for API responses
+orjson is used when it is installed: it encodes several times faster than the
+standard library and writes datetimes itself, so serializers can hand over
+datetime values instead of calling isoformat() per row. Without orjson, or with
+JSON_BACKEND=json, the standard library produces the same compact output.
+dumps() returns bytes either way. Pre-encoded fragments (the cached catalog
+entries) are joined into responses as bytes instead of being encoded again.
+"""
+import json
+import os
+from datetime import date
+from decimal import Decimal
+from uuid import UUID
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional; the standard library is the fallback
+    orjson = None
+
+def _default(value):
+    """Encode the types Flask's default provider handles and the backends do not"""
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, default=_default)
+
+def _dumps_json(obj):
+    return _encoder.encode(obj).encode('utf-8')
+
+def _dumps_orjson(obj):
+    # Integer keys become strings, as with the json module
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+# Backend name -> function encoding an object as compact UTF-8 JSON bytes
+ENCODERS = {'json': _dumps_json}
+if orjson is not None:
+    ENCODERS['orjson'] = _dumps_orjson
+
+BACKEND = 'orjson' if orjson is not None and os.getenv('JSON_BACKEND', 'orjson') == 'orjson' else 'json'
+dumps = ENCODERS[BACKEND]
+loads = orjson.loads if BACKEND == 'orjson' else json.loads
+
+def array(fragments):
+    """JSON array of already encoded items"""
+    return b'[' + b','.join(fragments) + b']'
+
+def extend(obj, **fragments):
+    """Encode a dict with extra members whose values are already encoded"""
+    members = b','.join(dumps(key) + b':' + fragment for key, fragment in fragments.items())
+    body = dumps(obj)
+    return body[:-1] + (b',' if obj and members else b'') + members + b'}'
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider on top of dumps/loads, so jsonify() uses the fast backend"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype='application/json')
@@ -0,0 +1,50 @@
+"""
+gunicorn settings, picked up automatically when gunicorn starts in this directory
+With preload the app is imported and warmed up once in the master, and workers
+fork from it already initialized. Set GUNICORN_PRELOAD=0 to load the app in
+each worker instead (needed for reload-on-change during development).
+"""
+import os
+
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') != '0'
+# passwords.py sizes its admission limit from the same variable
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+def when_ready(server):
+    # Runs in the master once it is listening; the app is only imported here when preloaded
+    if server.cfg.preload_app:
+        from app import warm_up
+        warm_up()
+        _dispose_engines(close=True)
+
+def post_fork(server, worker):
+    import metrics
+    metrics.worker_started()
+    if server.cfg.preload_app:
+        # Connections opened by the master must not be shared with the workers
+        _dispose_engines(close=False)
+
+def post_worker_init(worker):
+    import metrics
+    if not worker.cfg.preload_app:
+        from app import warm_up
+        warm_up()
+    worker.log.info('Worker %s ready in %.3fs', worker.pid, metrics.worker_ready())
+
+def worker_exit(server, worker):
+    # Runs in the exiting worker: its last requests reach METRICS_DIR before child_exit
+    import metrics
+    metrics.flush(force=True)
+
+def child_exit(server, worker):
+    # Runs in the master once a worker is gone, like prometheus_client's mark_process_dead
+    import metrics
+    metrics.worker_exited(worker.pid)
+
+def _dispose_engines(close):
+    # close=False in a child leaves the parent's connections alone and only replaces the pool
+    from app import app
+    from models import db
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
@@ -0,0 +1,211 @@
+"""
+Bulk workout import
+Records are parsed and validated one at a time from the request stream (JSON
+array, NDJSON or CSV) and written in large multi-row INSERT batches. Invalid
+records are reported by index without aborting the rest of the import.
+"""
+import codecs
+import csv
+import io
+import json
+from sqlalchemy import insert
+from models import db, Workout, WorkoutExercise
+from catalog import catalog
+import stats
+import progression
+import versions
+from workouts import workout_values, validate_entries
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 1000
+
+JSON_TYPES = ('application/json',)
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+CSV_TYPES = ('text/csv', 'application/csv')
+
+# Column order shared with the CSV export
+CSV_COLUMNS = ['workout', 'name', 'date', 'duration', 'exerciseId', 'sets', 'reps', 'weight', 'notes']
+
+def validate_record(record, exercise_ids):
+    """Turn a raw workout record into (workout values, exercise values); raises ValueError
+
+    Uses the same checks as the workout routes, against a catalog snapshot.
+    """
+    if not isinstance(record, dict):
+        raise ValueError('Record must be an object')
+    workout = workout_values(record)
+    entries = validate_entries(record.get('exercises') or [], exercise_ids)
+    return workout, [values for _, values in entries]
+
+def iter_json_array(stream, chunk_size=CHUNK_SIZE):
+    """Yield the elements of a top-level JSON array without reading the whole body
+
+    Elements must be separated by exactly one comma, as in JSON itself.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    # Expected next: '[' to start, an element or ']' after it, an element after a comma,
+    # ',' or ']' after an element
+    buffer, eof, expecting = '', False, 'start'
+    while True:
+        buffer = buffer.lstrip()
+        if buffer:
+            if expecting == 'start':
+                if buffer[0] != '[':
+                    raise ValueError('Expected a JSON array')
+                buffer, expecting = buffer[1:], 'first'
+                continue
+            if buffer[0] == ']' and expecting in ('first', 'separator'):
+                return
+            if expecting == 'separator':
+                if buffer[0] != ',':
+                    raise ValueError("Malformed JSON: expected ',' or ']' after an array element")
+                buffer, expecting = buffer[1:], 'element'
+                continue
+            if buffer[0] in ',]':
+                raise ValueError(f"Malformed JSON: unexpected '{buffer[0]}' in array")
+            try:
+                value, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError('Malformed JSON')
+            else:
+                yield value
+                buffer, expecting = buffer[end:], 'separator'
+                continue
+        elif eof:
+            raise ValueError('Unexpected end of JSON array')
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer += text.decode(chunk or b'', final=eof)
+
+def iter_ndjson(stream):
+    """Yield one record (or the ValueError it caused) per non-empty line"""
+    for line in io.TextIOWrapper(stream, encoding='utf-8'):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            yield ValueError(f'Malformed JSON: {e.msg}')
+
+def iter_csv(stream):
+    """Group consecutive CSV rows describing the same workout into records
+
+    Rows belong together when they share the `workout` column (or, without it,
+    the same name/date/duration). Rows with an empty exerciseId add no exercise.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8', newline=''))
+    record, key = None, None
+    for row in reader:
+        row_key = row.get('workout') or (row.get('name'), row.get('date'), row.get('duration'))
+        if record is None or row_key != key:
+            if record is not None:
+                yield record
+            record, key = {
+                'name': row.get('name'),
+                'date': row.get('date'),
+                'duration': row.get('duration'),
+                'exercises': []
+            }, row_key
+        if row.get('exerciseId'):
+            record['exercises'].append({
+                'exerciseId': row.get('exerciseId'),
+                'sets': row.get('sets'),
+                'reps': row.get('reps'),
+                'weight': row.get('weight'),
+                'notes': row.get('notes')
+            })
+    if record is not None:
+        yield record
+
+def iter_records(mimetype, stream):
+    """Pick the parser for a request body by its mimetype"""
+    if mimetype in NDJSON_TYPES:
+        return iter_ndjson(stream)
+    if mimetype in CSV_TYPES:
+        return iter_csv(stream)
+    if mimetype in JSON_TYPES:
+        return iter_json_array(stream)
+    raise ValueError('Unsupported content type, use JSON, NDJSON or CSV')
+
+def insert_batch(user_id, batch):
+    """Insert validated workouts and their exercises with one multi-row INSERT per table"""
+    workouts_table = Workout.__table__
+    version = versions.bump(user_id)
+    rows = [dict(workout, user_id=user_id, change_version=version) for workout, _ in batch]
+    result = db.session.execute(
+        insert(workouts_table).returning(workouts_table.c.id, sort_by_parameter_order=True), rows
+    )
+    workout_ids = result.scalars().all()
+
+    exercise_rows = [dict(entry, workout_id=workout_id)
+                     for workout_id, (_, entries) in zip(workout_ids, batch)
+                     for entry in entries]
+    if exercise_rows:
+        db.session.execute(insert(WorkoutExercise.__table__), exercise_rows)
+
+    stats.apply_rollups([
+        stats.WorkoutRollup(user_id, workout['date'].date(), workout['duration'] or 0,
+                            [entry['exercise_id'] for entry in entries])
+        for workout, entries in batch
+    ])
+    progression.apply_progress([
+        (None, progression.workout_progress(user_id, workout_id, workout['date'], [
+            (entry['exercise_id'], entry['sets'], entry['reps'], entry['weight']) for entry in entries]))
+        for workout_id, (workout, entries) in zip(workout_ids, batch)
+    ])
+    return workout_ids
+
+def import_workouts(user_id, records, batch_size=BATCH_SIZE):
+    """Validate and insert a stream of workout records, committing once per batch
+
+    Returns a summary with the number of imported/failed records and per-record errors.
+    """
+    catalog.refresh(force=True)
+    exercise_ids = set(catalog.by_id)
+    summary = {'imported': 0, 'failed': 0, 'errors': []}
+
+    def fail(index, message):
+        summary['failed'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({'index': index, 'error': message})
+
+    def flush(batch, indexes):
+        try:
+            insert_batch(user_id, batch)
+            db.session.commit()
+            summary['imported'] += len(batch)
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) == 1:
+                fail(indexes[0], f'Insert failed: {e}')
+                return
+            # Find the records the database rejected: retry them one at a time
+            for record, index in zip(batch, indexes):
+                flush([record], [index])
+
+    batch, indexes, position = [], [], 0
+    try:
+        for record in records:
+            index, position = position, position + 1
+            if isinstance(record, ValueError):
+                fail(index, str(record))
+                continue
+            try:
+                batch.append(validate_record(record, exercise_ids))
+                indexes.append(index)
+            except ValueError as e:
+                fail(index, str(e))
+                continue
+            if len(batch) >= batch_size:
+                flush(batch, indexes)
+                batch, indexes = [], []
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        # The stream itself is unreadable from this record on
+        fail(position, str(e))
+    if batch:
+        flush(batch, indexes)
+    return summary
@@ -0,0 +1,359 @@
+"""
+Cross-user leaderboards and percentiles
+Ranking one user needs the values of everyone else who logged the exercise, so
+instead of querying per request each worker holds a columnar snapshot of the
+per-user-per-exercise metrics in NumPy arrays, sorted by exercise, value and
+user. An exercise's leaderboard is one contiguous slice found by binary search:
+a percentile is two more binary searches and a top-K list the end of the slice,
+microseconds at a million users.
+
+The snapshot is built from the tables workout writes already keep current -
+personal_records and this week's weekly_exercise_stats - on every database of
+DATABASE_SHARD_URLS. When it is older than LEADERBOARD_REFRESH_INTERVAL seconds
+it is rebuilt in a background thread while requests keep using the old one; the
+asking user's own value is always read fresh by primary key.
+
+With LEADERBOARD_DIR set the snapshot is written there as .npy files and
+memory-mapped, so every gunicorn worker on the host shares one copy in the page
+cache. Only the worker holding the directory's lock rebuilds a stale snapshot;
+the others switch to the new files once the CURRENT file names them.
+`python leaderboards.py` publishes a snapshot from cron instead.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+import numpy as np
+from flask import current_app
+from sqlalchemy import case, func, select
+from models import db, User, PersonalRecord, WeeklyExerciseStat
+import progression
+import shards
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = float(os.getenv('LEADERBOARD_REFRESH_INTERVAL', '300'))
+DIRECTORY = os.getenv('LEADERBOARD_DIR') or None
+# How often (seconds) a worker looks for a snapshot published by another one
+CHECK_INTERVAL = 5.0
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+CHUNK_ROWS = 100_000
+
+# API metric name -> personal record kind; weeklyVolume is the volume of the current week
+RECORD_METRICS = {name: kind for kind, name in progression.RECORD_NAMES.items()}
+WEEKLY_VOLUME = 'weeklyVolume'
+METRICS = tuple(RECORD_METRICS) + (WEEKLY_VOLUME,)
+# Exercise id under which weeklyVolume ranks the total of all exercises
+ALL_EXERCISES = 0
+
+COLUMNS = ('exercise_ids', 'values', 'user_ids')
+CURRENT = 'CURRENT'
+LOCK = 'LOCK'
+
+class Snapshot:
+    """Every metric as three columns sorted by exercise, value and descending user id"""
+
+    def __init__(self, columns, built_at, week):
+        self.columns = columns  # metric -> (exercise_ids, values, user_ids)
+        self.built_at = built_at
+        self.week = week
+
+    @classmethod
+    def from_rows(cls, rows, built_at=None, week=None):
+        """Sort unordered {metric: (exercise_ids, user_ids, values)} arrays; values <= 0 are left out"""
+        columns = {}
+        for metric in METRICS:
+            exercise_ids, user_ids, values = (np.asarray(column) for column in rows.get(metric, ((), (), ())))
+            kept = values > 0
+            exercise_ids = exercise_ids[kept].astype(np.int32)
+            user_ids = user_ids[kept].astype(np.int32)
+            values = values[kept].astype(np.float64)
+            # Within equal values the lower user id ends up nearer the top
+            order = np.lexsort((-user_ids, values, exercise_ids))
+            columns[metric] = (exercise_ids[order], values[order], user_ids[order])
+        return cls(columns, time.time() if built_at is None else built_at,
+                   week or progression.week_start(progression.utc_today()))
+
+    def stale(self, refresh_interval=REFRESH_INTERVAL):
+        return (time.time() - self.built_at > refresh_interval
+                or self.week != progression.week_start(progression.utc_today()))
+
+    def _slice(self, metric, exercise_id):
+        """Sorted values and user ids of one exercise's leaderboard"""
+        exercise_ids, values, user_ids = self.columns[metric]
+        # A Python int would make NumPy search a converted copy of the whole column
+        exercise_id = exercise_ids.dtype.type(exercise_id)
+        start = int(exercise_ids.searchsorted(exercise_id, 'left'))
+        end = int(exercise_ids.searchsorted(exercise_id, 'right'))
+        return values[start:end], user_ids[start:end]
+
+    def rank(self, metric, exercise_id, value):
+        """Where a value stands: {'rank', 'percentile', 'total'}
+
+        rank 1 is the best value, ties share a rank; the percentile is the share of
+        users with a lower value, ties counting half.
+        """
+        values, _ = self._slice(metric, exercise_id)
+        total = len(values)
+        if not value or value <= 0 or not total:
+            return {'rank': None, 'percentile': None, 'total': total}
+        below = int(values.searchsorted(value, 'left'))
+        not_above = int(values.searchsorted(value, 'right'))
+        return {
+            'rank': total - not_above + 1,
+            'percentile': round(100 * (below + (not_above - below) / 2) / total, 1),
+            'total': total
+        }
+
+    def top(self, metric, exercise_id, limit=DEFAULT_LIMIT):
+        """The best `limit` entries as (rank, user id, value) tuples, and the leaderboard's size"""
+        values, user_ids = self._slice(metric, exercise_id)
+        total = len(values)
+        best_values = values[max(total - limit, 0):][::-1]
+        ranks = total - values.searchsorted(best_values, 'right') + 1
+        best_users = user_ids[max(total - limit, 0):][::-1]
+        return list(zip(ranks.tolist(), best_users.tolist(), best_values.tolist())), total
+
+def _read_chunks(statement, width):
+    """Rows of a numeric select as one float64 array with `width` columns"""
+    result = db.session.execute(statement.execution_options(yield_per=CHUNK_ROWS))
+    chunks = [np.array([tuple(row) for row in partition], dtype=np.float64) for partition in result.partitions()]
+    return np.concatenate(chunks) if chunks else np.empty((0, width))
+
+def _read_database(week):
+    """(records, weekly) arrays of the database pinned with shards.using()"""
+    records = _read_chunks(select(
+        PersonalRecord.user_id, PersonalRecord.exercise_id,
+        case({kind: code for code, kind in enumerate(progression.RECORD_KINDS)}, value=PersonalRecord.kind),
+        PersonalRecord.value
+    ), 4)
+    weekly = _read_chunks(select(
+        WeeklyExerciseStat.user_id, WeeklyExerciseStat.exercise_id, WeeklyExerciseStat.volume
+    ).where(WeeklyExerciseStat.week == week), 3)
+    return records, weekly
+
+def build(today=None):
+    """Read every user's metrics from DATABASE_URL and each shard into a new Snapshot"""
+    week = progression.week_start(today or progression.utc_today())
+    records, weekly = [], []
+    for database in shards.databases():
+        with shards.using(database):
+            database_records, database_weekly = _read_database(week)
+        records.append(database_records)
+        weekly.append(database_weekly)
+    records, weekly = np.concatenate(records), np.concatenate(weekly)
+
+    rows = {}
+    for code, kind in enumerate(progression.RECORD_KINDS):
+        kind_rows = records[records[:, 2] == code]
+        rows[progression.RECORD_NAMES[kind]] = (kind_rows[:, 1], kind_rows[:, 0], kind_rows[:, 3])
+    # Each user's total over all exercises is one more row, under ALL_EXERCISES
+    user_ids, positions = np.unique(weekly[:, 0], return_inverse=True)
+    totals = np.bincount(positions, weights=weekly[:, 2], minlength=len(user_ids))
+    rows[WEEKLY_VOLUME] = (np.concatenate((weekly[:, 1], np.full(len(user_ids), ALL_EXERCISES))),
+                           np.concatenate((weekly[:, 0], user_ids)),
+                           np.concatenate((weekly[:, 2], totals)))
+    return Snapshot.from_rows(rows, week=week)
+
+def publish(snapshot, directory):
+    """Write a snapshot's columns to a new subdirectory and point CURRENT at it
+
+    Keeps the previous snapshot's files for workers still switching away from it.
+    """
+    name = f'snapshot-{int(snapshot.built_at * 1000)}-{os.getpid()}'
+    path = os.path.join(directory, name)
+    os.makedirs(path)
+    for metric, columns in snapshot.columns.items():
+        for column, values in zip(COLUMNS, columns):
+            np.save(os.path.join(path, f'{metric}.{column}.npy'), values)
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'builtAt': snapshot.built_at, 'week': snapshot.week.isoformat()}, f)
+
+    previous = _published_name(directory)
+    pending = os.path.join(directory, f'{CURRENT}.{os.getpid()}')
+    with open(pending, 'w') as f:
+        f.write(name)
+    os.replace(pending, os.path.join(directory, CURRENT))  # Atomic: readers see the old or the new name
+    for entry in os.listdir(directory):
+        if entry.startswith('snapshot-') and entry not in (name, previous):
+            shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+    return name
+
+def _published_name(directory):
+    try:
+        with open(os.path.join(directory, CURRENT)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def load(path, mmap=True):
+    """Read a published snapshot, memory-mapped read-only unless mmap is False"""
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    # Plain ndarray views of the mapping: np.memmap's subclass hooks slow every slice down
+    columns = {metric: tuple(np.load(os.path.join(path, f'{metric}.{column}.npy'),
+                                     mmap_mode='r' if mmap else None).view(np.ndarray)
+                             for column in COLUMNS)
+               for metric in METRICS}
+    return Snapshot(columns, meta['builtAt'], date.fromisoformat(meta['week']))
+
+@contextmanager
+def _directory_lock(directory, blocking):
+    """Hold the directory's lock file; yields False when not blocking and another process has it"""
+    import fcntl  # Deferred: POSIX only, and only needed with LEADERBOARD_DIR
+
+    with open(os.path.join(directory, LOCK), 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+class Leaderboards:
+    """The snapshot shared by the requests of one worker, rebuilt when stale"""
+
+    def __init__(self, directory=DIRECTORY, refresh_interval=REFRESH_INTERVAL):
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._loaded = None  # Name of the published snapshot in use
+        self._checked_at = 0.0
+        self._refreshing = False
+        self._retry_at = 0.0  # No background rebuild is started before this (monotonic) time
+
+    def _load_published(self):
+        """Switch to the snapshot named by CURRENT if it is another one; True when one is loaded"""
+        name = _published_name(self.directory)
+        if name is None:
+            return False
+        if name != self._loaded:
+            try:
+                self._snapshot = load(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                return self._snapshot is not None  # Replaced again while loading; next check picks it up
+            self._loaded = name
+        return True
+
+    def _rebuild(self, blocking=True):
+        if not self.directory:
+            self._snapshot = build()
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with _directory_lock(self.directory, blocking) as locked:
+            if not locked:
+                return  # Another worker is rebuilding it
+            # Another worker may have published a fresh one while this one waited
+            if self._load_published() and not self._snapshot.stale(self.refresh_interval):
+                return
+            snapshot = build()
+            publish(snapshot, self.directory)
+            self._load_published()
+
+    def _refresh(self, app):
+        try:
+            with app.app_context():
+                self._rebuild(blocking=False)
+        except Exception:
+            logger.exception('Leaderboard snapshot refresh failed')
+        finally:
+            self._refreshing = False
+
+    def snapshot(self):
+        """The current snapshot; builds the first one, starts a background rebuild of a stale one"""
+        now = time.monotonic()
+        if self.directory and now - self._checked_at >= CHECK_INTERVAL:
+            self._checked_at = now
+            with self._lock:
+                self._load_published()
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._rebuild()
+            return self._snapshot
+
+        snapshot = self._snapshot
+        if snapshot.stale(self.refresh_interval) and now >= self._retry_at:
+            with self._lock:
+                if self._refreshing:
+                    return snapshot
+                self._refreshing = True
+                # After a failure, or while another worker holds the directory lock, wait before trying again
+                self._retry_at = now + CHECK_INTERVAL
+            threading.Thread(target=self._refresh, args=(current_app._get_current_object(),),
+                             name='leaderboard-refresh', daemon=True).start()
+        return snapshot
+
+leaderboards = Leaderboards()
+
+def own_value(user_id, metric, exercise_id, today=None):
+    """A user's current value for a metric, read by primary key; None without one"""
+    if metric in RECORD_METRICS:
+        record = db.session.get(PersonalRecord, (user_id, exercise_id, RECORD_METRICS[metric]))
+        return record.value if record else None
+    query = db.session.query(func.sum(WeeklyExerciseStat.volume)).filter(
+        WeeklyExerciseStat.user_id == user_id,
+        WeeklyExerciseStat.week == progression.week_start(today or progression.utc_today()))
+    if exercise_id != ALL_EXERCISES:
+        query = query.filter(WeeklyExerciseStat.exercise_id == exercise_id)
+    return query.scalar()
+
+def _built_at(snapshot):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(snapshot.built_at))
+
+def get_leaderboard(metric, exercise_id, limit=DEFAULT_LIMIT):
+    """The top `limit` users of a metric and exercise, with their usernames"""
+    snapshot = leaderboards.snapshot()
+    entries, total = snapshot.top(metric, exercise_id, limit)
+    usernames = dict(db.session.query(User.id, User.username).filter(
+        User.id.in_([user_id for _, user_id, _ in entries]))) if entries else {}
+    return {
+        'metric': metric,
+        'exerciseId': exercise_id,
+        'total': total,
+        'builtAt': _built_at(snapshot),
+        # Users deleted since the snapshot was built are left out
+        'entries': [{'rank': rank, 'userId': user_id, 'username': usernames[user_id], 'value': round(value, 2)}
+                    for rank, user_id, value in entries if user_id in usernames]
+    }
+
+def get_rank(user_id, metric, exercise_id):
+    """A user's current value of a metric and where it stands in the snapshot"""
+    snapshot = leaderboards.snapshot()
+    value = own_value(user_id, metric, exercise_id)
+    result = {'metric': metric, 'exerciseId': exercise_id, 'value': None if value is None else round(value, 2),
+              'builtAt': _built_at(snapshot)}
+    result.update(snapshot.rank(metric, exercise_id, value))
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a leaderboard snapshot into LEADERBOARD_DIR')
+    parser.add_argument('--directory', default=DIRECTORY, help='Defaults to LEADERBOARD_DIR')
+    args = parser.parse_args()
+    if not args.directory:
+        parser.error('LEADERBOARD_DIR is not set')
+
+    from app import app
+    started = time.perf_counter()
+    with app.app_context():
+        snapshot = build()
+    os.makedirs(args.directory, exist_ok=True)
+    with _directory_lock(args.directory, blocking=True):
+        name = publish(snapshot, args.directory)
+    rows = sum(len(columns[0]) for columns in snapshot.columns.values())
+    print(f"✓ Published {name}: {rows} rows in {time.perf_counter() - started:.1f}s")
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
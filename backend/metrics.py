@@ -0,0 +1,293 @@
+"""
+Request metrics in Prometheus text format
+Every request records its latency, status, SQL statement count and database time
+(through SQLAlchemy engine events), plus time spent in bcrypt, response bytes
+before and after compression and how long each worker took to boot and to serve
+its first request. Each gunicorn
+worker periodically writes its totals to METRICS_DIR so /api/metrics can add
+them up across workers. Requests slower than SLOW_REQUEST_THRESHOLD are logged
+together with the SQL they ran.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_DIR = os.getenv('METRICS_DIR')
+# Totals of workers that exited, so counters keep counting once their files are gone
+RETIRED_FILE = 'retired.json'
+FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+SLOW_REQUEST_THRESHOLD = float(os.getenv('SLOW_REQUEST_THRESHOLD', '1.0'))  # Seconds
+SLOW_REQUEST_MAX_STATEMENTS = 50
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BOOT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    'http_requests_total': ('counter', 'HTTP requests by route and status'),
+    'http_request_duration_seconds': ('histogram', 'Time until the response headers are sent'),
+    'db_statements_total': ('counter', 'SQL statements executed'),
+    'db_statements_per_request': ('histogram', 'SQL statements executed per request'),
+    'db_time_seconds_total': ('counter', 'Time spent executing SQL statements'),
+    'bcrypt_operations_total': ('counter', 'Password hash/verify operations'),
+    'bcrypt_seconds_total': ('counter', 'Time spent in password hashing, including queue wait'),
+    'http_response_bytes_total': ('counter', 'Response body bytes before compression'),
+    'http_response_sent_bytes_total': ('counter', 'Response body bytes after compression'),
+    'compression_seconds_total': ('counter', 'CPU time spent compressing response bodies'),
+    'worker_boot_seconds': ('histogram', 'Time from worker start until it accepts requests'),
+    'worker_first_request_seconds': ('histogram', 'Time from worker start until its first response'),
+}
+
+class Registry:
+    """Thread-safe counters and histograms of one process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    'buckets': list(buckets), 'counts': [0] * len(buckets), 'sum': 0, 'count': 0
+                }
+            for i, bound in enumerate(histogram['buckets']):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self):
+        """JSON-serializable copy of every series"""
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), dict(h, counts=list(h['counts']))]
+                               for (name, labels), h in self.histograms.items()]
+            }
+
+registry = Registry()
+_process_file = None
+_flushed_at = 0.0
+_flush_lock = threading.Lock()
+_started_at = time.perf_counter()  # Reset by worker_started() in forked workers
+_first_request_lock = threading.Lock()
+_served_first_request = False
+
+def _snapshot_path():
+    global _process_file
+    if _process_file is None:
+        # Unique per process start so a reused pid never overwrites older totals
+        _process_file = os.path.join(METRICS_DIR, f'{os.getpid()}-{time.time_ns()}.json')
+    return _process_file
+
+def flush(force=False):
+    """Write this worker's totals to METRICS_DIR (at most every FLUSH_INTERVAL seconds)"""
+    global _flushed_at
+    if not METRICS_DIR:
+        return
+    now = time.monotonic()
+    if not force and now - _flushed_at < FLUSH_INTERVAL:
+        return
+    # Threads of one worker share the snapshot file; a busy writer means a fresh one is coming
+    if not _flush_lock.acquire(blocking=force):
+        return
+    try:
+        _flushed_at = now
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = _snapshot_path()
+        with open(path + '.tmp', 'w') as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(path + '.tmp', path)
+    finally:
+        _flush_lock.release()
+
+def _load(paths):
+    snapshots = []
+    for path in paths:
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # Missing, or being replaced by its worker right now
+    return snapshots
+
+def _snapshots():
+    """Snapshots of all workers, with this process's taken fresh"""
+    if not METRICS_DIR:
+        return [registry.snapshot()]
+    flush(force=True)
+    return _load(glob.glob(os.path.join(METRICS_DIR, '*.json')))
+
+def worker_exited(pid):
+    """Fold an exited worker's totals into RETIRED_FILE and delete its file (called by
+    gunicorn's child_exit hook in the master), so METRICS_DIR holds one file per live worker"""
+    if not METRICS_DIR:
+        return
+    paths = glob.glob(os.path.join(METRICS_DIR, f'{pid}-*.json'))
+    if not paths:
+        return
+    retired = os.path.join(METRICS_DIR, RETIRED_FILE)
+    counters, histograms = _merge(_load(paths + [retired]))
+    with open(retired + '.tmp', 'w') as f:
+        json.dump({
+            'counters': [[name, [list(pair) for pair in labels], value]
+                         for (name, labels), value in counters.items()],
+            'histograms': [[name, [list(pair) for pair in labels], h]
+                           for (name, labels), h in histograms.items()]
+        }, f)
+    os.replace(retired + '.tmp', retired)
+    # Also a half-written snapshot left by a worker that was killed mid-flush
+    for path in paths + glob.glob(os.path.join(METRICS_DIR, f'{pid}-*.json.tmp')):
+        os.remove(path)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(pairs, extra=()):
+    items = list(pairs) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in items) + '}'
+
+def _merge(snapshots):
+    """Add up the series of several snapshots; returns (counters, histograms) keyed by (name, labels)"""
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, h in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, {
+                'buckets': h['buckets'], 'counts': [0] * len(h['buckets']), 'sum': 0, 'count': 0
+            })
+            merged['counts'] = [a + b for a, b in zip(merged['counts'], h['counts'])]
+            merged['sum'] += h['sum']
+            merged['count'] += h['count']
+    return counters, histograms
+
+def render():
+    """Merge every worker's series and render them in Prometheus text format"""
+    counters, histograms = _merge(_snapshots())
+    lines = []
+    for name, (kind, text) in HELP.items():
+        lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for (series, labels), value in sorted(counters.items()):
+            if series == name:
+                lines.append(f'{name}{_labels(labels)} {value}')
+        for (series, labels), h in sorted(histograms.items()):
+            if series != name:
+                continue
+            for bound, count in zip(h['buckets'], h['counts']):
+                lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {count}')
+            lines.append(f'{name}_bucket{_labels(labels, [("le", "+Inf")])} {h["count"]}')
+            lines.append(f'{name}_sum{_labels(labels)} {h["sum"]}')
+            lines.append(f'{name}_count{_labels(labels)} {h["count"]}')
+    return '\n'.join(lines) + '\n'
+
+def observe_bcrypt(operation, seconds):
+    """Record one password hash/verify (called by passwords.py)"""
+    registry.inc('bcrypt_operations_total', {'operation': operation})
+    registry.inc('bcrypt_seconds_total', {'operation': operation}, seconds)
+
+def observe_compression(labels, raw_bytes, sent_bytes, cpu_seconds):
+    """Record one response body (called by compression.py); labels include the encoding"""
+    registry.inc('http_response_bytes_total', labels, raw_bytes)
+    registry.inc('http_response_sent_bytes_total', labels, sent_bytes)
+    if cpu_seconds:
+        registry.inc('compression_seconds_total', labels, cpu_seconds)
+
+def worker_started():
+    """Mark the start of a worker process (called by gunicorn's post_fork hook)"""
+    global _started_at, _served_first_request
+    _started_at = time.perf_counter()
+    _served_first_request = False
+
+def worker_ready():
+    """Record how long this worker took to boot; returns the seconds"""
+    elapsed = time.perf_counter() - _started_at
+    registry.observe('worker_boot_seconds', {}, elapsed, BOOT_BUCKETS)
+    return elapsed
+
+def _observe_first_request():
+    global _served_first_request
+    with _first_request_lock:
+        if _served_first_request:
+            return None
+        _served_first_request = True
+    elapsed = time.perf_counter() - _started_at
+    registry.observe('worker_first_request_seconds', {}, elapsed, BOOT_BUCKETS)
+    return elapsed
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_started' in g:
+        context._metrics_started = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    if started is None or not has_request_context():
+        return
+    elapsed = time.perf_counter() - started
+    g.metrics_statements += 1
+    g.metrics_db_time += elapsed
+    if len(g.metrics_sql) < SLOW_REQUEST_MAX_STATEMENTS:
+        g.metrics_sql.append((elapsed, statement))
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_statements = 0
+    g.metrics_db_time = 0.0
+    g.metrics_sql = []
+
+def request_labels():
+    """Method and route template of the current request"""
+    return {'method': request.method, 'route': request.url_rule.rule if request.url_rule else 'unmatched'}
+
+def _after_request(response):
+    if 'metrics_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.metrics_started
+    labels = request_labels()
+    route = labels['route']
+
+    registry.inc('http_requests_total', dict(labels, status=response.status_code))
+    registry.observe('http_request_duration_seconds', labels, elapsed, LATENCY_BUCKETS)
+    registry.inc('db_statements_total', labels, g.metrics_statements)
+    registry.observe('db_statements_per_request', labels, g.metrics_statements, STATEMENT_BUCKETS)
+    registry.inc('db_time_seconds_total', labels, g.metrics_db_time)
+    if not _served_first_request:
+        first = _observe_first_request()
+        if first is not None:
+            current_app.logger.info('Worker %d served its first request %.3fs after start (%s %s took %.3fs)',
+                                    os.getpid(), first, request.method, route, elapsed)
+
+    if elapsed >= SLOW_REQUEST_THRESHOLD:
+        statements = '\n'.join(f'  [{seconds * 1000:.1f} ms] {sql}' for seconds, sql in g.metrics_sql)
+        current_app.logger.warning(
+            'Slow request %s %s: %.3fs, %d statements, %.3fs in database\n%s',
+            request.method, request.full_path, elapsed, g.metrics_statements, g.metrics_db_time, statements
+        )
+    flush()
+    return response
+
+def init_app(app):
+    """Instrument every route of a Flask app"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
@@ -1,9 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-import bcrypt
+import passwords
+from replicas import RoutingSession
 
-# Create db instance - will be initialized in app.py
-db = SQLAlchemy()
+# Create db instance - will be initialized in app.py; reads of GET requests may go to a replica
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -18,12 +19,16 @@ class User(db.Model):
     workouts = db.relationship('Workout', back_populates='user', cascade='all, delete-orphan')
     
     def set_password(self, password):
-        """Hash and set password"""
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        """Hash and set password (runs on the bcrypt pool, may raise PasswordPoolBusy)"""
+        self.password_hash = passwords.hash_password(password)
     
     def check_password(self, password):
-        """Check if password matches"""
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        """Check if password matches (runs on the bcrypt pool, may raise PasswordPoolBusy)"""
+        return passwords.verify_password(password, self.password_hash)
+    
+    def password_needs_rehash(self):
+        """Check if the stored hash was made with a different bcrypt cost than configured"""
+        return passwords.needs_rehash(self.password_hash)
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -39,12 +44,62 @@ class Exercise(db.Model):
     image = db.Column(db.String(500))  # Image URL
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('idx_exercises_category', category),
+    )
+    
     # Relationship to workout exercises
     workout_exercises = db.relationship('WorkoutExercise', back_populates='exercise', cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Exercise {self.name}>'
 
+class ExerciseMuscle(db.Model):
+    __tablename__ = 'exercise_muscles'
+    
+    # Normalized muscle groups of an exercise, parsed from its free-text muscle column
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercises.id', ondelete='CASCADE'), primary_key=True)
+    muscle = db.Column(db.String(50), primary_key=True)
+    
+    __table_args__ = (
+        db.Index('idx_exercise_muscles_muscle', muscle, exercise_id),
+    )
+    
+    def __repr__(self):
+        return f'<ExerciseMuscle {self.exercise_id} - {self.muscle}>'
+
+class CatalogVersion(db.Model):
+    __tablename__ = 'catalog_version'
+    
+    # Single row bumped whenever the exercise catalog changes
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CatalogVersion {self.version}>'
+
+class SchemaVersion(db.Model):
+    __tablename__ = 'schema_version'
+    
+    # Single row holding the last migration applied by schema.py
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<SchemaVersion {self.version}>'
+
+class UserShard(db.Model):
+    __tablename__ = 'user_shards'
+    
+    # Directory of the shard holding each user's workout data (shards.py): an index in
+    # DATABASE_SHARD_URLS, or -1 for DATABASE_URL; kept with the users
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    shard = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<UserShard {self.user_id} - {self.shard}>'
+
 class Workout(db.Model):
     __tablename__ = 'workouts'
     
@@ -53,11 +108,22 @@ class Workout(db.Model):
     date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     duration = db.Column(db.Integer)  # Duration in minutes
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # The user's data version (UserDataVersion) of the last change, the delta sync position
+    change_version = db.Column(db.Integer, nullable=False, default=0)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     
+    # A user's history newest first, matching serializers.newest_first, so pages need no sort;
+    # changes since a sync token in version order
+    __table_args__ = (
+        db.Index('idx_workouts_user_date', user_id, date.desc(), id.desc()),
+        db.Index('idx_workouts_user_change', user_id, change_version, id),
+    )
+    
     # Relationships
     user = db.relationship('User', back_populates='workouts')
-    workout_exercises = db.relationship('WorkoutExercise', back_populates='workout', cascade='all, delete-orphan')
+    workout_exercises = db.relationship('WorkoutExercise', back_populates='workout', cascade='all, delete-orphan',
+                                        order_by='(WorkoutExercise.workout_id, WorkoutExercise.id)')
     
     def __repr__(self):
         return f'<Workout {self.name} - {self.date}>'
@@ -73,6 +139,13 @@ class WorkoutExercise(db.Model):
     weight = db.Column(db.Float)  # Weight in kg
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Entries of a workout in id order; exercise_id makes rollup lookups index-only
+    __table_args__ = (
+        db.Index('idx_workout_exercises_workout_entry', workout_id, id, exercise_id),
+        db.Index('idx_workout_exercises_exercise_id', exercise_id),
+    )
     
     # Relationships
     workout = db.relationship('Workout', back_populates='workout_exercises')
@@ -80,3 +153,147 @@ class WorkoutExercise(db.Model):
     
     def __repr__(self):
         return f'<WorkoutExercise {self.workout_id} - {self.exercise_id}>'
+
+class WorkoutTombstone(db.Model):
+    __tablename__ = 'workout_tombstones'
+    
+    # A deleted workout, kept so delta sync can tell clients to drop it; keyed by user as well
+    # because workout ids are only unique within a shard and users move between shards
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    workout_id = db.Column(db.Integer, primary_key=True)
+    change_version = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_workout_tombstones_user_change', user_id, change_version, workout_id),
+    )
+    
+    def __repr__(self):
+        return f'<WorkoutTombstone {self.user_id} - {self.workout_id}>'
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    
+    # Result of a batch operation sent with a client-generated key, replayed when the client retries it
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    key = db.Column(db.String(100), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)  # SHA-256 of the operation, to catch reused keys
+    status = db.Column(db.Integer, nullable=False)
+    response = db.Column(db.Text, nullable=False)  # JSON body of the result
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<IdempotencyKey {self.user_id} - {self.key}>'
+
+class UserDataVersion(db.Model):
+    __tablename__ = 'user_data_versions'
+    
+    # Bumped on every workout write so reads can be answered with 304 Not Modified
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<UserDataVersion {self.user_id} - {self.version}>'
+
+class DailyStat(db.Model):
+    __tablename__ = 'daily_stats'
+    
+    # Per-user-per-day rollup maintained on every workout write
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    workouts = db.Column(db.Integer, nullable=False, default=0)
+    exercises = db.Column(db.Integer, nullable=False, default=0)
+    duration = db.Column(db.Integer, nullable=False, default=0)  # Total minutes
+    
+    def __repr__(self):
+        return f'<DailyStat {self.user_id} - {self.day}>'
+
+class DailyExerciseStat(db.Model):
+    __tablename__ = 'daily_exercise_stats'
+    
+    # How many times a user logged an exercise on a given day
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercises.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<DailyExerciseStat {self.user_id} - {self.day} - {self.exercise_id}>'
+
+class UserStat(db.Model):
+    __tablename__ = 'user_stats'
+    
+    # All-time totals of a user, maintained together with daily_stats
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    workouts = db.Column(db.Integer, nullable=False, default=0)
+    exercises = db.Column(db.Integer, nullable=False, default=0)
+    duration = db.Column(db.Integer, nullable=False, default=0)  # Total minutes
+    
+    def __repr__(self):
+        return f'<UserStat {self.user_id}>'
+
+class ExerciseUsageStat(db.Model):
+    __tablename__ = 'exercise_usage_stats'
+    
+    # How many times a user logged an exercise, all time; maintained together with daily_exercise_stats
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercises.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ExerciseUsageStat {self.user_id} - {self.exercise_id}>'
+
+class WeeklyExerciseStat(db.Model):
+    __tablename__ = 'weekly_exercise_stats'
+    
+    # Per-user-per-exercise totals for the week starting on `week` (a Monday)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercises.id'), primary_key=True)
+    week = db.Column(db.Date, primary_key=True)
+    sessions = db.Column(db.Integer, nullable=False, default=0)  # Workouts that included the exercise
+    sets = db.Column(db.Integer, nullable=False, default=0)
+    reps = db.Column(db.Integer, nullable=False, default=0)
+    volume = db.Column(db.Float, nullable=False, default=0)  # Sum of sets * reps * weight, kg
+    
+    # Every user's totals of one week, read by leaderboard snapshots, and one user's week
+    __table_args__ = (
+        db.Index('idx_weekly_exercise_stats_week', week, user_id),
+    )
+    
+    def __repr__(self):
+        return f'<WeeklyExerciseStat {self.user_id} - {self.exercise_id} - {self.week}>'
+
+class ExerciseSession(db.Model):
+    __tablename__ = 'exercise_sessions'
+    
+    # One exercise within one workout, summarized; records are recomputed from these rows
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercises.id'), primary_key=True)
+    workout_id = db.Column(db.Integer, db.ForeignKey('workouts.id', ondelete='CASCADE'), primary_key=True)
+    date = db.Column(db.DateTime, nullable=False)
+    sets = db.Column(db.Integer, nullable=False, default=0)
+    reps = db.Column(db.Integer, nullable=False, default=0)
+    volume = db.Column(db.Float, nullable=False, default=0)
+    max_weight = db.Column(db.Float, nullable=False, default=0)
+    estimated_1rm = db.Column(db.Float, nullable=False, default=0)
+    max_reps = db.Column(db.Integer, nullable=False, default=0)  # Most reps in one set without added weight
+    
+    def __repr__(self):
+        return f'<ExerciseSession {self.user_id} - {self.exercise_id} - {self.workout_id}>'
+
+class PersonalRecord(db.Model):
+    __tablename__ = 'personal_records'
+    
+    # Best value per user, exercise and kind (max_weight, estimated_1rm, best_volume, max_reps)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercises.id'), primary_key=True)
+    kind = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.Float, nullable=False)
+    # Workout that set the record; no foreign key because the record is recomputed
+    # in the same transaction that deletes that workout
+    workout_id = db.Column(db.Integer, nullable=False)
+    achieved_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<PersonalRecord {self.user_id} - {self.exercise_id} - {self.kind}>'
@@ -0,0 +1,102 @@
+"""
+Password hashing on a dedicated, size-limited bcrypt pool
+bcrypt releases the GIL, so a small thread pool bounds how much CPU hashing can
+take from a worker. When too many hashes are already waiting, new ones are
+rejected with PasswordPoolBusy so callers can answer 503 instead of stalling.
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+import metrics
+
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+POOL_SIZE = int(os.getenv('PASSWORD_POOL_SIZE', '2'))
+# Request threads per worker (gunicorn.conf.py reads the same variable)
+THREADS = int(os.getenv('GUNICORN_THREADS', '4'))
+# Maximum number of hash/verify jobs queued or running before new ones are rejected. Every
+# pending job holds a request thread, so the default keeps at least one thread per worker
+# free for other requests: the pool plus a short queue, below THREADS
+MAX_PENDING = int(os.getenv('PASSWORD_MAX_PENDING', str(max(1, min(POOL_SIZE + 2, THREADS - 1)))))
+RETRY_AFTER = int(os.getenv('PASSWORD_RETRY_AFTER', '1'))
+LATENCY_SAMPLES = 1000
+
+_COST_PATTERN = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+class PasswordPoolBusy(Exception):
+    """Raised when the hashing pool is saturated"""
+
+    def __init__(self, retry_after=RETRY_AFTER):
+        super().__init__('Server is busy, please retry shortly')
+        self.retry_after = retry_after
+
+_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix='bcrypt')
+_lock = threading.Lock()
+_pending = 0
+_rejected = 0
+_latencies = {'hash': deque(maxlen=LATENCY_SAMPLES), 'verify': deque(maxlen=LATENCY_SAMPLES)}
+
+def _run(kind, func, *args):
+    """Run func on the pool, applying admission control and recording latency"""
+    global _pending, _rejected
+    with _lock:
+        if _pending >= MAX_PENDING:
+            _rejected += 1
+            raise PasswordPoolBusy()
+        _pending += 1
+    started = time.perf_counter()
+    try:
+        return _executor.submit(func, *args).result()
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            _pending -= 1
+            _latencies[kind].append(elapsed)
+        metrics.observe_bcrypt(kind, elapsed)
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+def _verify(password, password_hash):
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+def hash_password(password):
+    """Hash a password with the configured cost"""
+    return _run('hash', _hash, password, BCRYPT_ROUNDS)
+
+def verify_password(password, password_hash):
+    """Check a password against a stored hash"""
+    return _run('verify', _verify, password, password_hash)
+
+def needs_rehash(password_hash):
+    """True when a stored hash was made with a different cost than configured"""
+    match = _COST_PATTERN.match(password_hash or '')
+    return not match or int(match.group(1)) != BCRYPT_ROUNDS
+
+def _percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def stats():
+    """Pool state and latency percentiles (seconds, including queue wait)"""
+    with _lock:
+        pending, rejected = _pending, _rejected
+        samples = {kind: list(values) for kind, values in _latencies.items()}
+    return {
+        'rounds': BCRYPT_ROUNDS,
+        'poolSize': POOL_SIZE,
+        'maxPending': MAX_PENDING,
+        'pending': pending,
+        'rejected': rejected,
+        'latency': {kind: {
+            'count': len(values),
+            'p50': _percentile(values, 0.50),
+            'p95': _percentile(values, 0.95),
+            'p99': _percentile(values, 0.99)
+        } for kind, values in samples.items()}
+    }
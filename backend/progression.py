@@ -0,0 +1,351 @@
+"""
+Personal records and progression series per user and exercise
+Workout writes keep three tables current in the same transaction: one summary row
+per exercise per workout (exercise_sessions), additive weekly totals per exercise
+and each user's best max weight, estimated 1RM and session volume per exercise,
+plus the most reps in one set without added weight, so bodyweight exercises
+(logged with weight 0) have a record too.
+Records only rise on writes; when the workout holding one loses value or is
+deleted, that record is recomputed from the user's sessions of that exercise.
+Reading the records of an exercise is a primary key lookup, and its series is
+built with NumPy from one row per week. Days and weeks are UTC, like workout dates.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import delete
+from models import db, Workout, WorkoutExercise, ExerciseSession, WeeklyExerciseStat, PersonalRecord
+from upsert import increment, maximize
+
+DEFAULT_WEEKS = 26
+MAX_WEEKS = 520
+DEFAULT_WINDOW = 4
+MAX_WINDOW = 52
+
+RECORD_KINDS = ('max_weight', 'estimated_1rm', 'best_volume', 'max_reps')
+RECORD_NAMES = {'max_weight': 'maxWeight', 'estimated_1rm': 'estimated1RM', 'best_volume': 'bestVolume',
+                'max_reps': 'maxReps'}
+
+# One exercise's totals and bests within a single workout; max_reps counts sets without weight only
+Session = namedtuple('Session', ['sets', 'reps', 'volume', 'max_weight', 'estimated_1rm', 'max_reps'])
+# What a workout contributes to the progression tables
+WorkoutProgress = namedtuple('WorkoutProgress', ['user_id', 'workout_id', 'date', 'sessions', 'exercise_ids'])
+
+def estimated_1rm(weight, reps):
+    """Epley estimate of the one-rep max for a set"""
+    if not weight or not reps:
+        return 0.0
+    return weight if reps == 1 else weight * (1 + reps / 30)
+
+def utc_today():
+    """Today's date in UTC, the time zone workout dates are stored in"""
+    return datetime.utcnow().date()
+
+def week_start(day):
+    """Monday of the week containing day"""
+    return day - timedelta(days=day.weekday())
+
+def current_week():
+    """Monday of the current UTC week"""
+    return week_start(utc_today())
+
+def workout_progress(user_id, workout_id, when, entries):
+    """Summarize a workout per exercise; entries are (exercise_id, sets, reps, weight) tuples"""
+    sessions = {}
+    exercise_ids = []
+    for exercise_id, sets, reps, weight in entries:
+        exercise_ids.append(exercise_id)
+        sets, reps, weight = sets or 0, reps or 0, weight or 0.0
+        current = sessions.get(exercise_id, Session(0, 0, 0.0, 0.0, 0.0, 0))
+        sessions[exercise_id] = Session(
+            current.sets + sets,
+            current.reps + sets * reps,
+            current.volume + sets * reps * weight,
+            max(current.max_weight, weight),
+            max(current.estimated_1rm, estimated_1rm(weight, reps)),
+            max(current.max_reps, 0 if weight else reps)
+        )
+    return WorkoutProgress(user_id, workout_id, when, sessions, exercise_ids)
+
+def current_progress(workout):
+    """Progress of a workout from its entries as currently held in the session"""
+    return workout_progress(workout.user_id, workout.id, workout.date, [
+        (entry.exercise_id, entry.sets, entry.reps, entry.weight) for entry in workout.workout_exercises
+    ])
+
+def stored_progress(workout):
+    """Progress of a workout as persisted, read with one query before deleting it"""
+    rows = db.session.query(
+        WorkoutExercise.exercise_id, WorkoutExercise.sets, WorkoutExercise.reps, WorkoutExercise.weight
+    ).filter_by(workout_id=workout.id).order_by(WorkoutExercise.id)
+    return workout_progress(workout.user_id, workout.id, workout.date, [tuple(row) for row in rows])
+
+def _session_rows(progress):
+    return [dict(session._asdict(), user_id=progress.user_id, exercise_id=exercise_id,
+                 workout_id=progress.workout_id, date=progress.date)
+            for exercise_id, session in progress.sessions.items()]
+
+def _record_values(session):
+    return {'max_weight': session.max_weight, 'estimated_1rm': session.estimated_1rm,
+            'best_volume': session.volume, 'max_reps': session.max_reps}
+
+def _weekly_deltas(signed_progress):
+    weekly = {}
+    for progress, sign in signed_progress:
+        week = week_start(progress.date.date())
+        for exercise_id, session in progress.sessions.items():
+            deltas = weekly.setdefault((progress.user_id, exercise_id, week),
+                                       {'sessions': 0, 'sets': 0, 'reps': 0, 'volume': 0.0})
+            deltas['sessions'] += sign
+            deltas['sets'] += sign * session.sets
+            deltas['reps'] += sign * session.reps
+            deltas['volume'] += sign * session.volume
+    return weekly
+
+def _best_records(progress_list):
+    """Highest candidate per (user, exercise, kind), so every record row is written once"""
+    best = {}
+    for progress in progress_list:
+        for exercise_id, session in progress.sessions.items():
+            for kind, value in _record_values(session).items():
+                key = (progress.user_id, exercise_id, kind)
+                if value > 0 and (key not in best or value > best[key]['value']):
+                    best[key] = {'user_id': progress.user_id, 'exercise_id': exercise_id, 'kind': kind,
+                                 'value': value, 'workout_id': progress.workout_id,
+                                 'achieved_at': progress.date}
+    return best
+
+def _weakened(old, new):
+    """Exercises whose records old may have held and new no longer backs up"""
+    if new is None or new.date != old.date:
+        return set(old.sessions)
+    weakened = set()
+    for exercise_id, session in old.sessions.items():
+        replacement = new.sessions.get(exercise_id)
+        if replacement is None or any(value > _record_values(replacement)[kind]
+                                      for kind, value in _record_values(session).items()):
+            weakened.add(exercise_id)
+    return weakened
+
+def apply_progress(changes):
+    """Apply (old, new) workout progress pairs; either side may be None
+
+    Call after the workout rows reflect new (flushed or pending, the recompute
+    query autoflushes). Weekly totals get the net change; records are raised by
+    new and recomputed where old held one that new no longer backs up.
+    """
+    changes = list(changes)
+    weekly = _weekly_deltas([(old, -1) for old, _ in changes if old is not None] +
+                            [(new, 1) for _, new in changes if new is not None])
+    increment(WeeklyExerciseStat, ['user_id', 'exercise_id', 'week'], [
+        dict(deltas, user_id=user_id, exercise_id=exercise_id, week=week)
+        for (user_id, exercise_id, week), deltas in weekly.items()
+        if deltas['sessions'] or deltas['sets'] or deltas['reps'] or deltas['volume']
+    ])
+    for user_id, exercise_id, week in {key for key, deltas in weekly.items() if deltas['sessions'] < 0}:
+        WeeklyExerciseStat.query.filter_by(user_id=user_id, exercise_id=exercise_id, week=week).filter(
+            WeeklyExerciseStat.sessions <= 0).delete()
+
+    # Replace each changed workout's session rows
+    sessions = ExerciseSession.__table__
+    inserts = []
+    for old, new in changes:
+        if old is not None and new is not None and old.date == new.date and old.sessions == new.sessions:
+            continue  # Nothing progression tracks has changed
+        if old is not None and old.sessions:
+            db.session.execute(delete(sessions).where(
+                sessions.c.user_id == old.user_id, sessions.c.exercise_id.in_(list(old.sessions)),
+                sessions.c.workout_id == old.workout_id))
+        if new is not None:
+            inserts.extend(_session_rows(new))
+    if inserts:
+        db.session.execute(sessions.insert(), inserts)
+
+    stale = {}
+    for old, new in changes:
+        if old is not None:
+            for exercise_id in _weakened(old, new):
+                stale.setdefault((old.user_id, old.workout_id), set()).add(exercise_id)
+    for (user_id, workout_id), exercise_ids in stale.items():
+        held = {row.exercise_id for row in db.session.query(PersonalRecord.exercise_id).filter(
+            PersonalRecord.user_id == user_id, PersonalRecord.workout_id == workout_id,
+            PersonalRecord.exercise_id.in_(exercise_ids))}
+        if held:
+            _recompute_records(user_id, held)
+
+    maximize(PersonalRecord, ['user_id', 'exercise_id', 'kind'], 'value',
+             list(_best_records([new for _, new in changes if new is not None]).values()))
+
+def _history_rows(user_id=None):
+    """Entries joined with their workouts, grouped by workout"""
+    query = db.session.query(
+        Workout.user_id, Workout.id, Workout.date, WorkoutExercise.exercise_id,
+        WorkoutExercise.sets, WorkoutExercise.reps, WorkoutExercise.weight
+    ).join(WorkoutExercise, WorkoutExercise.workout_id == Workout.id)
+    if user_id is not None:
+        query = query.filter(Workout.user_id == user_id)
+    # Newest first within a user, matching idx_workouts_user_date
+    return query.order_by(Workout.user_id, Workout.date.desc(), Workout.id.desc(),
+                          WorkoutExercise.id).yield_per(1000)
+
+def _iter_history(user_id=None):
+    """Yield the progress of every stored workout, one workout at a time"""
+    current, entries = None, []
+    for row in _history_rows(user_id):
+        if current is not None and current.id != row.id:
+            yield workout_progress(current.user_id, current.id, current.date, entries)
+            entries = []
+        current = row
+        entries.append((row.exercise_id, row.sets, row.reps, row.weight))
+    if current is not None:
+        yield workout_progress(current.user_id, current.id, current.date, entries)
+
+def _row_progress(row):
+    """Progress holding a single stored exercise_sessions row"""
+    session = Session(row.sets, row.reps, row.volume, row.max_weight, row.estimated_1rm, row.max_reps)
+    return WorkoutProgress(row.user_id, row.workout_id, row.date, {row.exercise_id: session}, [row.exercise_id])
+
+def _recompute_records(user_id, exercise_ids):
+    """Replace a user's records for some exercises with the best of their remaining sessions"""
+    rows = ExerciseSession.query.filter(ExerciseSession.user_id == user_id,
+                                        ExerciseSession.exercise_id.in_(exercise_ids))
+    best = _best_records(_row_progress(row) for row in rows)
+    PersonalRecord.query.filter(PersonalRecord.user_id == user_id,
+                                PersonalRecord.exercise_id.in_(exercise_ids)).delete()
+    if best:
+        db.session.execute(PersonalRecord.__table__.insert(), list(best.values()))
+
+SESSION_FIELDS = ('sets', 'reps', 'volume', 'max_weight', 'estimated_1rm', 'max_reps')
+WEEKLY_FIELDS = ('sessions', 'sets', 'reps', 'volume')
+
+def compute_progress(user_id=None):
+    """Recompute sessions, weekly totals and records from the workout tables
+
+    Returns (sessions, weekly, records) dicts keyed like their tables' primary keys.
+    """
+    history = list(_iter_history(user_id))
+    sessions = {(row['user_id'], row['exercise_id'], row['workout_id']): row
+                for progress in history for row in _session_rows(progress)}
+    weekly = _weekly_deltas([(progress, 1) for progress in history])
+    records = _best_records(history)
+    return sessions, weekly, records
+
+def _progress_queries(user_id=None):
+    queries = [ExerciseSession.query, WeeklyExerciseStat.query, PersonalRecord.query]
+    if user_id is not None:
+        queries = [query.filter_by(user_id=user_id) for query in queries]
+    return queries
+
+def _stored_progress(user_id=None):
+    session_query, weekly_query, record_query = _progress_queries(user_id)
+    sessions = {(row.user_id, row.exercise_id, row.workout_id): {
+        name: getattr(row, name) for name in SESSION_FIELDS
+    } for row in session_query}
+    weekly = {(row.user_id, row.exercise_id, row.week): {
+        name: getattr(row, name) for name in WEEKLY_FIELDS
+    } for row in weekly_query}
+    records = {(row.user_id, row.exercise_id, row.kind): {
+        'user_id': row.user_id, 'exercise_id': row.exercise_id, 'kind': row.kind, 'value': row.value,
+        'workout_id': row.workout_id, 'achieved_at': row.achieved_at
+    } for row in record_query}
+    return sessions, weekly, records
+
+def _same(expected, stored, fields):
+    if expected is None or stored is None:
+        return expected is stored
+    return all(abs(expected[name] - stored[name]) < 1e-6 for name in fields)
+
+def _drift(expected, stored, fields):
+    return [key for key in expected.keys() | stored.keys()
+            if not _same(expected.get(key), stored.get(key), fields)]
+
+def check_progress(user_id=None):
+    """Compare stored progression rows with recomputed ones; returns mismatching keys"""
+    expected_sessions, expected_weekly, expected_records = compute_progress(user_id)
+    stored_sessions, stored_weekly, stored_records = _stored_progress(user_id)
+    # A tie may be held by a different workout, so only record values are compared
+    return (_drift(expected_sessions, stored_sessions, SESSION_FIELDS) +
+            _drift(expected_weekly, stored_weekly, WEEKLY_FIELDS) +
+            _drift(expected_records, stored_records, ('value',)))
+
+def rebuild_progress(user_id=None):
+    """Replace progression rows with ones recomputed from the workout tables; caller commits"""
+    sessions, weekly, records = compute_progress(user_id)
+    for query in _progress_queries(user_id):
+        query.delete()
+
+    if sessions:
+        db.session.execute(ExerciseSession.__table__.insert(), list(sessions.values()))
+    if weekly:
+        db.session.execute(WeeklyExerciseStat.__table__.insert(), [
+            dict(values, user_id=uid, exercise_id=exercise_id, week=week)
+            for (uid, exercise_id, week), values in weekly.items()
+        ])
+    if records:
+        db.session.execute(PersonalRecord.__table__.insert(), list(records.values()))
+    return len(sessions), len(weekly), len(records)
+
+def serialize_records(rows):
+    """Group record rows by exercise in their API representation"""
+    by_exercise = {}
+    for row in rows:
+        entry = by_exercise.setdefault(row.exercise_id, {'exerciseId': row.exercise_id})
+        entry[RECORD_NAMES[row.kind]] = {
+            'value': round(row.value, 2),
+            'workoutId': row.workout_id,
+            'date': row.achieved_at
+        }
+    return list(by_exercise.values())
+
+def get_records(user_id, exercise_id=None):
+    """A user's records, for all exercises or one (a primary key range lookup)"""
+    query = PersonalRecord.query.filter_by(user_id=user_id)
+    if exercise_id is not None:
+        query = query.filter_by(exercise_id=exercise_id)
+    return serialize_records(query.order_by(PersonalRecord.exercise_id, PersonalRecord.kind))
+
+def get_series(user_id, exercise_id, weeks=DEFAULT_WEEKS, window=DEFAULT_WINDOW, today=None):
+    """Weekly totals for the last `weeks` weeks with a moving average of volume
+
+    Reads at most one row per week and fills the gaps with NumPy.
+    """
+    import numpy as np  # Deferred: only progression reads need it
+
+    last = week_start(today) if today else current_week()
+    first = last - timedelta(weeks=weeks - 1)
+    rows = db.session.query(
+        WeeklyExerciseStat.week, WeeklyExerciseStat.sessions, WeeklyExerciseStat.sets,
+        WeeklyExerciseStat.reps, WeeklyExerciseStat.volume
+    ).filter(
+        WeeklyExerciseStat.user_id == user_id,
+        WeeklyExerciseStat.exercise_id == exercise_id,
+        WeeklyExerciseStat.week >= first,
+        WeeklyExerciseStat.week <= last  # Workouts dated in a future week are left out
+    ).all()
+
+    # Pack the sparse rows into dense per-week arrays
+    packed = np.array([((row.week - first).days // 7, row.sessions, row.sets, row.reps, row.volume)
+                       for row in rows], dtype=float).reshape(-1, 5)
+    index = packed[:, 0].astype(np.intp)
+    columns = np.zeros((4, weeks))
+    columns[:, index] = packed[:, 1:].T
+    sessions, sets, reps, volume = columns
+
+    # Trailing moving average; the first weeks average over the weeks available so far
+    totals = np.cumsum(np.concatenate(([0.0], volume)))
+    counts = np.minimum(np.arange(1, weeks + 1), window)
+    average = (totals[1:] - totals[np.arange(1, weeks + 1) - counts]) / counts
+
+    starts = [first + timedelta(weeks=i) for i in range(weeks)]
+    return {
+        'exerciseId': exercise_id,
+        'window': window,
+        'weeks': [{
+            'week': starts[i],
+            'sessions': int(sessions[i]),
+            'sets': int(sets[i]),
+            'reps': int(reps[i]),
+            'volume': round(float(volume[i]), 2),
+            'volumeAverage': round(float(average[i]), 2)
+        } for i in range(weeks)],
+        'totalVolume': round(float(volume.sum()), 2)
+    }
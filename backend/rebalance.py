@@ -0,0 +1,301 @@
+"""
+Shard rebalancing script
+Run this script to see how users are spread over the databases of
+DATABASE_SHARD_URLS (shards.py) and to move users between them, one at a time
+or as a greedy plan that evens out the number of workouts per shard. Meant for
+maintenance windows: a move copies the user's rows to the target, switches the
+user_shards directory, waits SHARD_CACHE_TTL seconds for every worker to see it
+and only then deletes the old copy. A balance plan switches --batch-size users
+before each wait, so it waits once per batch rather than once per user. A write that reaches the old shard during
+the move is detected from the user's data version; the move is then undone, or,
+once the directory was switched, both copies are kept for a manual look.
+
+Workouts get new ids on the target shard. Every moved workout is stamped with a
+new data version and the old ids get tombstones, so delta sync clients replace
+their copies on the next sync. Stored batch results (idempotency_keys) that name
+a workout by id are rewritten to the new id; those holding a whole workout, with
+its entry ids, are dropped, so such a retry runs again instead of replaying ids
+that no longer exist.
+"""
+import argparse
+import json
+import time
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import delete, func, insert, select
+from app import app
+from models import db, UserShard
+import shards
+
+DEFAULT_BATCH_SIZE = 50
+
+# A user switched to its new shard whose old copy is not deleted yet
+Move = namedtuple('Move', ['user_id', 'source', 'target', 'version'])
+
+class MoveConflict(RuntimeError):
+    """The user's data changed on the old shard while it was being moved"""
+
+def _table(name):
+    return db.metadata.tables[name]
+
+def _engine(database):
+    with shards.using(database):
+        return shards.engine()
+
+def _label(database):
+    return 'DATABASE_URL' if database == shards.GLOBAL else f'shard {database}'
+
+def _version(connection, user_id, lock=False):
+    """A user's data version; lock keeps the row (and so the user's writes) locked until commit"""
+    versions = _table('user_data_versions')
+    query = select(versions.c.version).where(versions.c.user_id == user_id)
+    return connection.execute(query.with_for_update() if lock else query).scalar() or 0
+
+def _user_rows(table, user_id):
+    """Select a user's rows of a sharded table; entries through the user's workouts"""
+    if table.name == 'workout_exercises':
+        workouts = _table('workouts')
+        return select(table).where(table.c.workout_id.in_(
+            select(workouts.c.id).where(workouts.c.user_id == user_id))).order_by(table.c.id)
+    query = select(table).where(table.c.user_id == user_id)
+    return query.order_by(table.c.id) if table.name == 'workouts' else query
+
+def read_user(connection, user_id):
+    """Every row of a user's workout data, by table name"""
+    return {name: [dict(row._mapping) for row in connection.execute(_user_rows(_table(name), user_id))]
+            for name in shards.SHARDED_TABLES}
+
+def delete_user(connection, user_id):
+    """Delete a user's workout data, children before the workouts they reference"""
+    workouts, entries = _table('workouts'), _table('workout_exercises')
+    connection.execute(delete(entries).where(entries.c.workout_id.in_(
+        select(workouts.c.id).where(workouts.c.user_id == user_id))))
+    for name in shards.SHARDED_TABLES - {'workouts', 'workout_exercises'}:
+        table = _table(name)
+        connection.execute(delete(table).where(table.c.user_id == user_id))
+    connection.execute(delete(workouts).where(workouts.c.user_id == user_id))
+
+def _remap_keys(rows, new_ids):
+    """Stored batch results valid on the target: ids of created workouts are mapped to their
+    new ids; results holding a whole workout (patch) are dropped"""
+    kept = []
+    for row in rows:
+        body = json.loads(row['response'])
+        if isinstance(body, dict) and set(body) <= {'id', 'message'}:
+            if 'id' in body:
+                body['id'] = new_ids.get(body['id'], body['id'])
+            kept.append(dict(row, response=json.dumps(body, separators=(',', ':'))))
+    return kept
+
+def copy_user(connection, user_id, data, version):
+    """Insert rows read by read_user with new workout ids, all stamped with version"""
+    now = datetime.utcnow()
+    workouts = _table('workouts')
+    new_ids = {}
+    if data['workouts']:
+        rows = [{column: value for column, value in row.items() if column != 'id'} for row in data['workouts']]
+        for row in rows:
+            row['change_version'] = version
+        result = connection.execute(
+            insert(workouts).returning(workouts.c.id, sort_by_parameter_order=True), rows)
+        new_ids = dict(zip((row['id'] for row in data['workouts']), result.scalars()))
+
+    remapped = {
+        'workout_exercises': [{column: value for column, value in row.items() if column != 'id'}
+                              for row in data['workout_exercises']],
+        'exercise_sessions': [dict(row) for row in data['exercise_sessions']],
+        'personal_records': [dict(row) for row in data['personal_records']],
+    }
+    for rows in remapped.values():
+        for row in rows:
+            row['workout_id'] = new_ids.get(row['workout_id'], row['workout_id'])
+
+    # Tombstones for the old ids tell synced clients to drop them; an old id that is also
+    # a new one is replaced by the upsert instead
+    tombstones = {row['workout_id']: row for row in data['workout_tombstones']}
+    for old_id in set(new_ids) - set(new_ids.values()):
+        tombstones[old_id] = {'user_id': user_id, 'workout_id': old_id, 'change_version': version, 'deleted_at': now}
+
+    rows_by_table = dict(data, **remapped)
+    rows_by_table['workout_tombstones'] = list(tombstones.values())
+    rows_by_table['idempotency_keys'] = _remap_keys(data['idempotency_keys'], new_ids)
+    rows_by_table['user_data_versions'] = [{'user_id': user_id, 'version': version, 'updated_at': now}]
+    for name, rows in rows_by_table.items():
+        if name != 'workouts' and rows:
+            connection.execute(insert(_table(name)), rows)
+
+def start_move(user_id, target):
+    """Copy a user's workout data to a shard and switch the directory to it
+
+    Returns the Move to finish once every worker sees the switch, or None when
+    the user is already there. Raises MoveConflict when the user wrote during the copy.
+    """
+    source = shards.canonical(shards.shard_for(user_id, cached=False))
+    target = shards.canonical(target)
+    if source == target:
+        return None
+    source_engine, target_engine = _engine(source), _engine(target)
+
+    with source_engine.connect() as connection:
+        version = _version(connection, user_id)
+        data = read_user(connection, user_id)
+    with target_engine.begin() as connection:
+        delete_user(connection, user_id)  # A copy left by an interrupted move
+        copy_user(connection, user_id, data, version + 1)
+    with source_engine.connect() as connection:
+        changed = _version(connection, user_id) != version
+    if changed:
+        with target_engine.begin() as connection:
+            delete_user(connection, user_id)
+        raise MoveConflict(f'User {user_id} wrote workouts during the copy; nothing was moved, try again')
+
+    db.session.merge(UserShard(user_id=user_id, shard=target))
+    db.session.commit()
+    return Move(user_id, source, target, version)
+
+def finish_move(move):
+    """Delete the old copy of a started move once no worker uses the old shard any more
+
+    Raises MoveConflict when the user wrote to the old shard after the switch. The
+    check and the delete share one transaction holding the user's version row
+    locked, so no write can land on the old shard between them.
+    """
+    with _engine(move.source).begin() as connection:
+        if _version(connection, move.user_id, lock=True) != move.version:
+            raise MoveConflict(f'User {move.user_id} wrote workouts to {_label(move.source)} after the switch; '
+                               f'both copies were kept, compare them before deleting the one on {_label(move.source)}')
+        delete_user(connection, move.user_id)
+
+def move_user(user_id, target, wait=shards.CACHE_TTL):
+    """Move a user's workout data to a shard; returns False when it is already there
+
+    Raises MoveConflict when the user wrote to the old shard during the move.
+    """
+    move = start_move(user_id, target)
+    if move is None:
+        return False
+    time.sleep(wait)  # Workers keep the old shard cached for up to SHARD_CACHE_TTL seconds
+    finish_move(move)
+    return True
+
+def move_users(moves, wait=shards.CACHE_TTL, batch_size=DEFAULT_BATCH_SIZE):
+    """Move (user id, target) pairs, switching up to batch_size users before each wait
+
+    Yields (user id, target, outcome) per user in order of completion: True when
+    moved, False when already there, or the MoveConflict that stopped the move.
+    """
+    moves = list(moves)
+    for start in range(0, len(moves), batch_size):
+        started = []
+        for user_id, target in moves[start:start + batch_size]:
+            try:
+                move = start_move(user_id, target)
+            except MoveConflict as e:
+                yield user_id, target, e
+                continue
+            if move is None:
+                yield user_id, target, False
+            else:
+                started.append(move)
+        if not started:
+            continue
+        time.sleep(wait)  # Once for the whole batch: workers see every switch within SHARD_CACHE_TTL
+        for move in started:
+            try:
+                finish_move(move)
+            except MoveConflict as e:
+                yield move.user_id, move.target, e
+                continue
+            yield move.user_id, move.target, True
+
+def workout_counts():
+    """{database: {user id: workouts}} for every user with workout data"""
+    counts = {}
+    for database in shards.databases():
+        workouts, versions = _table('workouts'), _table('user_data_versions')
+        with _engine(database).connect() as connection:
+            users = {row.user_id: 0 for row in connection.execute(select(versions.c.user_id))}
+            users.update(connection.execute(
+                select(workouts.c.user_id, func.count()).group_by(workouts.c.user_id)).all())
+        counts[database] = users
+    return counts
+
+def plan_balance(counts):
+    """Greedy list of (user id, source, target) moves evening out workouts per shard
+
+    Users on DATABASE_URL when it is not one of the shards are all moved off it.
+    """
+    targets = sorted({shards.canonical(shard) for shard in range(len(shards.SHARD_URLS))})
+    users = {database: dict(counts.get(database, {})) for database in set(counts) | set(targets)}
+    load = {database: sum(users[database].values()) for database in users}
+    moves = []
+    for database in set(users) - set(targets):
+        for user_id, workouts in sorted(users.pop(database).items(), key=lambda item: -item[1]):
+            target = min(targets, key=lambda shard: load[shard])
+            moves.append((user_id, database, target))
+            users[target][user_id] = workouts
+            load[target] += workouts
+    while True:
+        heavy = max(targets, key=lambda shard: load[shard])
+        light = min(targets, key=lambda shard: load[shard])
+        # Only moves that shrink the gap between the two, the largest first
+        candidates = [(workouts, user_id) for user_id, workouts in users[heavy].items()
+                      if 0 < workouts < load[heavy] - load[light]]
+        if not candidates:
+            return moves
+        workouts, user_id = max(candidates)
+        moves.append((user_id, heavy, light))
+        users[light][user_id] = users[heavy].pop(user_id)
+        load[heavy] -= workouts
+        load[light] += workouts
+
+def main():
+    parser = argparse.ArgumentParser(description='Show or change which shard holds each user')
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--status', action='store_true', help='Users and workouts per database')
+    action.add_argument('--move', type=int, metavar='USER_ID', help='Move one user, with --to')
+    action.add_argument('--balance', action='store_true', help='Even out workouts across the shards')
+    parser.add_argument('--to', type=int, metavar='SHARD', help='Index in DATABASE_SHARD_URLS')
+    parser.add_argument('--dry-run', action='store_true', help='With --balance, print the plan only')
+    parser.add_argument('--wait', type=float, default=shards.CACHE_TTL,
+                        help='Seconds between switching a user and deleting the old copy '
+                             '(default SHARD_CACHE_TTL; 0 when the app is stopped)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'With --balance, users switched before each wait (default {DEFAULT_BATCH_SIZE})')
+    args = parser.parse_args()
+    if args.batch_size < 1:
+        parser.error('--batch-size must be at least 1')
+
+    if not shards.SHARD_URLS:
+        parser.error('DATABASE_SHARD_URLS is not set')
+    with app.app_context():
+        if args.status:
+            for database, users in workout_counts().items():
+                print(f"{_label(database)}: {len(users)} users, {sum(users.values())} workouts")
+            return 0
+
+        if args.move is not None:
+            if args.to is None or not 0 <= args.to < len(shards.SHARD_URLS):
+                parser.error(f'--to must be a shard index between 0 and {len(shards.SHARD_URLS) - 1}')
+            moves = [(args.move, None, args.to)]
+        else:
+            moves = plan_balance(workout_counts())
+            print(f"Balancing needs {len(moves)} moves")
+
+        if args.dry_run:
+            for user_id, source, target in moves:
+                print(f"  user {user_id}: {_label(source)} -> {_label(target)}")
+            return 0
+
+        failures = 0
+        for user_id, target, outcome in move_users([(user_id, target) for user_id, _, target in moves],
+                                                   wait=args.wait, batch_size=args.batch_size):
+            if isinstance(outcome, MoveConflict):
+                failures += 1
+                print(f"✗ {outcome}")
+                continue
+            print(f"✓ User {user_id} {'moved to' if outcome else 'already on'} {_label(shards.canonical(target))}")
+        return 1 if failures else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
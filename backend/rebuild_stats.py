@@ -0,0 +1,53 @@
+"""
+Statistics rollup rebuild script
+Run this script to recompute daily_stats/daily_exercise_stats, their all-time
+totals (user_stats/exercise_usage_stats) and the progression tables
+(weekly_exercise_stats/personal_records) from the workout tables, either to
+backfill them or to check them for drift. With sharding (shards.py) each
+database is processed in turn, or only the shard of --user-id.
+"""
+import argparse
+from app import app
+from models import db
+from stats import check_rollups, rebuild_rollups
+from progression import check_progress, rebuild_progress
+import shards
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild or verify workout statistics rollups')
+    parser.add_argument('--user-id', type=int, help='Only process this user')
+    parser.add_argument('--check', action='store_true',
+                        help='Report drift between stored and recomputed rollups without writing')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all(bind_key=None)
+        if args.user_id is not None:
+            databases = [shards.shard_for(args.user_id, cached=False)]
+        else:
+            databases = shards.databases()
+        drift = []
+        for database in databases:
+            with shards.using(database):
+                if args.check:
+                    drift += check_rollups(args.user_id) + check_progress(args.user_id)
+                    continue
+                if len(databases) > 1:
+                    print(f"Database {'DATABASE_URL' if database == shards.GLOBAL else f'shard {database}'}:")
+                print("Rebuilding statistics rollups...")
+                days, exercise_days = rebuild_rollups(args.user_id)
+                db.session.commit()
+                print(f"✓ Wrote {days} daily rows and {exercise_days} daily exercise rows")
+                print("Rebuilding progression tables...")
+                sessions, weeks, records = rebuild_progress(args.user_id)
+                db.session.commit()
+                print(f"✓ Wrote {sessions} exercise sessions, {weeks} weekly exercise rows and {records} personal records")
+        if args.check:
+            for key in drift:
+                print(f"✗ Rollup mismatch: {key}")
+            print(f"✓ Found {len(drift)} mismatching rollup rows")
+            return 1 if drift else 0
+        return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
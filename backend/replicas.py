@@ -0,0 +1,212 @@
+"""
+Read replica routing
+With DATABASE_READ_URLS set (comma-separated URLs), the SELECTs of GET and HEAD
+requests go to the replicas, one replica per request, picked round-robin among
+the healthy ones. Everything else uses DATABASE_URL: writes, flushes, requests
+outside a request context (migrations, warm-up), routes marked @primary and,
+for READ_YOUR_WRITES_WINDOW seconds after a successful write, the reads of the
+user who made it, so nobody misses their own change while the replicas catch
+up. The window is kept in-process per user and handed to the client, which
+carries it to the other gunicorn workers: as the X-Read-Primary-Until response
+header, which the frontend echoes back on its next requests (exposed through
+CORS, so it works when the API is on another origin), and as a cookie for
+same-origin clients that do not echo it. The value is only a routing hint: a
+forged one sends reads to the primary and nothing more.
+
+Each replica is checked (SELECT 1, plus replay lag on PostgreSQL) at most every
+REPLICA_CHECK_INTERVAL seconds before it is used; a failing replica, or one
+whose connection breaks mid-query, is skipped until the next check. With no
+healthy replica the primary serves the read.
+
+Locally two SQLite files work as primary and replica: python -m
+benchmarks.replicas copies one into the other and checks the routing.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from auth_cache import TTLCache
+import shards
+
+logger = logging.getLogger(__name__)
+
+READ_URLS = [url.strip() for url in os.getenv('DATABASE_READ_URLS', '').split(',') if url.strip()]
+READ_YOUR_WRITES_WINDOW = float(os.getenv('READ_YOUR_WRITES_WINDOW', '5'))  # Seconds
+CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', '5'))  # Seconds
+MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', '10'))  # Seconds of replay lag, PostgreSQL only
+
+SAFE_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+STICKY_COOKIE = 'read_primary_until'
+STICKY_HEADER = 'X-Read-Primary-Until'
+BIND_PREFIX = 'replica_'
+
+# 0 on the primary or a replica that replayed everything it received; NULL before any replay
+POSTGRES_LAG = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+# View functions that always read from the primary
+PRIMARY_VIEWS = set()
+
+# user id -> True while the user's reads stick to the primary
+recent_writers = TTLCache(ttl=READ_YOUR_WRITES_WINDOW)
+
+def pool_options(prefix):
+    """pool_size/max_overflow from <prefix>_POOL_SIZE and <prefix>_MAX_OVERFLOW, when set"""
+    options = {}
+    for option in ('pool_size', 'max_overflow'):
+        value = os.getenv(f'{prefix}_{option.upper()}')
+        if value:
+            options[option] = int(value)
+    return options
+
+def configure(app):
+    """Add the replica binds and per-engine pool sizes to the config; call before db.init_app
+
+    DATABASE_POOL_SIZE/DATABASE_MAX_OVERFLOW size the primary pool and
+    DATABASE_READ_POOL_SIZE/DATABASE_READ_MAX_OVERFLOW each replica's.
+    """
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {}).update(pool_options('DATABASE'))
+    read_options = pool_options('DATABASE_READ')
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    for index, url in enumerate(READ_URLS):
+        binds[f'{BIND_PREFIX}{index}'] = dict(read_options, url=url)
+
+def primary(f):
+    """Route decorator: a read that must see the primary, e.g. right before writing"""
+    PRIMARY_VIEWS.add(f)
+    return f
+
+class ReplicaSet:
+    """Round-robin over the replica engines, skipping the ones failing their health check"""
+
+    def __init__(self, keys):
+        self.keys = list(keys)
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self._checked_at = {}    # key -> monotonic time of the last check
+        self._healthy = {}       # key -> result of the last check
+
+    def choose(self, engines):
+        """Key of the next healthy replica, or None when none is"""
+        for _ in range(len(self.keys)):
+            key = self.keys[next(self._next) % len(self.keys)]
+            if self._is_healthy(key, engines[key]):
+                return key
+        return None
+
+    def _is_healthy(self, key, engine):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at.get(key, float('-inf')) < CHECK_INTERVAL:
+                return self._healthy[key]
+            # Claim the check so concurrent requests keep using the last result meanwhile
+            self._checked_at[key] = now
+            self._healthy.setdefault(key, True)
+        healthy = check(engine)
+        with self._lock:
+            if self._healthy[key] != healthy:
+                logger.warning('Read replica %s is %s', key, 'healthy again' if healthy else 'unhealthy')
+            self._healthy[key] = healthy
+        return healthy
+
+    def mark_unhealthy(self, key):
+        """Skip a replica until its next check, e.g. after its connection broke"""
+        with self._lock:
+            self._checked_at[key] = time.monotonic()
+            self._healthy[key] = False
+
+    def status(self):
+        with self._lock:
+            return {key: self._healthy.get(key, True) for key in self.keys}
+
+replica_set = ReplicaSet(f'{BIND_PREFIX}{index}' for index in range(len(READ_URLS)))
+
+def check(engine):
+    """True when a replica answers and, on PostgreSQL, is less than MAX_LAG seconds behind"""
+    try:
+        with engine.connect() as connection:
+            if engine.dialect.name == 'postgresql':
+                lag = connection.execute(POSTGRES_LAG).scalar()
+                return lag is None or float(lag) <= MAX_LAG
+            connection.execute(text('SELECT 1'))
+            return True
+    except Exception as e:
+        logger.warning('Read replica check failed: %s', e)
+        return False
+
+def _until(value):
+    """Epoch seconds of a sticky header or cookie; 0 when missing or malformed"""
+    try:
+        return float(value or 0)
+    except ValueError:
+        return 0
+
+def _sticky():
+    """True while the current request's user has written recently"""
+    until = max(_until(request.headers.get(STICKY_HEADER)), _until(request.cookies.get(STICKY_COOKIE)))
+    if until > time.time():
+        return True
+    user_id = g.get('user_id')
+    return user_id is not None and recent_writers.get(user_id) is not None
+
+def _read_bind(engines):
+    """Replica engine for a read in the current request, or None for the primary"""
+    if not replica_set.keys or not has_request_context() or request.method not in SAFE_METHODS:
+        return None
+    key = g.get('replica_key', False)
+    if key is False:
+        if current_app.view_functions.get(request.endpoint) in PRIMARY_VIEWS:
+            key = None
+        else:
+            key = replica_set.choose(engines)
+        g.replica_key = key
+    # Checked per statement: token_required learns the user after the request started
+    if key is None or _sticky():
+        return None
+    return engines[key]
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session sending statements on workout data to the user's shard
+    and the reads of GET requests to a replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            engine = shards.bind_for(self._db.engines, mapper, clause)
+            # The replicas copy DATABASE_URL only; a shard of its own serves its reads too
+            if engine is not None and engine is not self._db.engines[None]:
+                return engine
+        if bind is None and not self._flushing and getattr(clause, 'is_select', False):
+            engine = _read_bind(self._db.engines)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def _after_request(response):
+    if replica_set.keys and request.method not in SAFE_METHODS and response.status_code < 400:
+        until = time.time() + READ_YOUR_WRITES_WINDOW
+        user_id = g.get('user_id')
+        if user_id is not None:
+            recent_writers.set(user_id, True)
+        response.headers[STICKY_HEADER] = f'{until:.3f}'
+        response.set_cookie(STICKY_COOKIE, f'{until:.3f}', max_age=int(READ_YOUR_WRITES_WINDOW) + 1,
+                            httponly=True, samesite='Lax')
+    return response
+
+def init_app(app, db):
+    """Route reads to the replicas and watch their connections for failures"""
+    app.after_request(_after_request)
+    with app.app_context():
+        for key in replica_set.keys:
+            event.listen(db.engines[key], 'handle_error', _on_error(key))
+
+def _on_error(key):
+    def handle_error(context):
+        if context.is_disconnect:
+            replica_set.mark_unhealthy(key)
+    return handle_error
@@ -0,0 +1,271 @@
+"""
+Schema versioning, migrations and catalog seeding
+A single schema_version row records the last migration applied, so workers can
+tell whether the database is up to date with one primary key lookup instead of
+inspecting every table. Migrations and seeding are idempotent and meant to run
+once per deploy (python init_db.py), not on every process start. With sharding
+(shards.py) every shard has its own schema_version row and is migrated after
+DATABASE_URL; shards only get the tables of workout data.
+"""
+import logging
+from sqlalchemy import select, insert, update, delete, bindparam, text, inspect
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from models import db, Exercise, ExerciseMuscle, SchemaVersion, Workout, WorkoutExercise, WorkoutTombstone
+from catalog import catalog, bump_version, sync_muscles
+import progression
+import stats
+import shards
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_ID = 1
+
+EXERCISES = [
+    {'name': 'Push-ups', 'category': 'Chest', 'muscle': 'Chest, Triceps',
+     'description': 'Classic bodyweight exercise for upper body strength',
+     'image': 'https://images.unsplash.com/photo-1571019613454-1cb2f99b2d8b?w=400&h=300&fit=crop'},
+    {'name': 'Squats', 'category': 'Legs', 'muscle': 'Quadriceps, Glutes',
+     'description': 'Fundamental lower body exercise',
+     'image': 'https://images.unsplash.com/photo-1549060279-7e168fcee0c2?w=400&h=300&fit=crop'},
+    {'name': 'Pull-ups', 'category': 'Back', 'muscle': 'Lats, Biceps',
+     'description': 'Upper body pulling exercise',
+     'image': 'https://images.unsplash.com/photo-1517836357463-d25dfeac3438?w=400&h=300&fit=crop'},
+    {'name': 'Deadlifts', 'category': 'Back', 'muscle': 'Hamstrings, Glutes, Back',
+     'description': 'Compound movement for posterior chain',
+     'image': 'https://images.unsplash.com/photo-1517836357463-d25dfeac3438?w=400&h=300&fit=crop'},
+    {'name': 'Bench Press', 'category': 'Chest', 'muscle': 'Chest, Shoulders, Triceps',
+     'description': 'Classic chest building exercise',
+     'image': 'https://images.unsplash.com/photo-1571019613454-1cb2f99b2d8b?w=400&h=300&fit=crop'},
+    {'name': 'Plank', 'category': 'Core', 'muscle': 'Abs, Core',
+     'description': 'Isometric core strengthening exercise',
+     'image': 'https://images.unsplash.com/photo-1571019613454-1cb2f99b2d8b?w=400&h=300&fit=crop'},
+    {'name': 'Lunges', 'category': 'Legs', 'muscle': 'Quadriceps, Glutes',
+     'description': 'Unilateral leg exercise',
+     'image': 'https://images.unsplash.com/photo-1549060279-7e168fcee0c2?w=400&h=300&fit=crop'},
+    {'name': 'Shoulder Press', 'category': 'Shoulders', 'muscle': 'Deltoids, Triceps',
+     'description': 'Overhead pressing movement',
+     'image': 'https://images.unsplash.com/photo-1571019613454-1cb2f99b2d8b?w=400&h=300&fit=crop'},
+]
+SEED_FIELDS = ('category', 'muscle', 'description', 'image')
+
+def _on_shard():
+    """True while migrating a shard other than DATABASE_URL"""
+    return shards.pinned() not in (None, shards.GLOBAL)
+
+def _create_all():
+    # The primary or a shard's tables only: replica binds (replicas.py) are read-only copies
+    if _on_shard():
+        shards.create_tables(db.metadata)
+    else:
+        db.create_all(bind_key=None)
+
+def _engine():
+    """Engine of the database being migrated"""
+    return shards.engine() if _on_shard() else db.engine
+
+def _create_tables():
+    _create_all()
+
+def _execute_ddl(statements):
+    """Run DDL on its own autocommit connection
+
+    On PostgreSQL indexes are built and dropped CONCURRENTLY so workouts can still
+    be written while a deploy migrates a large table.
+    """
+    engine = _engine()
+    concurrently = engine.dialect.name == 'postgresql'
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        for statement in statements:
+            if concurrently:
+                statement = statement.replace(' INDEX ', ' INDEX CONCURRENTLY ', 1)
+            connection.execute(text(statement))
+
+def _history_indexes():
+    # Same statements as supabase_setup.sql; the composite indexes replace the single-column ones
+    _execute_ddl([
+        'CREATE INDEX IF NOT EXISTS idx_workouts_user_date ON workouts (user_id, date DESC, id DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_workout_exercises_workout_entry '
+        'ON workout_exercises (workout_id, id, exercise_id)',
+        'CREATE INDEX IF NOT EXISTS idx_workout_exercises_exercise_id ON workout_exercises (exercise_id)',
+        'DROP INDEX IF EXISTS idx_workouts_user_id',
+        'DROP INDEX IF EXISTS idx_workout_exercises_workout_id',
+    ])
+
+def _progression_tables():
+    # Existing workouts are backfilled in the deploy's transaction
+    _create_all()
+    progression.rebuild_progress()
+
+def _exercise_search():
+    # Normalized muscle groups for every existing exercise, plus the category index
+    if _on_shard():
+        return  # The catalog is global
+    db.create_all(bind_key=None)
+    _execute_ddl(['CREATE INDEX IF NOT EXISTS idx_exercises_category ON exercises (category)'])
+    db.session.execute(delete(ExerciseMuscle.__table__))
+    sync_muscles(db.session.execute(select(Exercise.id, Exercise.muscle)))
+    bump_version()
+
+def _missing_columns(table, columns):
+    """The columns a table does not have yet, so ALTER TABLE can be re-run"""
+    existing = {column['name'] for column in inspect(_engine()).get_columns(table)}
+    return [column for column in columns if column not in existing]
+
+def _delta_sync():
+    # Adding a column with a constant default does not rewrite the table. Existing workouts
+    # keep change version 0, which a sync without a token still returns
+    columns = {
+        'workouts': {'updated_at': 'TIMESTAMP', 'change_version': 'INTEGER NOT NULL DEFAULT 0'},
+        'workout_exercises': {'updated_at': 'TIMESTAMP'},
+    }
+    _execute_ddl([f'ALTER TABLE {table} ADD COLUMN {column} {columns[table][column]}'
+                  for table in columns for column in _missing_columns(table, columns[table])])
+    _execute_ddl(['CREATE INDEX IF NOT EXISTS idx_workouts_user_change ON workouts (user_id, change_version, id)'])
+    _create_all()
+    for model in (Workout, WorkoutExercise):
+        table = model.__table__
+        db.session.execute(update(table).where(table.c.updated_at.is_(None)).values(updated_at=table.c.created_at))
+
+def _sharding():
+    # The user_shards directory; tombstones are keyed by user because workout ids repeat across shards
+    _create_all()
+    table = WorkoutTombstone.__tablename__
+    if inspect(_engine()).get_pk_constraint(table)['constrained_columns'] == ['user_id', 'workout_id']:
+        return
+    if _engine().dialect.name == 'postgresql':
+        _execute_ddl([f'ALTER TABLE {table} DROP CONSTRAINT {table}_pkey, ADD PRIMARY KEY (user_id, workout_id)'])
+        return
+    # SQLite cannot change a primary key: rebuild the table
+    _execute_ddl([
+        'DROP INDEX IF EXISTS idx_workout_tombstones_user_change',
+        f'ALTER TABLE {table} RENAME TO {table}_old',
+    ])
+    _create_all()
+    _execute_ddl([
+        f'INSERT INTO {table} (user_id, workout_id, change_version, deleted_at) '
+        f'SELECT user_id, workout_id, change_version, deleted_at FROM {table}_old',
+        f'DROP TABLE {table}_old',
+    ])
+
+def _idempotency_keys():
+    # Results of batch operations, replayed when a client retries with the same key
+    _create_all()
+
+def _leaderboard_indexes():
+    # Leaderboard snapshots read every user's volume of the current week, ranks one user's
+    _execute_ddl(['CREATE INDEX IF NOT EXISTS idx_weekly_exercise_stats_week ON weekly_exercise_stats (week, user_id)'])
+
+def _stats_totals():
+    # All-time totals next to the daily rollups, so /api/stats no longer sums a user's whole history
+    _create_all()
+    stats.rebuild_totals()
+
+def _bodyweight_records():
+    # Most reps in one set without weight per session, and the maxReps records built from them
+    _execute_ddl([f'ALTER TABLE exercise_sessions ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0'
+                  for column in _missing_columns('exercise_sessions', ['max_reps'])])
+    progression.rebuild_progress()
+
+# (version, step) in order; every step must be safe to re-run on a database that already has it
+MIGRATIONS = [
+    (1, _create_tables),
+    (2, _history_indexes),
+    (3, _progression_tables),
+    (4, _exercise_search),
+    (5, _delta_sync),
+    (6, _sharding),
+    (7, _idempotency_keys),
+    (8, _leaderboard_indexes),
+    (9, _stats_totals),
+    (10, _bodyweight_records),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def current_version():
+    """Version recorded in the database, 0 when the schema_version table does not exist yet"""
+    try:
+        version = db.session.query(SchemaVersion.version).filter_by(id=SCHEMA_VERSION_ID).scalar()
+    except (OperationalError, ProgrammingError):
+        db.session.rollback()
+        return 0
+    return version or 0
+
+def check():
+    """True when the database, and every shard, has every migration this code expects"""
+    for database in shards.databases():
+        with shards.using(database):
+            version = current_version()
+        if version < SCHEMA_VERSION:
+            logger.warning('Database %s schema is at version %d, expected %d; run python init_db.py',
+                           'DATABASE_URL' if database == shards.GLOBAL else f'shard {database}',
+                           version, SCHEMA_VERSION)
+            return False
+    return True
+
+def seed_exercises():
+    """Insert missing seed exercises and update changed ones, keyed by name
+
+    Exercise names are not unique (users can add their own), so existing rows are
+    matched with one lookup instead of ON CONFLICT. Returns the number of rows written.
+    """
+    table = Exercise.__table__
+    existing = {}
+    rows = db.session.execute(
+        select(table.c.id, table.c.name, *(table.c[field] for field in SEED_FIELDS))
+        .where(table.c.name.in_([row['name'] for row in EXERCISES]))
+        .order_by(table.c.id)
+    )
+    for row in rows:
+        existing.setdefault(row.name, row)
+
+    inserts = [row for row in EXERCISES if row['name'] not in existing]
+    updates = [dict(row, b_id=existing[row['name']].id) for row in EXERCISES
+               if row['name'] in existing
+               and any(getattr(existing[row['name']], field) != row[field] for field in SEED_FIELDS)]
+    if inserts:
+        db.session.execute(insert(table), inserts)
+    if updates:
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('b_id')).values(
+                {field: bindparam(field) for field in SEED_FIELDS}),
+            updates
+        )
+    if inserts or updates:
+        changed = [row['name'] for row in inserts + updates]
+        sync_muscles(db.session.execute(
+            select(table.c.id, table.c.muscle).where(table.c.name.in_(changed))))
+        bump_version()
+    return len(inserts) + len(updates)
+
+def _migrate_database():
+    """Apply the pending migrations of the database pinned with shards.using()"""
+    version = current_version()
+    # End the read transaction: concurrent index builds wait for every open transaction
+    db.session.commit()
+    applied = []
+    for target, step in MIGRATIONS:
+        if target > version:
+            step()
+            # Commit per step so the next one's DDL connection is not blocked by this session
+            db.session.merge(SchemaVersion(id=SCHEMA_VERSION_ID, version=target))
+            db.session.commit()
+            applied.append(target)
+    # Every database has a schema_version row with the same id; forget this one's
+    db.session.close()
+    return applied
+
+def migrate():
+    """Apply pending migrations to DATABASE_URL and every shard, and seed the catalog; safe to run repeatedly
+
+    Returns (versions applied to any database, seed rows written).
+    """
+    applied = set()
+    for database in shards.databases():
+        with shards.using(database):
+            applied.update(_migrate_database())
+    applied = sorted(applied)
+    seeded = seed_exercises()
+    db.session.commit()
+    if seeded:
+        catalog.invalidate()
+    return applied, seeded
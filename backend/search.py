@@ -0,0 +1,186 @@
+"""
+In-memory search index over the exercise catalog
+Names are split into lowercase tokens; each token maps to the exercises using it
+and each trigram maps to the tokens containing it, so a query is answered with
+exact, prefix (bisect over the sorted tokens) and fuzzy (trigram similarity)
+matches without looking at every exercise. Categories and normalized muscle
+groups are facets with their own postings. The index lives next to the cached
+catalog in every worker and takes new exercises one at a time.
+"""
+import re
+from bisect import bisect_left, insort
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Minimum trigram similarity (shared / union, as pg_trgm) for a fuzzy match
+FUZZY_THRESHOLD = 0.3
+EXACT_SCORE = 3.0
+PREFIX_SCORE = 2.0
+
+MAX_MUSCLE_LENGTH = 50
+
+# Free-text muscle names (lowercase) -> canonical muscle group
+MUSCLE_ALIASES = {
+    'abs': 'Abs', 'abdominals': 'Abs', 'abdominal': 'Abs', 'rectus abdominis': 'Abs',
+    'core': 'Core',
+    'obliques': 'Obliques',
+    'chest': 'Chest', 'pecs': 'Chest', 'pectorals': 'Chest', 'pectoralis': 'Chest',
+    'shoulders': 'Shoulders', 'shoulder': 'Shoulders', 'delts': 'Shoulders', 'deltoids': 'Shoulders',
+    'deltoid': 'Shoulders',
+    'triceps': 'Triceps', 'tricep': 'Triceps',
+    'biceps': 'Biceps', 'bicep': 'Biceps',
+    'forearms': 'Forearms', 'forearm': 'Forearms',
+    'back': 'Back', 'upper back': 'Back',
+    'lower back': 'Lower Back', 'erectors': 'Lower Back', 'spinal erectors': 'Lower Back',
+    'lats': 'Lats', 'latissimus dorsi': 'Lats', 'latissimus': 'Lats',
+    'traps': 'Traps', 'trapezius': 'Traps',
+    'glutes': 'Glutes', 'glute': 'Glutes', 'gluteus': 'Glutes', 'gluteus maximus': 'Glutes',
+    'quadriceps': 'Quadriceps', 'quads': 'Quadriceps', 'quad': 'Quadriceps',
+    'hamstrings': 'Hamstrings', 'hamstring': 'Hamstrings', 'hams': 'Hamstrings',
+    'calves': 'Calves', 'calf': 'Calves',
+    'hip flexors': 'Hip Flexors',
+    'adductors': 'Adductors', 'abductors': 'Abductors',
+}
+
+_MUSCLE_SEPARATORS = re.compile(r'\s*(?:,|;|/|&|\band\b)\s*', re.IGNORECASE)
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+def normalize_muscle(name):
+    """Canonical group for one muscle name, or None when it is blank"""
+    key = ' '.join(name.lower().split())
+    if not key:
+        return None
+    return MUSCLE_ALIASES.get(key) or key.title()[:MAX_MUSCLE_LENGTH]
+
+def normalize_muscles(text):
+    """Sorted canonical muscle groups in a free-text list such as "Chest, Delts & Triceps" """
+    muscles = {normalize_muscle(part) for part in _MUSCLE_SEPARATORS.split(text or '')}
+    muscles.discard(None)
+    return sorted(muscles)
+
+def tokenize(text):
+    return _TOKEN.findall((text or '').lower())
+
+def trigrams(token):
+    """Trigrams of a token padded like pg_trgm, so short tokens and word starts still match"""
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _facet_key(value):
+    return ' '.join((value or '').lower().split())
+
+class ExerciseIndex:
+    """Inverted index of exercise names with category and muscle facets"""
+
+    def __init__(self, exercises=()):
+        self.ids = set()
+        self.tokens = {}           # token -> exercise ids
+        self.sorted_tokens = []    # for prefix ranges
+        self.trigrams = {}         # trigram -> tokens
+        self.categories = {}       # lowercase category -> exercise ids
+        self.muscles = {}          # lowercase muscle group -> exercise ids
+        self.labels = {}           # lowercase facet value -> display name
+        self.sort_names = {}       # exercise id -> lowercase name, the tiebreak
+        for exercise in exercises:
+            self.add(exercise)
+
+    def add(self, exercise):
+        """Index one serialized exercise; it must carry a 'muscles' list"""
+        exercise_id = exercise['id']
+        self.ids.add(exercise_id)
+        self.sort_names[exercise_id] = exercise['name'].lower()
+        for token in set(tokenize(exercise['name'])):
+            if token not in self.tokens:
+                self.tokens[token] = set()
+                insort(self.sorted_tokens, token)
+                for trigram in trigrams(token):
+                    self.trigrams.setdefault(trigram, set()).add(token)
+            self.tokens[token].add(exercise_id)
+        self._add_facet(self.categories, exercise['category'], exercise_id)
+        for muscle in exercise['muscles']:
+            self._add_facet(self.muscles, muscle, exercise_id)
+
+    def _add_facet(self, postings, value, exercise_id):
+        key = _facet_key(value)
+        if key:
+            postings.setdefault(key, set()).add(exercise_id)
+            self.labels.setdefault(key, value)
+
+    def _token_matches(self, token):
+        """{matching index token: score} for one query token"""
+        matches = {}
+        start = bisect_left(self.sorted_tokens, token)
+        for candidate in self.sorted_tokens[start:]:
+            if not candidate.startswith(token):
+                break
+            matches[candidate] = EXACT_SCORE if candidate == token else PREFIX_SCORE
+
+        wanted = trigrams(token)
+        shared = {}
+        for trigram in wanted:
+            for candidate in self.trigrams.get(trigram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        for candidate, count in shared.items():
+            similarity = count / (len(wanted) + len(trigrams(candidate)) - count)
+            if similarity >= FUZZY_THRESHOLD and candidate not in matches:
+                matches[candidate] = similarity
+        return matches
+
+    def _name_scores(self, query):
+        """{exercise id: score} for exercises matching every query token, None for no query"""
+        scores = None
+        for token in dict.fromkeys(tokenize(query)):
+            best = {}
+            for candidate, score in self._token_matches(token).items():
+                for exercise_id in self.tokens[candidate]:
+                    if score > best.get(exercise_id, 0):
+                        best[exercise_id] = score
+            if scores is None:
+                scores = best
+            else:
+                scores = {exercise_id: total + best[exercise_id]
+                          for exercise_id, total in scores.items() if exercise_id in best}
+            if not scores:
+                return {}
+        return scores
+
+    def _facet_filter(self, postings, values):
+        """Ids having any of the values, or None when the facet is not filtered"""
+        keys = {_facet_key(value) for value in values} - {''}
+        if not keys:
+            return None
+        matched = set()
+        for key in keys:
+            matched |= postings.get(key, set())
+        return matched
+
+    def _facet_counts(self, postings, ids):
+        counts = {self.labels[key]: len(members & ids) for key, members in postings.items()}
+        return {label: count for label, count in sorted(counts.items()) if count}
+
+    def search(self, query='', categories=(), muscles=(), limit=DEFAULT_LIMIT, offset=0):
+        """Ranked ids of one page plus the total and facet counts
+
+        Query tokens must all match a name token exactly, as a prefix or fuzzily;
+        values within a facet are alternatives and facets narrow each other. Each
+        facet is counted with the other filters applied, not its own.
+        Returns (ids, total, {'category': {...}, 'muscle': {...}}).
+        """
+        scores = self._name_scores(query)
+        matched = self.ids if scores is None else set(scores)
+        by_category = self._facet_filter(self.categories, categories)
+        by_muscle = self._facet_filter(
+            self.muscles, [muscle for value in muscles for muscle in normalize_muscles(value)])
+
+        in_category = matched if by_category is None else matched & by_category
+        in_muscle = matched if by_muscle is None else matched & by_muscle
+        results = in_category & in_muscle
+        facets = {
+            'category': self._facet_counts(self.categories, in_muscle),
+            'muscle': self._facet_counts(self.muscles, in_category),
+        }
+
+        ranked = sorted(results, key=lambda exercise_id: (
+            -(scores or {}).get(exercise_id, 0), self.sort_names[exercise_id], exercise_id))
+        return ranked[offset:offset + limit], len(results), facets
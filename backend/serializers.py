@@ -0,0 +1,140 @@
+"""
+Loading and serialization helpers for workouts
+Workouts are fetched together with their exercises in a constant number of queries.
+Serialized workouts keep dates as datetime objects; fastjson encodes them.
+"""
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import selectinload
+from models import Workout
+from catalog import catalog
+import fastjson
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+STREAM_BATCH_SIZE = 100
+
+def workouts_query(user_id):
+    """Query for a user's workouts with exercises eager-loaded
+
+    Exercise names and images come from the catalog cache, so Exercise rows are not loaded.
+    """
+    return Workout.query.filter_by(user_id=user_id).options(selectinload(Workout.workout_exercises))
+
+def newest_first(query):
+    """Order workouts by date, newest first, with id as a stable tie-breaker"""
+    return query.order_by(Workout.date.desc(), Workout.id.desc())
+
+def load_workouts(user_id):
+    """Load all workouts for a user, newest first"""
+    return newest_first(workouts_query(user_id)).all()
+
+def encode_cursor(workout):
+    """Build an opaque pagination cursor pointing just after the given workout"""
+    raw = f"{workout.date.isoformat()}|{workout.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Decode a pagination cursor into (date, id); raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        date_str, workout_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(date_str), int(workout_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def load_workout_page(user_id, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """Load one page of workouts using keyset pagination on (date, id)
+
+    Returns the workouts and the cursor for the next page (None on the last page).
+    """
+    query = workouts_query(user_id)
+    if cursor:
+        date, workout_id = decode_cursor(cursor)
+        # The redundant date bound lets the (user_id, date, id) index seek straight to the cursor
+        query = query.filter(Workout.date <= date, or_(
+            Workout.date < date,
+            and_(Workout.date == date, Workout.id < workout_id)
+        ))
+    # Fetch one extra row to know whether another page exists
+    workouts = newest_first(query).limit(limit + 1).all()
+    next_cursor = encode_cursor(workouts[limit - 1]) if len(workouts) > limit else None
+    return workouts[:limit], next_cursor
+
+def iter_workouts(user_id, batch_size=STREAM_BATCH_SIZE):
+    """Iterate over all workouts for a user through a server-side cursor"""
+    query = newest_first(workouts_query(user_id))
+    return query.execution_options(stream_results=True).yield_per(batch_size)
+
+def stream_workouts_json(workouts):
+    """Yield a JSON array of serialized workouts chunk by chunk"""
+    yield b'['
+    for i, workout in enumerate(workouts):
+        yield (b',' if i else b'') + fastjson.dumps(serialize_workout(workout))
+    yield b']'
+
+def stream_workouts_ndjson(workouts):
+    """Yield serialized workouts as newline-delimited JSON"""
+    for workout in workouts:
+        yield fastjson.dumps(serialize_workout(workout)) + b'\n'
+
+def load_workout(user_id, workout_id):
+    """Load a single workout for a user or abort with 404"""
+    return workouts_query(user_id).filter_by(id=workout_id).first_or_404()
+
+WORKOUT_FIELDS = frozenset(['id', 'name', 'date', 'duration', 'workout_exercises'])
+ENTRY_FIELDS = frozenset(['id', 'exercise_id', 'sets', 'reps', 'weight', 'notes'])
+
+def _loaded_values(instance, fields):
+    """Attribute values of an ORM instance, straight from its __dict__ when all are loaded
+
+    Instrumented attribute access costs more than the rest of serializing a large
+    history. Expired or unloaded attributes are missing from __dict__; then
+    getattr loads them as usual.
+    """
+    values = instance.__dict__
+    if fields <= values.keys():
+        return values
+    return {name: getattr(instance, name) for name in fields}
+
+def serialize_workout_exercise(we, exercises=None):
+    """Convert a WorkoutExercise row to its API representation
+
+    exercises is a catalog snapshot (id -> exercise) shared by a whole payload.
+    """
+    values = _loaded_values(we, ENTRY_FIELDS)
+    exercise_id = values['exercise_id']
+    exercise = (exercises if exercises is not None else catalog.by_id).get(exercise_id)
+    if exercise is None:
+        exercise = catalog.get(exercise_id)  # Re-checks the catalog version once
+    return {
+        'id': values['id'],
+        'exerciseId': exercise_id,
+        'exerciseName': exercise['name'] if exercise else 'Unknown',
+        'exerciseImage': exercise['image'] if exercise else '💪',
+        'sets': values['sets'],
+        'reps': values['reps'],
+        'weight': values['weight'],
+        'notes': values['notes']
+    }
+
+def serialize_workout(workout, exercises=None):
+    """Convert a Workout row to its API representation"""
+    if exercises is None:
+        catalog.refresh()
+        exercises = catalog.by_id
+    values = _loaded_values(workout, WORKOUT_FIELDS)
+    return {
+        'id': values['id'],
+        'name': values['name'],
+        'date': values['date'],
+        'duration': values['duration'],
+        'exercises': [serialize_workout_exercise(we, exercises) for we in values['workout_exercises']]
+    }
+
+def serialize_workouts(workouts):
+    """Serialize a list of workouts against one catalog snapshot"""
+    catalog.refresh()
+    exercises = catalog.by_id
+    return [serialize_workout(workout, exercises) for workout in workouts]
@@ -0,0 +1,175 @@
+"""
+User-keyed sharding of workout data
+With DATABASE_SHARD_URLS set (comma-separated URLs), the tables holding a
+user's workout data (SHARDED_TABLES) live on one of those databases per user.
+The global tables - users, the exercise catalog, schema_version and the
+user_shards directory mapping users to shards - stay on DATABASE_URL, which
+may itself be one of the shards. Every query in a request is scoped to the
+current user, so the session sends statements on sharded tables to that user's
+shard; outside a request, code picks a database with shards.using().
+
+New users are placed on user_id % number of shards and recorded in the
+directory, so adding shards never moves anyone; rebalance.py moves users
+between shards offline. Users without a directory row, created before sharding
+was enabled, stay on DATABASE_URL until they are moved.
+
+Workout ids come from each shard's own sequence and are only unique within a
+shard; the API never looks a workout up without its user. Queries joining a
+sharded table with a global one cannot run and raise ShardingError.
+"""
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import current_app, g, has_request_context
+from sqlalchemy import inspect, select, Table
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.util import find_tables
+from auth_cache import TTLCache
+import replicas
+
+SHARD_URLS = [url.strip() for url in os.getenv('DATABASE_SHARD_URLS', '').split(',') if url.strip()]
+CACHE_TTL = float(os.getenv('SHARD_CACHE_TTL', '60'))  # Seconds a worker keeps a user's shard
+
+# Tables of one user's workout data, stored on the user's shard
+SHARDED_TABLES = frozenset([
+    'workouts', 'workout_exercises', 'workout_tombstones', 'user_data_versions',
+    'daily_stats', 'daily_exercise_stats', 'user_stats', 'exercise_usage_stats', 'weekly_exercise_stats',
+    'exercise_sessions', 'personal_records', 'idempotency_keys',
+])
+# Tables every database has its own copy of, e.g. for migrations
+PER_DATABASE_TABLES = frozenset(['schema_version'])
+
+BIND_PREFIX = 'shard_'
+# Pinned with using() for the DATABASE_URL database itself, whether or not it is a shard
+GLOBAL = -1
+
+# user id -> shard index
+directory = TTLCache(ttl=CACHE_TTL)
+
+_pinned = ContextVar('pinned_shard', default=None)
+_creating_shard_tables = ContextVar('creating_shard_tables', default=False)
+
+class ShardingError(RuntimeError):
+    """A statement that cannot be routed to a single database"""
+
+def _same_database(url, other):
+    return make_url(url).render_as_string(hide_password=False) == make_url(other).render_as_string(hide_password=False)
+
+def configure(app):
+    """Add a bind per shard other than DATABASE_URL; call before db.init_app
+
+    Shards use the primary's pool size (DATABASE_POOL_SIZE/DATABASE_MAX_OVERFLOW).
+    """
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    for index, url in enumerate(SHARD_URLS):
+        if not _same_database(url, app.config['SQLALCHEMY_DATABASE_URI']):
+            binds[f'{BIND_PREFIX}{index}'] = dict(replicas.pool_options('DATABASE'), url=url)
+
+def _bind_key(shard):
+    """Bind key of a shard, None for DATABASE_URL"""
+    if shard == GLOBAL:
+        return None
+    key = f'{BIND_PREFIX}{shard}'
+    return key if key in current_app.config['SQLALCHEMY_BINDS'] else None
+
+def databases():
+    """Every database holding sharded tables, DATABASE_URL (GLOBAL) first; pass each to using()"""
+    return [GLOBAL] + [shard for shard in range(len(SHARD_URLS)) if _bind_key(shard) is not None]
+
+def placement(user_id):
+    """Shard for a new user"""
+    return user_id % len(SHARD_URLS)
+
+def canonical(shard):
+    """GLOBAL for the shard whose URL is DATABASE_URL, so every database has one name"""
+    return GLOBAL if _bind_key(shard) is None else shard
+
+def shard_for(user_id, cached=True):
+    """Shard index holding a user's workouts, from the directory on DATABASE_URL; GLOBAL without a row"""
+    shard = directory.get(user_id) if cached else None
+    if shard is None:
+        from models import UserShard  # models imports this module through the session class
+        engine = current_app.extensions['sqlalchemy'].engines[None]
+        # Own connection: this runs while the session is choosing a bind for another statement
+        with engine.connect() as connection:
+            shard = connection.execute(
+                select(UserShard.shard).where(UserShard.user_id == user_id)).scalar()
+        if shard is None:
+            shard = GLOBAL
+        directory.set(user_id, shard)
+    return shard
+
+@contextmanager
+def using(shard):
+    """Send statements on sharded tables to a shard (or GLOBAL) while the block runs"""
+    token = _pinned.set(shard)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+def pinned():
+    return _pinned.get()
+
+def current_shard():
+    """Shard of the pinned database or the request's user, None when neither is known"""
+    shard = _pinned.get()
+    if shard is not None:
+        return shard
+    if has_request_context():
+        shard = g.get('shard')
+        if shard is None and g.get('user_id') is not None:
+            shard = g.shard = shard_for(g.user_id)
+        return shard
+    return None
+
+def engine(engines=None):
+    """Engine holding the sharded tables in the current context"""
+    engines = engines if engines is not None else current_app.extensions['sqlalchemy'].engines
+    if not SHARD_URLS:
+        return engines[None]
+    shard = current_shard()
+    if shard is None:
+        raise ShardingError('No shard selected: use shards.using() outside requests')
+    return engines[_bind_key(shard)]
+
+def _table_names(mapper, clause):
+    """Names of the tables a statement reads or writes, subqueries included"""
+    names = set()
+    if mapper is not None:
+        names.add(inspect(mapper).local_table.name)
+    if clause is not None:
+        names.update(table.name for table in find_tables(clause, include_aliases=True) if isinstance(table, Table))
+    return names
+
+def bind_for(engines, mapper, clause):
+    """Shard engine for a statement on sharded tables, None for the global ones"""
+    if not SHARD_URLS:
+        return None
+    names = _table_names(mapper, clause)
+    if not names & SHARDED_TABLES and not (names & PER_DATABASE_TABLES and _pinned.get() is not None):
+        return None
+    if names - SHARDED_TABLES - PER_DATABASE_TABLES:
+        raise ShardingError(f'Statement joins sharded and global tables: {sorted(names)}')
+    return engine(engines)
+
+def create_tables(metadata):
+    """Create the sharded and per-database tables on the pinned shard
+
+    Foreign keys to global tables are left out: those rows are in another database.
+    """
+    tables = [table for name, table in metadata.tables.items() if name in SHARDED_TABLES | PER_DATABASE_TABLES]
+    for table in tables:
+        for constraint in table.foreign_key_constraints:
+            if constraint.referred_table.name not in SHARDED_TABLES:
+                constraint.ddl_if(callable_=lambda *args, **kwargs: not _creating_shard_tables.get())
+    token = _creating_shard_tables.set(True)
+    try:
+        metadata.create_all(bind=engine(), tables=tables)
+    finally:
+        _creating_shard_tables.reset(token)
+
+def drop_tables(metadata):
+    """Drop the sharded and per-database tables on the pinned shard"""
+    tables = [table for name, table in metadata.tables.items() if name in SHARDED_TABLES | PER_DATABASE_TABLES]
+    metadata.drop_all(bind=engine(), tables=tables)
@@ -0,0 +1,238 @@
+"""
+Incrementally maintained workout statistics
+Workout writes adjust per-user-per-day rollup rows, and the per-user all-time
+totals next to them, in the same transaction, so reading dashboard stats costs
+the same whatever the length of a user's history
+"""
+from collections import Counter, namedtuple
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, insert, select
+from models import db, Workout, WorkoutExercise, DailyStat, DailyExerciseStat, UserStat, ExerciseUsageStat
+from upsert import increment
+from catalog import catalog
+
+DEFAULT_DAYS = 14
+MAX_DAYS = 366
+TOP_EXERCISES = 5
+
+# Contribution of a single workout to the rollups
+WorkoutRollup = namedtuple('WorkoutRollup', ['user_id', 'day', 'duration', 'exercise_ids'])
+
+def workout_rollup(workout, exercise_ids):
+    """Describe what a workout contributes to its user's daily rollups"""
+    return WorkoutRollup(workout.user_id, workout.date.date(), workout.duration or 0, list(exercise_ids))
+
+def totals_of(daily, per_exercise):
+    """All-time totals keyed like user_stats and exercise_usage_stats, from daily rollup rows"""
+    totals = {}
+    for (user_id, _), deltas in daily.items():
+        row = totals.setdefault(user_id, {'workouts': 0, 'exercises': 0, 'duration': 0})
+        for column, delta in deltas.items():
+            row[column] += delta
+    usage = Counter()
+    for (user_id, _, exercise_id), count in per_exercise.items():
+        usage[(user_id, exercise_id)] += count
+    return totals, dict(usage)
+
+def _apply(signed_rollups):
+    """Merge (rollup, sign) contributions per rollup row and write the net changes"""
+    daily = {}
+    per_exercise = Counter()
+    for rollup, sign in signed_rollups:
+        key = (rollup.user_id, rollup.day)
+        deltas = daily.setdefault(key, {'workouts': 0, 'exercises': 0, 'duration': 0})
+        deltas['workouts'] += sign
+        deltas['exercises'] += sign * len(rollup.exercise_ids)
+        deltas['duration'] += sign * rollup.duration
+        for exercise_id in rollup.exercise_ids:
+            per_exercise[key + (exercise_id,)] += sign
+
+    increment(DailyStat, ['user_id', 'day'], [
+        dict(deltas, user_id=user_id, day=day)
+        for (user_id, day), deltas in daily.items() if any(deltas.values())
+    ])
+    increment(DailyExerciseStat, ['user_id', 'day', 'exercise_id'], [
+        {'user_id': user_id, 'day': day, 'exercise_id': exercise_id, 'count': count}
+        for (user_id, day, exercise_id), count in per_exercise.items() if count
+    ])
+    totals, usage = totals_of(daily, per_exercise)
+    increment(UserStat, ['user_id'], [
+        dict(deltas, user_id=user_id) for user_id, deltas in totals.items() if any(deltas.values())
+    ])
+    increment(ExerciseUsageStat, ['user_id', 'exercise_id'], [
+        {'user_id': user_id, 'exercise_id': exercise_id, 'count': count}
+        for (user_id, exercise_id), count in usage.items() if count
+    ])
+
+    # Drop rows that may no longer describe any workout
+    for user_id, day in {key for key, deltas in daily.items() if deltas['workouts'] < 0}:
+        DailyStat.query.filter_by(user_id=user_id, day=day).filter(DailyStat.workouts <= 0).delete()
+    for user_id, day in {key[:2] for key, count in per_exercise.items() if count < 0}:
+        DailyExerciseStat.query.filter_by(user_id=user_id, day=day).filter(
+            DailyExerciseStat.count <= 0).delete()
+    for user_id in {user_id for user_id, deltas in totals.items() if deltas['workouts'] < 0}:
+        UserStat.query.filter_by(user_id=user_id).filter(UserStat.workouts <= 0).delete()
+    for user_id in {user_id for (user_id, _), count in usage.items() if count < 0}:
+        ExerciseUsageStat.query.filter_by(user_id=user_id).filter(ExerciseUsageStat.count <= 0).delete()
+
+def apply_rollups(rollups, sign=1):
+    """Add (sign=1) or remove (sign=-1) many workouts' contributions to the rollups
+
+    Contributions are merged per rollup row first, so each touched row is written once.
+    """
+    _apply([(rollup, sign) for rollup in rollups])
+
+def apply_rollup(rollup, sign=1):
+    """Add (sign=1) or remove (sign=-1) a single workout's contribution to the rollups"""
+    _apply([(rollup, sign)])
+
+def replace_rollup(old, new):
+    """Swap a workout's previous contribution for its new one, writing only the net change"""
+    if old != new:
+        _apply([(old, -1), (new, 1)])
+
+def get_stats(user_id, days=DEFAULT_DAYS, today=None):
+    """Dashboard statistics for a user from the totals and at most `days` rollup rows"""
+    today = today or datetime.utcnow().date()
+
+    totals = db.session.get(UserStat, user_id)
+    total_workouts, total_exercises, total_duration = (
+        (totals.workouts, totals.exercises, totals.duration) if totals else (0, 0, 0))
+
+    # The last 7 days, today included
+    this_week = db.session.query(func.coalesce(func.sum(DailyStat.workouts), 0)).filter(
+        DailyStat.user_id == user_id,
+        DailyStat.day > today - timedelta(days=7)
+    ).scalar()
+
+    # Most recent days with activity, newest first
+    daily = DailyStat.query.filter_by(user_id=user_id).order_by(DailyStat.day.desc()).limit(days).all()
+
+    # Names come from the catalog: exercises may live in another database than a sharded user's stats
+    most_used = [(catalog.get(exercise_id), count) for exercise_id, count in db.session.query(
+        ExerciseUsageStat.exercise_id, ExerciseUsageStat.count
+    ).filter(ExerciseUsageStat.user_id == user_id).order_by(
+        ExerciseUsageStat.count.desc(), ExerciseUsageStat.exercise_id
+    ).limit(TOP_EXERCISES)]
+
+    return {
+        'totalWorkouts': total_workouts,
+        'totalExercises': total_exercises,
+        'totalDuration': total_duration,
+        'avgWorkoutDuration': round(total_duration / total_workouts) if total_workouts else 0,
+        'thisWeekWorkouts': int(this_week),
+        'daily': [{
+            'date': row.day,
+            'workouts': row.workouts,
+            'exercises': row.exercises,
+            'duration': row.duration
+        } for row in daily],
+        'mostUsedExercises': [{'name': exercise['name'], 'count': int(count)}
+                              for exercise, count in most_used if exercise is not None]
+    }
+
+def rebuild_totals():
+    """Replace every user's totals with the sums of their stored daily rollups; caller commits"""
+    ExerciseUsageStat.query.delete()
+    UserStat.query.delete()
+    db.session.execute(insert(UserStat).from_select(
+        ['user_id', 'workouts', 'exercises', 'duration'],
+        select(DailyStat.user_id, func.sum(DailyStat.workouts), func.sum(DailyStat.exercises),
+               func.sum(DailyStat.duration)).group_by(DailyStat.user_id)
+    ))
+    db.session.execute(insert(ExerciseUsageStat).from_select(
+        ['user_id', 'exercise_id', 'count'],
+        select(DailyExerciseStat.user_id, DailyExerciseStat.exercise_id, func.sum(DailyExerciseStat.count))
+        .group_by(DailyExerciseStat.user_id, DailyExerciseStat.exercise_id)
+    ))
+
+def _as_date(value):
+    """func.date() returns a string on SQLite and a date on PostgreSQL"""
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+def compute_rollups(user_id=None):
+    """Recompute rollup rows from workouts/workout_exercises
+
+    Returns (daily, per_exercise) dicts keyed like the rollup primary keys.
+    """
+    day = func.date(Workout.date)
+
+    workouts_query = db.session.query(
+        Workout.user_id, day, func.count(Workout.id), func.coalesce(func.sum(Workout.duration), 0)
+    ).group_by(Workout.user_id, day)
+    exercises_query = db.session.query(
+        Workout.user_id, day, WorkoutExercise.exercise_id, func.count(WorkoutExercise.id)
+    ).join(WorkoutExercise, WorkoutExercise.workout_id == Workout.id).group_by(
+        Workout.user_id, day, WorkoutExercise.exercise_id
+    )
+    if user_id is not None:
+        workouts_query = workouts_query.filter(Workout.user_id == user_id)
+        exercises_query = exercises_query.filter(Workout.user_id == user_id)
+
+    daily = {}
+    for uid, d, workouts, duration in workouts_query:
+        daily[(uid, _as_date(d))] = {'workouts': workouts, 'exercises': 0, 'duration': int(duration)}
+    per_exercise = {}
+    for uid, d, exercise_id, count in exercises_query:
+        key = (uid, _as_date(d))
+        per_exercise[key + (exercise_id,)] = count
+        daily[key]['exercises'] += count
+    return daily, per_exercise
+
+def _user_queries(user_id, *models):
+    """A query per model, limited to one user's rows unless user_id is None"""
+    if user_id is None:
+        return [model.query for model in models]
+    return [model.query.filter_by(user_id=user_id) for model in models]
+
+def _stored_rollups(user_id=None):
+    """Read rollup and total rows as they are currently stored"""
+    daily_query, exercise_query, totals_query, usage_query = _user_queries(
+        user_id, DailyStat, DailyExerciseStat, UserStat, ExerciseUsageStat)
+    daily = {(row.user_id, row.day): {
+        'workouts': row.workouts, 'exercises': row.exercises, 'duration': row.duration
+    } for row in daily_query}
+    per_exercise = {(row.user_id, row.day, row.exercise_id): row.count for row in exercise_query}
+    totals = {row.user_id: {
+        'workouts': row.workouts, 'exercises': row.exercises, 'duration': row.duration
+    } for row in totals_query}
+    usage = {(row.user_id, row.exercise_id): row.count for row in usage_query}
+    return daily, per_exercise, totals, usage
+
+def check_rollups(user_id=None):
+    """Compare stored rollups and totals with freshly computed ones and return the mismatching keys"""
+    daily, per_exercise = compute_rollups(user_id)
+    expected = (daily, per_exercise) + totals_of(daily, per_exercise)
+    drift = []
+    for expected_rows, stored_rows in zip(expected, _stored_rollups(user_id)):
+        drift += [key for key in expected_rows.keys() | stored_rows.keys()
+                  if expected_rows.get(key) != stored_rows.get(key)]
+    return drift
+
+def rebuild_rollups(user_id=None):
+    """Replace stored rollups and totals with ones recomputed from the workout tables; caller commits"""
+    daily, per_exercise = compute_rollups(user_id)
+    totals, usage = totals_of(daily, per_exercise)
+
+    for query in _user_queries(user_id, DailyExerciseStat, DailyStat, ExerciseUsageStat, UserStat):
+        query.delete()
+
+    if daily:
+        db.session.execute(DailyStat.__table__.insert(), [
+            dict(values, user_id=uid, day=d) for (uid, d), values in daily.items()
+        ])
+    if per_exercise:
+        db.session.execute(DailyExerciseStat.__table__.insert(), [
+            {'user_id': uid, 'day': d, 'exercise_id': exercise_id, 'count': count}
+            for (uid, d, exercise_id), count in per_exercise.items()
+        ])
+    if totals:
+        db.session.execute(UserStat.__table__.insert(), [
+            dict(values, user_id=uid) for uid, values in totals.items()
+        ])
+    if usage:
+        db.session.execute(ExerciseUsageStat.__table__.insert(), [
+            {'user_id': uid, 'exercise_id': exercise_id, 'count': count}
+            for (uid, exercise_id), count in usage.items()
+        ])
+    return len(daily), len(per_exercise)
@@ -0,0 +1,98 @@
+"""
+Delta sync of a user's workouts
+Every workout write stamps the rows it touches with the user's new data version
+(versions.bump) and deletions leave a tombstone stamped the same way. A sync
+token is an opaque position in that sequence, so GET /api/workouts/changes
+returns only the workouts written and deleted since the client's last sync,
+with one index range scan per table instead of the whole history.
+"""
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_
+from models import db, Workout, WorkoutTombstone
+from serializers import workouts_query
+from upsert import increment
+import versions
+
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 1000
+
+TOKEN_FORMAT = 'v1'
+
+class StaleToken(ValueError):
+    """The token is ahead of the server's data, e.g. after a restore; the client must sync from scratch"""
+
+def encode_token(version, workout_id=None):
+    """Opaque token for everything up to a version, or up to one workout within it"""
+    parts = [TOKEN_FORMAT, str(version)] + ([] if workout_id is None else [str(workout_id)])
+    return base64.urlsafe_b64encode('|'.join(parts).encode('ascii')).decode('ascii')
+
+def decode_token(token):
+    """Decode a sync token into (version, workout id or None); raises ValueError if malformed"""
+    try:
+        parts = base64.urlsafe_b64decode(token.encode('ascii')).decode('ascii').split('|')
+        if parts[0] != TOKEN_FORMAT or len(parts) not in (2, 3):
+            raise ValueError
+        return int(parts[1]), (int(parts[2]) if len(parts) == 3 else None)
+    except Exception:
+        raise ValueError('Invalid sync token')
+
+def record_deletions(user_id, workout_ids, version):
+    """Leave tombstones for deleted workouts; call inside the deleting transaction"""
+    now = datetime.utcnow()
+    # A tombstone for a reused id is overwritten, the client drops it before applying upserts
+    increment(WorkoutTombstone, ['user_id', 'workout_id'], [
+        {'user_id': user_id, 'workout_id': workout_id, 'change_version': version, 'deleted_at': now}
+        for workout_id in workout_ids
+    ], replace=['change_version', 'deleted_at'])
+
+def _after(version_column, id_column, version, workout_id):
+    """Rows past a sync position in (version, id) order"""
+    if workout_id is None:
+        return version_column > version
+    # The redundant version bound lets the (user_id, version, id) index seek straight to the position
+    return and_(version_column >= version, or_(
+        version_column > version,
+        and_(version_column == version, id_column > workout_id)
+    ))
+
+def load_changes(user_id, token=None, limit=DEFAULT_LIMIT):
+    """Workouts written and ids of workouts deleted since a sync token
+
+    Without a token every workout is an upsert and there are no deletions. Returns
+    (workouts, deleted ids, next token, has more); when more changes exist than
+    limit the next token continues within the same sync. Raises ValueError for a
+    malformed token and StaleToken for one ahead of the data.
+    """
+    # The current version is read first: a change committed after this read has a higher
+    # version, so bounding both queries by it keeps them consistent under READ COMMITTED
+    current, _ = versions.get(user_id)
+    if token:
+        version, workout_id = decode_token(token)
+        if version > current:
+            raise StaleToken('Sync token is ahead of the server data; sync again without a token')
+    else:
+        version, workout_id = -1, None
+
+    upserts = workouts_query(user_id).filter(
+        _after(Workout.change_version, Workout.id, version, workout_id),
+        Workout.change_version <= current
+    ).order_by(Workout.change_version, Workout.id).limit(limit + 1).all()
+    changes = [(workout.change_version, workout.id, workout) for workout in upserts]
+    if token:
+        tombstones = WorkoutTombstone.__table__.c
+        changes += [(row.change_version, row.workout_id, None) for row in db.session.execute(
+            db.select(tombstones.change_version, tombstones.workout_id).where(
+                tombstones.user_id == user_id,
+                _after(tombstones.change_version, tombstones.workout_id, version, workout_id),
+                tombstones.change_version <= current
+            ).order_by(tombstones.change_version, tombstones.workout_id).limit(limit + 1)
+        )]
+
+    changes.sort(key=lambda change: change[:2])
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    next_token = encode_token(*changes[-1][:2]) if has_more else encode_token(current)
+    workouts = [workout for _, _, workout in changes if workout is not None]
+    deleted = [workout_id for _, workout_id, workout in changes if workout is None]
+    return workouts, deleted, next_token, has_more
@@ -0,0 +1,60 @@
+"""
+Shared fixtures: the app migrated against a throwaway SQLite database
+Settings are read when modules are imported, so they are set before the app is.
+"""
+import itertools
+import os
+from contextlib import contextmanager
+import pytest
+
+os.environ['BCRYPT_ROUNDS'] = '4'
+# Statement counts must not depend on when a worker last re-checked the catalog version
+os.environ['CATALOG_CHECK_INTERVAL'] = '3600'
+for name in ('DATABASE_READ_URLS', 'DATABASE_SHARD_URLS', 'LEADERBOARD_DIR'):
+    os.environ.pop(name, None)
+
+_usernames = itertools.count()
+
+@pytest.fixture(scope='session')
+def app():
+    from benchmarks.common import setup_app
+    return setup_app()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def register(client):
+    """Register a new user; returns its Authorization header"""
+    from benchmarks.common import register as register_user
+
+    def register_new(prefix='test-user'):
+        return register_user(client, f'{prefix}-{next(_usernames)}')
+    return register_new
+
+@pytest.fixture
+def headers(register):
+    return register()
+
+@pytest.fixture
+def count_statements(app):
+    """Context manager collecting the SQL statements sent while it is open"""
+    from sqlalchemy import event
+    from models import db
+
+    @contextmanager
+    def counting():
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', capture)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', capture)
+    return counting
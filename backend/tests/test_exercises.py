@@ -0,0 +1,18 @@
+import pytest
+
+@pytest.mark.parametrize('query, error', [
+    ('limit=abc', 'limit must be a positive integer'),
+    ('limit=0', 'limit must be a positive integer'),
+    ('limit=2.5', 'limit must be a positive integer'),
+    ('q=press&offset=abc', 'offset must be a non-negative integer'),
+    ('offset=-1', 'offset must be a non-negative integer'),
+])
+def test_malformed_paging_is_rejected(client, query, error):
+    response = client.get(f'/api/exercises?{query}')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': error}
+
+def test_paging(client):
+    body = client.get('/api/exercises?limit=2&offset=1').get_json()
+    assert len(body['exercises']) == 2
+    assert body['nextOffset'] == (3 if body['total'] > 3 else None)
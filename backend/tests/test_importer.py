@@ -0,0 +1,55 @@
+import io
+import json
+import pytest
+import importer
+
+def record(name, **entry):
+    return {'name': name, 'date': '2026-03-02T09:00:00', 'duration': 20,
+            'exercises': [dict({'exerciseId': 1, 'sets': 3, 'reps': 10, 'weight': 40.0}, **entry)]}
+
+def import_json(client, headers, body):
+    response = client.post('/api/workouts/import', headers=headers, data=body, content_type='application/json')
+    assert response.status_code == 200
+    return response.get_json()
+
+@pytest.mark.parametrize('body, expected', [
+    (b'[]', []),
+    (b'[{"a": 1} , {"b": 2}]', [{'a': 1}, {'b': 2}]),
+])
+def test_json_array_elements(body, expected):
+    assert list(importer.iter_json_array(io.BytesIO(body), chunk_size=4)) == expected
+
+@pytest.mark.parametrize('body', [b'[{"a": 1}{"b": 2}]', b'[{"a": 1},]', b'[,{"a": 1}]', b'[{"a": 1},,{"b": 2}]'])
+def test_json_array_needs_one_comma_between_elements(body):
+    with pytest.raises(ValueError, match='Malformed JSON'):
+        list(importer.iter_json_array(io.BytesIO(body), chunk_size=4))
+
+def test_missing_comma_is_reported(client, headers):
+    body = json.dumps(record('first')) + json.dumps(record('second'))
+    summary = import_json(client, headers, f'[{body}]')
+    assert summary['imported'] == 1
+    assert summary['errors'] == [{'index': 1, 'error': "Malformed JSON: expected ',' or ']' after an array element"}]
+
+@pytest.mark.parametrize('entry, error', [
+    ({'reps': 10**20}, 'exercises[0].reps is out of range'),
+    ({'sets': -2**31 - 1}, 'exercises[0].sets is out of range'),
+    ({'weight': 1e400}, 'exercises[0].weight must be a finite number'),
+])
+def test_out_of_range_value_fails_only_its_record(client, headers, entry, error):
+    records = [record('before'), record('bad', **entry), record('after')]
+    summary = import_json(client, headers, json.dumps(records))
+    assert summary == {'imported': 2, 'failed': 1, 'errors': [{'index': 1, 'error': error}]}
+
+def test_rejected_insert_fails_only_its_record(client, headers, monkeypatch):
+    insert_batch = importer.insert_batch
+
+    def reject_bad(user_id, batch):
+        if any(workout['name'] == 'bad' for workout, _ in batch):
+            raise RuntimeError('rejected')
+        return insert_batch(user_id, batch)
+    monkeypatch.setattr(importer, 'insert_batch', reject_bad)
+
+    summary = import_json(client, headers, json.dumps([record('before'), record('bad'), record('after')]))
+    assert summary == {'imported': 2, 'failed': 1, 'errors': [{'index': 1, 'error': 'Insert failed: rejected'}]}
+    names = {workout['name'] for workout in client.get('/api/workouts', headers=headers).get_json()}
+    assert names == {'before', 'after'}
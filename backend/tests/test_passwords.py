@@ -0,0 +1,35 @@
+import threading
+import pytest
+import passwords
+
+def test_default_limit_leaves_a_request_thread_free():
+    assert passwords.POOL_SIZE <= passwords.MAX_PENDING < passwords.THREADS
+
+@pytest.mark.parametrize('path', ['/api/auth/register', '/api/auth/login'])
+def test_full_pool_answers_503_with_retry_after(client, monkeypatch, path):
+    password = 'benchmark-password'
+    client.post('/api/auth/register', json={'username': 'pool-user', 'password': password})
+    release = threading.Event()
+    hash_password = passwords._hash
+    monkeypatch.setattr(passwords, '_hash', lambda *args: release.wait(10) and hash_password(*args))
+
+    # Occupy every admitted slot with a hash blocked until released
+    waiting = [threading.Thread(target=passwords.hash_password, args=(password,)) for _ in range(passwords.MAX_PENDING)]
+    for thread in waiting:
+        thread.start()
+    try:
+        for _ in range(1000):
+            if passwords.stats()['pending'] == passwords.MAX_PENDING:
+                break
+            threading.Event().wait(0.01)
+        assert passwords.stats()['pending'] == passwords.MAX_PENDING
+
+        username = 'pool-user' if path.endswith('login') else 'pool-newcomer'
+        response = client.post(path, json={'username': username, 'password': password})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == str(passwords.RETRY_AFTER)
+    finally:
+        release.set()
+        for thread in waiting:
+            thread.join()
+    assert passwords.stats()['pending'] == 0
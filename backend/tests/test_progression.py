@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+import pytest
+
+def post(client, headers, sets):
+    body = {'name': 'Bodyweight', 'date': datetime.utcnow().isoformat(), 'exercises': [
+        {'exerciseId': 1, 'sets': 3, 'reps': reps, 'weight': weight} for reps, weight in sets]}
+    response = client.post('/api/workouts', headers=headers, json=body)
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+def records(client, headers):
+    body = client.get('/api/records?exerciseId=1', headers=headers).get_json()
+    return body[0] if body else {}
+
+def test_bodyweight_sets_set_a_reps_record(app, client, headers):
+    first = post(client, headers, [(15, 0), (12, None)])
+    second = post(client, headers, [(20, 10.0), (18, 0)])
+    record = records(client, headers)
+    assert record['maxReps']['value'] == 18 and record['maxReps']['workoutId'] == second
+    assert record['maxWeight']['value'] == 10.0
+
+    assert client.delete(f'/api/workouts/{second}', headers=headers).status_code == 200
+    record = records(client, headers)
+    assert record['maxReps']['value'] == 15 and record['maxReps']['workoutId'] == first
+    assert 'maxWeight' not in record
+
+    import progression
+    user_id = client.get('/api/auth/me', headers=headers).get_json()['id']
+    with app.app_context():
+        assert progression.check_progress(user_id) == []
+
+def test_weighted_sets_set_no_reps_record(client, headers):
+    post(client, headers, [(10, 50.0)])
+    assert 'maxReps' not in records(client, headers)
+
+def test_series_ends_in_the_current_utc_week(client, headers):
+    post(client, headers, [(10, 0)])
+    weeks = client.get('/api/exercises/1/progress', headers=headers).get_json()['weeks']
+    assert weeks[-1]['sessions'] == 1
+
+def test_series_leaves_out_future_weeks(client, headers):
+    body = {'name': 'Planned', 'date': (datetime.utcnow() + timedelta(weeks=3)).isoformat(),
+            'exercises': [{'exerciseId': 1, 'sets': 3, 'reps': 10, 'weight': 0}]}
+    assert client.post('/api/workouts', headers=headers, json=body).status_code == 201
+    response = client.get('/api/exercises/1/progress', headers=headers)
+    assert response.status_code == 200
+    assert sum(week['sessions'] for week in response.get_json()['weeks']) == 0
+
+@pytest.mark.parametrize('path', ['/api/records', '/api/exercises/1/progress'])
+def test_cached_progress_expires_with_the_week(client, headers, monkeypatch, path):
+    import progression
+    post(client, headers, [(10, 0)])
+    etag = client.get(path, headers=headers).headers['ETag']
+    assert client.get(path, headers=dict(headers, **{'If-None-Match': etag})).status_code == 304
+
+    monkeypatch.setattr(progression, 'utc_today', lambda: datetime.utcnow().date() + timedelta(weeks=1))
+    response = client.get(path, headers=dict(headers, **{'If-None-Match': etag}))
+    assert response.status_code == 200 and response.headers['ETag'] != etag
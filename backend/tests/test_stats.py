@@ -0,0 +1,86 @@
+from datetime import datetime, time, timedelta
+
+def workout_on(days_ago, exercise_ids, duration=30):
+    day = datetime.utcnow().date() - timedelta(days=days_ago)
+    return {'name': f'{days_ago} days ago', 'date': datetime.combine(day, time(12)).isoformat(),
+            'duration': duration,
+            'exercises': [{'exerciseId': exercise_id, 'sets': 3, 'reps': 10, 'weight': 20.0}
+                          for exercise_id in exercise_ids]}
+
+def post(client, headers, body):
+    response = client.post('/api/workouts', headers=headers, json=body)
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+def drift(app, client, headers):
+    import stats
+    user_id = client.get('/api/auth/me', headers=headers).get_json()['id']
+    with app.app_context():
+        return stats.check_rollups(user_id)
+
+def test_this_week_is_the_last_seven_days(client, headers):
+    for days_ago in (0, 6, 7):
+        post(client, headers, workout_on(days_ago, [1]))
+    body = client.get('/api/stats', headers=headers).get_json()
+    assert body['thisWeekWorkouts'] == 2
+    assert body['totalWorkouts'] == 3
+
+def test_totals_follow_writes(app, client, headers):
+    first = post(client, headers, workout_on(30, [1, 2], duration=40))
+    second = post(client, headers, workout_on(2, [2, 2, 3], duration=20))
+    body = client.get('/api/stats', headers=headers).get_json()
+    assert (body['totalWorkouts'], body['totalExercises'], body['totalDuration']) == (2, 5, 60)
+    assert body['avgWorkoutDuration'] == 30
+    assert [exercise['count'] for exercise in body['mostUsedExercises']] == [3, 1, 1]
+
+    assert client.patch(f'/api/workouts/{second}', headers=headers, json={'duration': 50}).status_code == 200
+    assert client.delete(f'/api/workouts/{first}', headers=headers).status_code == 200
+    body = client.get('/api/stats', headers=headers).get_json()
+    assert (body['totalWorkouts'], body['totalExercises'], body['totalDuration']) == (1, 3, 50)
+    assert [exercise['count'] for exercise in body['mostUsedExercises']] == [2, 1]
+    assert drift(app, client, headers) == []
+
+def test_reading_stats_does_not_sum_the_history(client, headers, count_statements):
+    for days_ago in range(20):
+        post(client, headers, workout_on(days_ago, [1, 2]))
+    with count_statements() as statements:
+        assert client.get('/api/stats?days=5', headers=headers).status_code == 200
+    reads = ' '.join(statements)
+    assert 'daily_exercise_stats' not in reads
+    assert 'user_stats' in reads and 'exercise_usage_stats' in reads
+
+def test_cached_stats_expire_with_the_day(client, headers, monkeypatch):
+    import progression
+    post(client, headers, workout_on(0, [1]))
+    first = client.get('/api/stats', headers=headers)
+    cached = {'If-None-Match': first.headers['ETag'], 'If-Modified-Since': first.headers['Last-Modified']}
+    assert client.get('/api/stats', headers=dict(headers, **cached)).status_code == 304
+
+    later = datetime.utcnow() + timedelta(days=10)
+
+    class Later(datetime):
+        @classmethod
+        def utcnow(cls):
+            return later
+    monkeypatch.setattr(progression, 'datetime', Later)
+    for header in cached:
+        response = client.get('/api/stats', headers=dict(headers, **{header: cached[header]}))
+        assert response.status_code == 200
+        assert response.headers['ETag'] != first.headers['ETag']
+
+def test_numeric_strings_are_coerced_before_the_rollups(app, client, headers):
+    body = workout_on(1, [1])
+    body['exercises'][0].update(exerciseId='1', sets='3', reps='10', weight='20.5')
+    post(client, headers, body)
+    entry = client.get('/api/workouts', headers=headers).get_json()[0]['exercises'][0]
+    assert (entry['exerciseId'], entry['sets'], entry['reps'], entry['weight']) == (1, 3, 10, 20.5)
+    assert client.get('/api/stats', headers=headers).get_json()['mostUsedExercises'][0]['count'] == 1
+    assert drift(app, client, headers) == []
+
+def test_invalid_entry_creates_nothing(client, headers):
+    body = workout_on(1, [1])
+    body['exercises'][0]['sets'] = 'abc'
+    response = client.post('/api/workouts', headers=headers, json=body)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'exercises[0].sets must be an integer'
+    assert client.get('/api/stats', headers=headers).get_json()['totalWorkouts'] == 0
@@ -0,0 +1,58 @@
+import pytest
+
+def add_workouts(client, headers, count):
+    """Workouts with a growing number of entries over a few exercises; returns their ids"""
+    ids = []
+    for number in range(count):
+        response = client.post('/api/workouts', headers=headers, json={
+            'name': f'Workout {number}', 'date': f'2026-01-{number % 28 + 1:02d}T10:00:00', 'duration': 30,
+            'exercises': [{'exerciseId': 1 + entry % 5, 'sets': 3, 'reps': 10, 'weight': 20.0 + entry}
+                          for entry in range(1 + number % 6)]})
+        assert response.status_code == 201
+        ids.append(response.get_json()['id'])
+    return ids
+
+def statement_count(client, count_statements, path, headers):
+    client.get(path, headers=headers)  # Warm the token cache and the catalog
+    with count_statements() as statements:
+        response = client.get(path, headers=headers)
+    assert response.status_code == 200
+    return len(statements), response.get_json()
+
+@pytest.mark.parametrize('path', ['/api/workouts', '/api/workouts?limit=100'])
+def test_workout_list_statements_do_not_grow_with_history(client, register, count_statements, path):
+    counts = {}
+    for size in (5, 50):
+        headers = register('history')
+        add_workouts(client, headers, size)
+        counts[size], body = statement_count(client, count_statements, path, headers)
+        workouts = body['workouts'] if isinstance(body, dict) else body
+        assert len(workouts) == size
+        assert all(workout['exercises'][0]['exerciseName'] for workout in workouts)
+    assert counts[5] == counts[50]
+
+def test_workout_detail_statements_do_not_grow_with_history(client, register, count_statements):
+    counts = {}
+    for size in (5, 50):
+        headers = register('detail')
+        ids = add_workouts(client, headers, size)
+        # Five entries over five exercises
+        counts[size], body = statement_count(client, count_statements, f'/api/workouts/{ids[4]}', headers)
+        assert len(body['exercises']) == 5
+    assert counts[5] == counts[50]
+
+@pytest.mark.parametrize('path, error', [
+    ('/api/workouts?limit=abc', 'limit must be a positive integer'),
+    ('/api/workouts?limit=0', 'limit must be a positive integer'),
+    ('/api/workouts/changes?limit=ten', 'limit must be a positive integer'),
+    ('/api/stats?days=7.5', 'days must be a positive integer'),
+    ('/api/records?exerciseId=bench', 'exerciseId must be a positive integer'),
+    ('/api/exercises/1/progress?weeks=abc', 'weeks must be a positive integer'),
+    ('/api/exercises/1/progress?window=-1', 'window must be a positive integer'),
+    ('/api/leaderboards/weeklyVolume?limit=x', 'limit must be a positive integer'),
+    ('/api/leaderboards/weeklyVolume/me?exerciseId=x', 'exerciseId must be a positive integer'),
+])
+def test_malformed_integer_arguments_are_rejected(client, headers, path, error):
+    response = client.get(path, headers=headers)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': error}
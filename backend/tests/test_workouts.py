@@ -0,0 +1,170 @@
+import copy
+import pytest
+
+WORKOUT = {
+    'name': 'Push day', 'date': '2026-01-05T10:00:00', 'duration': 30,
+    'exercises': [
+        {'exerciseId': 1, 'sets': 3, 'reps': 10, 'weight': 50.0, 'notes': ''},
+        {'exerciseId': 2, 'sets': 3, 'reps': 8, 'weight': 60.0, 'notes': ''},
+    ]
+}
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+def writes(statements):
+    """(verb, table) of every write statement, in order"""
+    found = []
+    for statement in statements:
+        words = statement.split()
+        if words[0] in WRITES:
+            found.append((words[0], words[2] if words[0] != 'UPDATE' else words[1]))
+    return found
+
+@pytest.fixture
+def workout(client, headers):
+    response = client.post('/api/workouts', headers=headers, json=WORKOUT)
+    assert response.status_code == 201
+    workout_id = response.get_json()['id']
+    return workout_id, client.get(f'/api/workouts/{workout_id}', headers=headers).get_json()['exercises']
+
+def put_body(entries):
+    """A PUT body resubmitting the given entries as the client received them"""
+    return dict(WORKOUT, exercises=copy.deepcopy(entries))
+
+def test_resubmitted_workout_writes_nothing(client, headers, workout, count_statements):
+    workout_id, entries = workout
+    etag = client.get('/api/workouts', headers=headers).headers['ETag']
+    with count_statements() as statements:
+        response = client.put(f'/api/workouts/{workout_id}', headers=headers, json=put_body(entries))
+    assert response.status_code == 200
+    assert writes(statements) == []
+    assert len(statements) == 2  # The workout and its entries
+    assert client.get('/api/workouts', headers=headers).headers['ETag'] == etag
+
+def test_changing_one_rep_count_updates_one_entry(client, headers, workout, count_statements):
+    workout_id, entries = workout
+    body = put_body(entries)
+    body['exercises'][0]['reps'] = 12
+    with count_statements() as statements:
+        response = client.put(f'/api/workouts/{workout_id}', headers=headers, json=body)
+    assert response.status_code == 200
+    assert writes(statements) == [
+        ('UPDATE', 'workout_exercises'),
+        ('INSERT', 'weekly_exercise_stats'),
+        ('DELETE', 'exercise_sessions'),
+        ('INSERT', 'exercise_sessions'),
+        ('INSERT', 'personal_records'),
+        ('INSERT', 'user_data_versions'),
+        ('UPDATE', 'workouts'),
+    ]
+
+@pytest.mark.parametrize('removed', [0, 2])
+def test_leaving_out_an_entry_deletes_only_that_row(client, headers, count_statements, removed):
+    body = dict(WORKOUT, exercises=[dict(WORKOUT['exercises'][0], reps=reps) for reps in range(1, 7)])
+    workout_id = client.post('/api/workouts', headers=headers, json=body).get_json()['id']
+    entries = client.get(f'/api/workouts/{workout_id}', headers=headers).get_json()['exercises']
+    kept = entries[:removed] + entries[removed + 1:]
+    with count_statements() as statements:
+        response = client.put(f'/api/workouts/{workout_id}', headers=headers, json=put_body(kept))
+    assert response.status_code == 200
+    assert [write for write in writes(statements) if write[1] == 'workout_exercises'] == [
+        ('DELETE', 'workout_exercises')]
+    after = client.get(f'/api/workouts/{workout_id}', headers=headers).get_json()['exercises']
+    assert [(entry['id'], entry['reps']) for entry in after] == [(entry['id'], entry['reps']) for entry in kept]
+
+def test_put_adds_entries_without_an_id(client, headers, workout):
+    workout_id, entries = workout
+    body = put_body(entries)
+    body['exercises'].append({'exerciseId': 3, 'sets': 2, 'reps': 5})
+    assert client.put(f'/api/workouts/{workout_id}', headers=headers, json=body).status_code == 200
+    after = client.get(f'/api/workouts/{workout_id}', headers=headers).get_json()['exercises']
+    assert [entry['id'] for entry in after[:2]] == [entry['id'] for entry in entries]
+    assert after[2]['exerciseId'] == 3
+
+def test_put_with_unknown_entry_is_rejected(client, headers, workout):
+    workout_id, entries = workout
+    body = put_body(entries)
+    body['exercises'][0]['id'] = 999999
+    assert client.put(f'/api/workouts/{workout_id}', headers=headers, json=body).status_code == 400
+    assert client.get(f'/api/workouts/{workout_id}', headers=headers).get_json()['exercises'] == entries
+
+def test_renaming_is_one_workout_update(client, headers, workout, count_statements):
+    workout_id, _ = workout
+    with count_statements() as statements:
+        response = client.patch(f'/api/workouts/{workout_id}', headers=headers, json={'name': 'Renamed'})
+    assert response.status_code == 200 and response.get_json()['name'] == 'Renamed'
+    assert writes(statements) == [('INSERT', 'user_data_versions'), ('UPDATE', 'workouts')]
+
+def test_patching_notes_leaves_progression_alone(client, headers, workout, count_statements):
+    workout_id, entries = workout
+    with count_statements() as statements:
+        response = client.patch(f'/api/workouts/{workout_id}', headers=headers, json={
+            'exercises': {'update': [{'id': entries[1]['id'], 'notes': 'felt good'}]}})
+    assert response.status_code == 200
+    assert sorted(writes(statements)) == [
+        ('INSERT', 'user_data_versions'), ('UPDATE', 'workout_exercises'), ('UPDATE', 'workouts')]
+
+def test_adding_and_removing_entries_touch_only_those_rows(client, headers, workout, count_statements):
+    workout_id, entries = workout
+    with count_statements() as statements:
+        client.patch(f'/api/workouts/{workout_id}', headers=headers, json={
+            'exercises': {'add': [{'exerciseId': 3, 'sets': 2, 'reps': 5}]}})
+    assert [write for write in writes(statements) if write[1] == 'workout_exercises'] == [
+        ('INSERT', 'workout_exercises')]
+    with count_statements() as statements:
+        response = client.patch(f'/api/workouts/{workout_id}', headers=headers, json={
+            'exercises': {'remove': [entries[1]['id']]}})
+    assert [write for write in writes(statements) if write[1] == 'workout_exercises'] == [
+        ('DELETE', 'workout_exercises')]
+    assert [entry['id'] for entry in response.get_json()['exercises']][0] == entries[0]['id']
+
+@pytest.mark.parametrize('body', [
+    ['not', 'an', 'object'],
+    {'exercises': [{'exerciseId': 1, 'sets': 3, 'reps': 10}]},
+    {'exercises': {'update': [1, 2]}},
+    {'exercises': {'update': {'id': 1}}},
+    {'exercises': {'update': [{'reps': 3}]}},
+    {'exercises': {'remove': ['1']}},
+    {'exercises': {'add': [{'exerciseId': 1}]}},
+    {'exercises': {'replace': []}},
+])
+def test_malformed_patch_is_rejected(client, headers, workout, body):
+    workout_id, entries = workout
+    response = client.patch(f'/api/workouts/{workout_id}', headers=headers, json=body)
+    assert response.status_code == 400
+    assert client.get(f'/api/workouts/{workout_id}', headers=headers).get_json()['exercises'] == entries
+
+@pytest.mark.parametrize('body', [
+    {'exercises': {'update': [{'id': 0, 'sets': 'abc'}]}},
+    {'exercises': {'update': [{'id': 0, 'weight': 'heavy'}]}},
+    {'exercises': {'update': [{'id': 0, 'exerciseId': 99999}]}},
+    {'exercises': {'add': [{'exerciseId': 99999, 'sets': 3, 'reps': 10}]}},
+    {'date': 12345},
+    {'name': ''},
+    {'duration': 'long'},
+])
+def test_invalid_patch_values_are_rejected(client, headers, workout, body):
+    workout_id, entries = workout
+    for ex_data in body.get('exercises', {}).get('update', []):
+        ex_data['id'] = entries[0]['id']
+    response = client.patch(f'/api/workouts/{workout_id}', headers=headers, json=body)
+    assert response.status_code == 400
+    assert client.get(f'/api/workouts/{workout_id}', headers=headers).get_json()['exercises'] == entries
+
+@pytest.mark.parametrize('change', [
+    {'exercises': 'notalist'},
+    {'exercises': [{'exerciseId': 1, 'sets': 3}]},
+    {'exercises': [{'exerciseId': 99999, 'sets': 3, 'reps': 10}]},
+    {'exercises': [{'exerciseId': 1, 'sets': 3, 'reps': 10, 'weight': 'heavy'}]},
+    {'date': 12345},
+])
+def test_invalid_put_values_are_rejected(client, headers, workout, change):
+    workout_id, entries = workout
+    response = client.put(f'/api/workouts/{workout_id}', headers=headers, json=dict(put_body(entries), **change))
+    assert response.status_code == 400
+    assert client.get(f'/api/workouts/{workout_id}', headers=headers).get_json()['exercises'] == entries
+
+def test_unknown_entry_is_rejected(client, headers, workout):
+    workout_id, _ = workout
+    response = client.patch(f'/api/workouts/{workout_id}', headers=headers, json={
+        'exercises': {'remove': [999999]}})
+    assert response.status_code == 400
@@ -0,0 +1,45 @@
+"""
+Atomic counter and maximum upserts shared by the rollup, version and record tables
+"""
+from models import db
+
+def insert_on_conflict(model):
+    """Dialect-specific INSERT that supports ON CONFLICT DO UPDATE"""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model.__table__)
+
+def increment(model, keys, rows, replace=(), returning=()):
+    """Atomically add each row's deltas to its row, creating rows as needed
+
+    keys names the primary key columns and replace the columns that are overwritten;
+    every other column in the rows is a delta. All rows go out as a single executemany.
+    With returning, the result rows of those columns after the update are returned.
+    """
+    if not rows:
+        return None
+    columns = model.__table__.c
+    stmt = insert_on_conflict(model)
+    set_ = {name: columns[name] + stmt.excluded[name]
+            for name in rows[0] if name not in keys and name not in replace}
+    set_.update({name: stmt.excluded[name] for name in replace})
+    stmt = stmt.on_conflict_do_update(index_elements=keys, set_=set_)
+    if returning:
+        stmt = stmt.returning(*(columns[name] for name in returning), sort_by_parameter_order=True)
+    return db.session.execute(stmt, rows)
+
+def maximize(model, keys, value, rows):
+    """Atomically raise each row's value column to the given one, creating rows as needed
+
+    The other columns are only overwritten together with a strictly higher value.
+    Rows must have distinct keys; all of them go out as a single executemany.
+    """
+    if not rows:
+        return
+    stmt = insert_on_conflict(model)
+    set_ = {name: stmt.excluded[name] for name in rows[0] if name not in keys}
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=keys, set_=set_, where=model.__table__.c[value] < stmt.excluded[value]
+    ), rows)
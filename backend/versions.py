@@ -0,0 +1,79 @@
+"""
+Per-user change versioning for conditional workout reads
+Every workout write bumps the user's version row in the same transaction. Reads
+compare it with If-None-Match/If-Modified-Since and answer 304 without loading
+any workout rows.
+"""
+import zlib
+from datetime import datetime, time, timezone
+from functools import wraps
+from flask import request, make_response, Response
+from models import db, UserDataVersion
+from upsert import increment
+
+# Bump when the workout payload format changes so cached responses are not reused
+PAYLOAD_VERSION = 2
+
+def bump(user_id):
+    """Record that a user's workout data changed; call inside the write transaction
+
+    Returns the new version. The upsert locks the user's row until commit, so a
+    user's writes get their versions in commit order; changed workouts and
+    tombstones are stamped with it for delta sync.
+    """
+    return increment(UserDataVersion, ['user_id'],
+                     [{'user_id': user_id, 'version': 1, 'updated_at': datetime.utcnow()}],
+                     replace=['updated_at'], returning=['version']).scalar_one()
+
+def get(user_id):
+    """Return (version, updated_at) for a user with a single primary key lookup"""
+    row = db.session.query(UserDataVersion.version, UserDataVersion.updated_at).filter_by(
+        user_id=user_id).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+def make_etag(user_id, version, period=None):
+    """Strong ETag for a user's data version, the request's query string and, for
+    responses that depend on the date, the start of the current period"""
+    query = zlib.crc32(request.query_string) if request.query_string else 0
+    etag = f"{user_id}-{version}-{PAYLOAD_VERSION}-{query:x}"
+    return f"{etag}-{period:%Y%m%d}" if period else etag
+
+def _not_modified(etag, updated_at):
+    if request.if_none_match:
+        # Weak comparison, as RFC 7232 requires: compressed responses carry W/ tags
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and updated_at:
+        return updated_at.replace(microsecond=0, tzinfo=timezone.utc) <= request.if_modified_since
+    return False
+
+def conditional(f=None, *, period=None):
+    """Decorator for workout reads: adds ETag/Last-Modified and answers 304 when unchanged
+
+    Must be applied below token_required so the handler receives current_user.
+    Responses covering a window that ends today, like the last 7 days, also change
+    as days pass: period() returns the (UTC) date the current window started, e.g.
+    today, and a new period counts as a change.
+    """
+    if f is None:
+        return lambda f: conditional(f, period=period)
+
+    @wraps(f)
+    def decorated(current_user, *args, **kwargs):
+        version, updated_at = get(current_user.id)
+        start = period() if period else None
+        if start is not None:
+            started_at = datetime.combine(start, time())
+            updated_at = max(updated_at, started_at) if updated_at else started_at
+        etag = make_etag(current_user.id, version, start)
+        if _not_modified(etag, updated_at):
+            response = Response(status=304)
+        else:
+            response = make_response(f(current_user, *args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        if updated_at:
+            response.last_modified = updated_at.replace(tzinfo=timezone.utc)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return decorated
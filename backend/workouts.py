@@ -0,0 +1,291 @@
+"""
+Applying client changes to workouts
+Exercise entries are diffed against the stored rows so an edit only issues the
+INSERT/UPDATE/DELETE statements it actually needs. create/update/patch/delete
+keep the rollups, progression rows and delta sync versions in step; they are
+shared by the workout routes and POST /api/batch, and the caller commits.
+"""
+import math
+from datetime import datetime
+from models import db, Workout, WorkoutExercise
+from catalog import catalog
+import stats
+import progression
+import versions
+import sync
+
+# Range of an INTEGER column, checked per value so one bad number cannot fail a whole write
+INT_MIN, INT_MAX = -2**31, 2**31 - 1
+
+def parse_date(date_str):
+    """Parse an ISO 8601 date as sent by the frontend; raises ValueError"""
+    if 'Z' in date_str:
+        date_str = date_str.replace('Z', '+00:00')
+    return datetime.fromisoformat(date_str)
+
+def parse_int(value, field, required=True):
+    """An INTEGER column value from JSON or CSV input (numeric strings allowed); raises ValueError"""
+    if value is None or value == '':
+        if required:
+            raise ValueError(f'{field} is required')
+        return None
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f'{field} must be an integer')
+    try:
+        number = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f'{field} must be an integer')
+    if not INT_MIN <= number <= INT_MAX:
+        raise ValueError(f'{field} is out of range')
+    return number
+
+def parse_float(value, field):
+    """An optional FLOAT column value from JSON or CSV input; raises ValueError"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f'{field} must be a number')
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} must be a number')
+    if not math.isfinite(number):
+        raise ValueError(f'{field} must be a finite number')
+    return number
+
+def workout_values(data, partial=False):
+    """Validated name/date/duration column values of a workout body; raises ValueError
+
+    A partial body (PUT/PATCH) only yields the fields it contains; otherwise a
+    missing date means now.
+    """
+    values = {}
+    if not partial or 'name' in data:
+        name = data.get('name')
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError('Workout name is required')
+        if len(name) > 100:
+            raise ValueError('Workout name is too long')
+        values['name'] = name
+    if not partial or 'date' in data:
+        date = data.get('date')
+        if date in (None, '') and not partial:
+            values['date'] = datetime.utcnow()
+        else:
+            try:
+                values['date'] = parse_date(date)
+            except (TypeError, ValueError):
+                raise ValueError(f'Invalid date: {date}')
+    if not partial or 'duration' in data:
+        values['duration'] = parse_int(data.get('duration'), 'duration', required=False)
+    return values
+
+def entry_values(ex_data, label='exercise', known=None, partial=False):
+    """Validated column values for an exercise entry as sent by the client; raises ValueError
+
+    exerciseId is checked against known (a set of catalog ids) or else the live
+    catalog. A partial entry (a PATCH update) only yields the fields it contains.
+    """
+    if not isinstance(ex_data, dict):
+        raise ValueError(f'{label} must be an object')
+    values = {}
+    if not partial or 'exerciseId' in ex_data:
+        exercise_id = parse_int(ex_data.get('exerciseId'), f'{label}.exerciseId')
+        if (exercise_id not in known) if known is not None else catalog.get(exercise_id) is None:
+            raise ValueError(f'{label}.exerciseId {exercise_id} does not exist')
+        values['exercise_id'] = exercise_id
+    for field in ('sets', 'reps'):
+        if not partial or field in ex_data:
+            values[field] = parse_int(ex_data.get(field), f'{label}.{field}')
+    if not partial or 'weight' in ex_data:
+        values['weight'] = parse_float(ex_data.get('weight'), f'{label}.weight')
+    if not partial or 'notes' in ex_data:
+        notes = ex_data.get('notes')
+        if notes is not None and not isinstance(notes, str):
+            raise ValueError(f'{label}.notes must be a string')
+        values['notes'] = notes or ''
+    return values
+
+def validate_entries(exercises, known=None):
+    """(entry id or None, column values) for a full list of exercise entries; raises ValueError"""
+    if not isinstance(exercises, list):
+        raise ValueError('exercises must be a list')
+    entries = []
+    for position, ex_data in enumerate(exercises):
+        label = f'exercises[{position}]'
+        values = entry_values(ex_data, label, known)
+        entry_id = ex_data.get('id')
+        if entry_id is not None and not _is_id(entry_id):
+            raise ValueError(f'{label}.id must be an integer')
+        entries.append((entry_id, values))
+    return entries
+
+def _assign(row, values):
+    """Set only the columns whose value actually changed, so unchanged rows stay clean"""
+    for column, value in values.items():
+        if getattr(row, column) != value:
+            setattr(row, column, value)
+
+def sync_exercises(workout, entries):
+    """Make a workout's exercise rows match a full list of validated entries
+
+    Entries are matched by the id the API returned for them: those rows are updated
+    in place (keeping their id and created_at), entries without an id are inserted
+    and rows whose id is not listed are deleted. Raises KeyError for an id that does
+    not belong to the workout or is listed twice.
+    """
+    rows = {row.id: row for row in workout.workout_exercises}
+    listed = set()
+    for entry_id, values in entries:
+        if entry_id is None:
+            workout.workout_exercises.append(WorkoutExercise(**values))
+            continue
+        if entry_id not in rows or entry_id in listed:
+            raise KeyError(entry_id)
+        listed.add(entry_id)
+        _assign(rows[entry_id], values)
+    for entry_id, row in rows.items():
+        if entry_id not in listed:
+            workout.workout_exercises.remove(row)
+
+def patch_exercises(workout, changes):
+    """Apply validated partial changes to individual exercise entries
+
+    changes holds 'update' ((entry id, columns to change) pairs), 'add' (column
+    values of new entries) and 'remove' (entry ids), as returned by
+    validate_changes. Raises KeyError for an id that does not belong to the workout.
+    """
+    rows = {row.id: row for row in workout.workout_exercises}
+    for entry_id, values in changes['update']:
+        row = rows.get(entry_id)
+        if row is None:
+            raise KeyError(entry_id)
+        _assign(row, values)
+    for entry_id in changes['remove']:
+        row = rows.pop(entry_id, None)
+        if row is None:
+            raise KeyError(entry_id)
+        workout.workout_exercises.remove(row)
+    for values in changes['add']:
+        workout.workout_exercises.append(WorkoutExercise(**values))
+
+PATCH_CHANGES = ('update', 'add', 'remove')
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def validate_changes(changes):
+    """Validate a PATCH 'exercises' object before any of it is applied; raises ValueError
+
+    Returns it in the form patch_exercises takes.
+    """
+    if not isinstance(changes, dict):
+        raise ValueError("exercises must be an object with 'update', 'add' and/or 'remove'")
+    unknown = sorted(set(changes) - set(PATCH_CHANGES))
+    if unknown:
+        raise ValueError(f"Unknown exercises changes: {', '.join(unknown)}")
+    for name in PATCH_CHANGES:
+        if not isinstance(changes.get(name, []), list):
+            raise ValueError(f'exercises.{name} must be a list')
+    if not all(isinstance(ex_data, dict) and _is_id(ex_data.get('id')) for ex_data in changes.get('update', [])):
+        raise ValueError('Every exercises.update entry must be an object with an integer id')
+    if not all(_is_id(entry_id) for entry_id in changes.get('remove', [])):
+        raise ValueError('exercises.remove must list integer entry ids')
+    return {
+        'update': [(ex_data['id'], entry_values(ex_data, f'exercises.update[{position}]', partial=True))
+                   for position, ex_data in enumerate(changes.get('update', []))],
+        'add': [entry_values(ex_data, f'exercises.add[{position}]')
+                for position, ex_data in enumerate(changes.get('add', []))],
+        'remove': changes.get('remove', [])
+    }
+
+def exercise_ids(workout):
+    """Exercise ids of a workout's entries as currently held in the session"""
+    return [row.exercise_id for row in workout.workout_exercises]
+
+def create(user_id, data):
+    """Add a workout and its exercise entries from a request body; returns the workout
+
+    Every field is validated (and numeric strings coerced) before anything is
+    written or rolled up; raises ValueError.
+    """
+    values = workout_values(data)
+    entries = [entry for _, entry in validate_entries(data.get('exercises', []))]
+    
+    workout = Workout(
+        change_version=versions.bump(user_id),
+        user_id=user_id,
+        **values
+    )
+    db.session.add(workout)
+    db.session.flush()
+    
+    for entry in entries:
+        db.session.add(WorkoutExercise(workout_id=workout.id, **entry))
+    
+    stats.apply_rollup(stats.workout_rollup(workout, [entry['exercise_id'] for entry in entries]))
+    progression.apply_progress([
+        (None, progression.workout_progress(user_id, workout.id, workout.date, [
+            (entry['exercise_id'], entry['sets'], entry['reps'], entry['weight']) for entry in entries]))])
+    return workout
+
+def _edit(workout, values, exercises, apply_exercises):
+    """Apply validated workout values and exercise changes (None to leave the entries alone)
+
+    Returns False, having written nothing, when they change nothing.
+    """
+    old_entries = list(workout.workout_exercises)
+    old_rollup = stats.workout_rollup(workout, exercise_ids(workout))
+    old_progress = progression.current_progress(workout)
+    
+    _assign(workout, values)
+    if exercises is not None:
+        apply_exercises(workout, exercises)
+    
+    entries = list(workout.workout_exercises)
+    # Resubmitted data leaves every attribute unmodified: no rollups, versions or UPDATE
+    if (entries == old_entries and not db.session.is_modified(workout)
+            and not any(db.session.is_modified(row) for row in entries)):
+        return False
+    
+    new_rollup = stats.workout_rollup(workout, exercise_ids(workout))
+    stats.replace_rollup(old_rollup, new_rollup)
+    new_progress = progression.current_progress(workout)
+    if new_progress != old_progress:
+        progression.apply_progress([(old_progress, new_progress)])
+    # Without autoflush the edited columns and the new version go out in one UPDATE
+    with db.session.no_autoflush:
+        workout.change_version = versions.bump(workout.user_id)
+    return True
+
+def update(workout, data):
+    """Apply a full update (PUT body); a given exercise list replaces the entries
+
+    Returns False when nothing changed. Raises ValueError for invalid fields and
+    KeyError for an entry id that does not belong to the workout.
+    """
+    values = workout_values(data, partial=True)
+    entries = validate_entries(data['exercises']) if 'exercises' in data else None
+    return _edit(workout, values, entries, sync_exercises)
+
+def patch(workout, data):
+    """Apply a partial update (PATCH body); returns False when nothing changed
+
+    Raises ValueError for invalid fields or a malformed 'exercises' object and
+    KeyError for an entry id that does not belong to the workout.
+    """
+    values = workout_values(data, partial=True)
+    changes = validate_changes(data['exercises']) if 'exercises' in data else None
+    return _edit(workout, values, changes, patch_exercises)
+
+def delete(workout):
+    """Delete a workout, leaving a tombstone for delta sync"""
+    # One read of the stored entries serves both the rollups and the progression tables
+    old_progress = progression.stored_progress(workout)
+    stats.apply_rollup(stats.workout_rollup(workout, old_progress.exercise_ids), -1)
+    sync.record_deletions(workout.user_id, [workout.id], versions.bump(workout.user_id))
+    
+    # Delete associated workout exercises
+    WorkoutExercise.query.filter_by(workout_id=workout.id).delete()
+    db.session.delete(workout)
+    progression.apply_progress([(old_progress, None)])
@@ -5,7 +5,7 @@ import WorkoutTracker from './components/WorkoutTracker'
 import ExerciseLibrary from './components/ExerciseLibrary'
 import Progress from './components/Progress'
 import Login from './components/Login'
-import { exerciseAPI, workoutAPI } from './services/api'
+import { exerciseAPI, syncWorkouts } from './services/api'
 import { ToastProvider, useToast } from './contexts/ToastContext'
 import { AuthProvider, useAuth } from './contexts/AuthContext'
 import './App.css'
@@ -70,6 +70,8 @@ function AppContent() {
   const { user, loading: authLoading, logout } = useAuth()
   const toast = useToast()
   const fetchedUserIdRef = useRef(null)
+  // Sync token of the workouts held in state; refreshes only fetch what changed since
+  const syncTokenRef = useRef(null)
 
   useEffect(() => {
     if (!user) {
@@ -77,6 +79,7 @@ function AppContent() {
       setWorkouts([])
       setLoading(false)
       fetchedUserIdRef.current = null
+      syncTokenRef.current = null
     }
   }, [user])
 
@@ -104,7 +107,12 @@ function AppContent() {
         
         const [exercisesData, workoutsData] = await Promise.all([
           exerciseAPI.getAll().catch(handleAuthError),
-          workoutAPI.getAll().catch(handleAuthError)
+          syncWorkouts([], null)
+            .then(({ workouts, token }) => {
+              syncTokenRef.current = token
+              return workouts
+            })
+            .catch(handleAuthError)
         ])
         
         setExercises(Array.isArray(exercisesData) ? exercisesData : [])
@@ -133,9 +141,12 @@ function AppContent() {
 
   const refreshWorkouts = async () => {
     try {
-      const workoutsData = await workoutAPI.getAll()
+      const { workouts: workoutsData, token } = await syncWorkouts(workouts, syncTokenRef.current)
+      syncTokenRef.current = token
       setWorkouts(workoutsData)
     } catch (err) {
+      // The next refresh starts over with a full sync
+      syncTokenRef.current = null
       if (err.message === 'Authentication required') {
         logout()
         setShouldRedirect(true)
@@ -189,7 +200,7 @@ function AppContent() {
               path="/exercises" 
               element={
                 <ProtectedRoute>
-                  <ExerciseLibrary exercises={exercises} />
+                  <ExerciseLibrary />
                 </ProtectedRoute>
               } 
             />
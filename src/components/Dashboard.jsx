@@ -1,24 +1,27 @@
-import React from 'react'
+import React, { useEffect, useState } from 'react'
 import { Link } from 'react-router-dom'
+import { statsAPI } from '../services/api'
 import './Dashboard.css'
 
+const EMPTY_SUMMARY = { totalWorkouts: 0, thisWeekWorkouts: 0, totalExercises: 0, totalDuration: 0 }
+
 function Dashboard({ workouts }) {
-  const totalWorkouts = workouts.length
-  const thisWeekWorkouts = workouts.filter(workout => {
-    const workoutDate = new Date(workout.date)
-    const weekAgo = new Date()
-    weekAgo.setDate(weekAgo.getDate() - 7)
-    return workoutDate >= weekAgo
-  }).length
+  const [summary, setSummary] = useState(EMPTY_SUMMARY)
 
-  const totalExercises = workouts.reduce((sum, workout) => sum + workout.exercises.length, 0)
-  const totalDuration = workouts.reduce((sum, workout) => sum + (workout.duration || 0), 0)
+  // Totals come from the server's running totals; refetched whenever the workouts change
+  useEffect(() => {
+    let cancelled = false
+    statsAPI.get(1)
+      .then(data => { if (!cancelled) setSummary(data) })
+      .catch(() => {})
+    return () => { cancelled = true }
+  }, [workouts])
 
   const stats = [
-    { label: 'Total Workouts', value: totalWorkouts, icon: '📊', color: '#00bfff' },
-    { label: 'This Week', value: thisWeekWorkouts, icon: '📅', color: '#0096ff' },
-    { label: 'Exercises Done', value: totalExercises, icon: '💪', color: '#40e0d0' },
-    { label: 'Total Minutes', value: totalDuration, icon: '⏱️', color: '#00ced1' },
+    { label: 'Total Workouts', value: summary.totalWorkouts, icon: '📊', color: '#00bfff' },
+    { label: 'This Week', value: summary.thisWeekWorkouts, icon: '📅', color: '#0096ff' },
+    { label: 'Exercises Done', value: summary.totalExercises, icon: '💪', color: '#40e0d0' },
+    { label: 'Total Minutes', value: summary.totalDuration, icon: '⏱️', color: '#00ced1' },
   ]
 
   const recentWorkouts = workouts.slice(-3).reverse()
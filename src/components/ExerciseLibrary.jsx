@@ -1,19 +1,56 @@
-import React, { useState } from 'react'
+import React, { useEffect, useState } from 'react'
+import { exerciseAPI } from '../services/api'
 import './ExerciseLibrary.css'
 
-function ExerciseLibrary({ exercises }) {
+const PAGE_SIZE = 24
+const SEARCH_DELAY = 200 // ms to wait after typing before searching
+
+const EMPTY_RESULTS = { exercises: [], total: 0, nextOffset: null, facets: { category: {}, muscle: {} } }
+
+function ExerciseLibrary() {
   const [selectedCategory, setSelectedCategory] = useState('All')
+  const [selectedMuscle, setSelectedMuscle] = useState('All')
   const [searchTerm, setSearchTerm] = useState('')
+  const [results, setResults] = useState(EMPTY_RESULTS)
+  const [loading, setLoading] = useState(true)
 
-  const categories = ['All', ...new Set(exercises.map(ex => ex.category))]
-
-  const filteredExercises = exercises.filter(exercise => {
-    const matchesCategory = selectedCategory === 'All' || exercise.category === selectedCategory
-    const matchesSearch = exercise.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-                         exercise.muscle.toLowerCase().includes(searchTerm.toLowerCase())
-    return matchesCategory && matchesSearch
+  // Searching, filtering and paging happen on the server
+  const fetchPage = (offset) => exerciseAPI.search({
+    q: searchTerm.trim(),
+    category: selectedCategory === 'All' ? '' : selectedCategory,
+    muscle: selectedMuscle === 'All' ? '' : selectedMuscle,
+    limit: PAGE_SIZE,
+    offset
   })
 
+  useEffect(() => {
+    let cancelled = false
+    const timer = setTimeout(() => {
+      setLoading(true)
+      fetchPage(0)
+        .then(data => { if (!cancelled) setResults(data) })
+        .catch(() => { if (!cancelled) setResults(EMPTY_RESULTS) })
+        .finally(() => { if (!cancelled) setLoading(false) })
+    }, SEARCH_DELAY)
+    return () => {
+      cancelled = true
+      clearTimeout(timer)
+    }
+  }, [searchTerm, selectedCategory, selectedMuscle])
+
+  const loadMore = () => {
+    setLoading(true)
+    fetchPage(results.nextOffset)
+      .then(data => setResults(prev => ({ ...data, exercises: [...prev.exercises, ...data.exercises] })))
+      .catch(() => {})
+      .finally(() => setLoading(false))
+  }
+
+  // Facet counts leave out their own filter, so every option stays visible
+  const categories = ['All', ...Object.keys(results.facets.category)]
+  const muscles = ['All', ...Object.keys(results.facets.muscle)]
+  const filteredExercises = results.exercises
+
   return (
     <div className="exercise-library">
       <h1>Exercise Library 📚</h1>
@@ -40,6 +77,18 @@ function ExerciseLibrary({ exercises }) {
             </button>
           ))}
         </div>
+
+        <div className="category-filters muscle-filters">
+          {muscles.map(muscle => (
+            <button
+              key={muscle}
+              className={`category-btn ${selectedMuscle === muscle ? 'active' : ''}`}
+              onClick={() => setSelectedMuscle(muscle)}
+            >
+              {muscle === 'All' ? 'All muscles' : `${muscle} (${results.facets.muscle[muscle]})`}
+            </button>
+          ))}
+        </div>
       </div>
 
       <div className="exercises-grid">
@@ -75,7 +124,15 @@ function ExerciseLibrary({ exercises }) {
         ))}
       </div>
 
-      {filteredExercises.length === 0 && (
+      {results.nextOffset !== null && (
+        <div className="load-more">
+          <button className="category-btn" onClick={loadMore} disabled={loading}>
+            {loading ? 'Loading...' : `Show more (${results.total - filteredExercises.length} left)`}
+          </button>
+        </div>
+      )}
+
+      {!loading && filteredExercises.length === 0 && (
         <div className="no-results">
           <p>No exercises found matching your search.</p>
         </div>
@@ -1,59 +1,29 @@
-import React from 'react'
+import React, { useEffect, useState } from 'react'
+import { statsAPI } from '../services/api'
 import './Progress.css'
 
+const DAYS_SHOWN = 14
+
+const EMPTY_STATS = {
+  totalWorkouts: 0, totalExercises: 0, totalDuration: 0, avgWorkoutDuration: 0, daily: [], mostUsedExercises: []
+}
+
 function Progress({ workouts }) {
-  const getWeeklyStats = () => {
-    const days = {}
-    workouts.forEach(workout => {
-      const date = new Date(workout.date)
-      // Get just the date part (without time)
-      const dateKey = date.toISOString().split('T')[0]
-      
-      if (!days[dateKey]) {
-        days[dateKey] = {
-          date: dateKey,
-          workouts: 0,
-          exercises: 0,
-          duration: 0
-        }
-      }
-      
-      days[dateKey].workouts++
-      days[dateKey].exercises += workout.exercises.length
-      days[dateKey].duration += workout.duration || 0
-    })
-    
-    // Sort by date descending and take last 14 days
-    const sortedDays = Object.values(days)
-      .sort((a, b) => new Date(b.date) - new Date(a.date))
-      .slice(0, 14)
-    
-    return sortedDays
-  }
-
-  const dailyStats = getWeeklyStats() // Returns daily stats (last 14 days)
-
-  const getMostUsedExercises = () => {
-    const exerciseCount = {}
-    workouts.forEach(workout => {
-      workout.exercises.forEach(ex => {
-        const name = ex.exerciseName
-        exerciseCount[name] = (exerciseCount[name] || 0) + 1
-      })
-    })
-    
-    return Object.entries(exerciseCount)
-      .sort((a, b) => b[1] - a[1])
-      .slice(0, 5)
-      .map(([name, count]) => ({ name, count }))
-  }
-
-  const mostUsedExercises = getMostUsedExercises()
-
-  const totalWorkouts = workouts.length
-  const totalExercises = workouts.reduce((sum, w) => sum + w.exercises.length, 0)
-  const totalDuration = workouts.reduce((sum, w) => sum + (w.duration || 0), 0)
-  const avgWorkoutDuration = totalWorkouts > 0 ? Math.round(totalDuration / totalWorkouts) : 0
+  const [stats, setStats] = useState(EMPTY_STATS)
+
+  // Computed on the server from its rollups; refetched whenever the workouts change
+  useEffect(() => {
+    let cancelled = false
+    statsAPI.get(DAYS_SHOWN)
+      .then(data => { if (!cancelled) setStats(data) })
+      .catch(() => {})
+    return () => { cancelled = true }
+  }, [workouts])
+
+  // Days with activity, newest first
+  const dailyStats = stats.daily
+  const mostUsedExercises = stats.mostUsedExercises
+  const { totalWorkouts, totalExercises, totalDuration, avgWorkoutDuration } = stats
 
   return (
     <div className="progress">
@@ -3,6 +3,11 @@ const API_BASE_URL = import.meta.env.VITE_API_URL || '/api'
 
 const getAuthToken = () => localStorage.getItem('token')
 
+// Set by the API after a write and sent back on later calls, so the reads that follow
+// go to the primary database whichever server worker answers them (see backend/replicas.py)
+const READ_PRIMARY_HEADER = 'X-Read-Primary-Until'
+let readPrimaryUntil = null
+
 async function apiCall(endpoint, options = {}) {
   const url = `${API_BASE_URL}${endpoint}`
   const token = getAuthToken()
@@ -11,6 +16,7 @@ async function apiCall(endpoint, options = {}) {
     headers: {
       'Content-Type': 'application/json',
       ...(token && { 'Authorization': `Bearer ${token}` }),
+      ...(readPrimaryUntil && { [READ_PRIMARY_HEADER]: readPrimaryUntil }),
       ...options.headers,
     },
     ...options,
@@ -22,6 +28,7 @@ async function apiCall(endpoint, options = {}) {
 
   try {
     const response = await fetch(url, config)
+    readPrimaryUntil = response.headers.get(READ_PRIMARY_HEADER) || readPrimaryUntil
     
     // Check content type before parsing
     const contentType = response.headers.get('content-type') || ''
@@ -63,6 +70,10 @@ async function apiCall(endpoint, options = {}) {
 
 export const exerciseAPI = {
   getAll: () => apiCall('/exercises'),
+  // params: q, category, muscle, limit, offset; empty values are left out
+  search: (params) => apiCall(`/exercises?${new URLSearchParams(
+    Object.entries(params).filter(([, value]) => value !== '' && value !== null && value !== undefined)
+  )}`),
   getById: (id) => apiCall(`/exercises/${id}`),
   create: (exercise) => apiCall('/exercises', { method: 'POST', body: exercise }),
 }
@@ -73,6 +84,42 @@ export const workoutAPI = {
   create: (workout) => apiCall('/workouts', { method: 'POST', body: workout }),
   update: (id, workout) => apiCall(`/workouts/${id}`, { method: 'PUT', body: workout }),
   delete: (id) => apiCall(`/workouts/${id}`, { method: 'DELETE' }),
+  // Workouts written and deleted since a sync token; no token returns every workout
+  changes: (since) => apiCall(`/workouts/changes${since ? `?since=${encodeURIComponent(since)}` : ''}`),
+  // operations: [{ op, workoutId, data, idempotencyKey }]; mode 'transaction' or 'savepoint'
+  batch: (operations, mode = 'transaction') => apiCall('/batch', { method: 'POST', body: { mode, operations } }),
+}
+
+// Totals, workouts of the last 7 days, the latest `days` days with activity and the most used exercises
+export const statsAPI = {
+  get: (days) => apiCall(`/stats${days ? `?days=${days}` : ''}`),
+}
+
+// metric: maxWeight, estimated1RM, bestVolume, maxReps or weeklyVolume (no exerciseId ranks all exercises)
+const leaderboardQuery = (params) => new URLSearchParams(
+  Object.entries(params).filter(([, value]) => value !== null && value !== undefined)
+)
+
+export const leaderboardAPI = {
+  getTop: (metric, exerciseId, limit) => apiCall(`/leaderboards/${metric}?${leaderboardQuery({ exerciseId, limit })}`),
+  getMine: (metric, exerciseId) => apiCall(`/leaderboards/${metric}/me?${leaderboardQuery({ exerciseId })}`),
+}
+
+// Newest first, as GET /workouts returns them
+const newestFirst = (a, b) => (a.date < b.date ? 1 : a.date > b.date ? -1 : b.id - a.id)
+
+// Apply the changes since `token` to a list of workouts; returns { workouts, token }.
+// Without a token the server sends every workout and no deletions, so the list starts empty
+export async function syncWorkouts(workouts, token) {
+  const byId = new Map(token ? workouts.map(workout => [workout.id, workout]) : [])
+  let page
+  do {
+    page = await workoutAPI.changes(token)
+    page.deletions.forEach(id => byId.delete(id))
+    page.upserts.forEach(workout => byId.set(workout.id, workout))
+    token = page.nextToken
+  } while (page.hasMore)
+  return { workouts: [...byId.values()].sort(newestFirst), token }
 }
 
 export const healthCheck = () => apiCall('/health')
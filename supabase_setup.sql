@@ -21,6 +21,25 @@ CREATE TABLE IF NOT EXISTS exercises (
     created_at TIMESTAMP DEFAULT NOW()
 );
 
+-- Krijo tabelën exercise_muscles (grupet e normalizuara të muskujve për kërkimin e ushtrimeve)
+CREATE TABLE IF NOT EXISTS exercise_muscles (
+    exercise_id INTEGER NOT NULL REFERENCES exercises(id) ON DELETE CASCADE,
+    muscle VARCHAR(50) NOT NULL,
+    PRIMARY KEY (exercise_id, muscle)
+);
+
+-- Krijo tabelën catalog_version (versioni i katalogut të ushtrimeve për cache)
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+-- Krijo tabelën schema_version (versioni i migrimeve, kontrollohet me një query)
+CREATE TABLE IF NOT EXISTS schema_version (
+    id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
 -- Krijo tabelën workouts
 CREATE TABLE IF NOT EXISTS workouts (
     id SERIAL PRIMARY KEY,
@@ -31,6 +50,10 @@ CREATE TABLE IF NOT EXISTS workouts (
     created_at TIMESTAMP DEFAULT NOW()
 );
 
+-- Kolonat e sinkronizimit me ndryshime (migrimi 5); change_version është versioni i të dhënave të përdoruesit
+ALTER TABLE workouts ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW();
+ALTER TABLE workouts ADD COLUMN IF NOT EXISTS change_version INTEGER NOT NULL DEFAULT 0;
+
 -- Krijo tabelën workout_exercises
 CREATE TABLE IF NOT EXISTS workout_exercises (
     id SERIAL PRIMARY KEY,
@@ -42,11 +65,136 @@ CREATE TABLE IF NOT EXISTS workout_exercises (
     notes TEXT,
     created_at TIMESTAMP DEFAULT NOW()
 );
+ALTER TABLE workout_exercises ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW();
+
+-- Krijo tabelën workout_tombstones (workout-et e fshirë, që klientët t'i heqin gjatë sinkronizimit)
+CREATE TABLE IF NOT EXISTS workout_tombstones (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    workout_id INTEGER NOT NULL,
+    change_version INTEGER NOT NULL,
+    deleted_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, workout_id)
+);
+-- Çelësi sipas përdoruesit (migrimi 6): id-të e workout-eve përsëriten ndërmjet shard-eve
+ALTER TABLE workout_tombstones DROP CONSTRAINT IF EXISTS workout_tombstones_pkey, ADD PRIMARY KEY (user_id, workout_id);
+
+-- Krijo tabelën user_shards (shard-i që mban workout-et e çdo përdoruesi, vetëm në DATABASE_URL)
+CREATE TABLE IF NOT EXISTS user_shards (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    shard INTEGER NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Krijo tabelën idempotency_keys (rezultatet e operacioneve të /api/batch, për përsëritjet e klientit)
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    key VARCHAR(100) NOT NULL,
+    fingerprint VARCHAR(64) NOT NULL,
+    status INTEGER NOT NULL,
+    response TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, key)
+);
+
+-- Krijo tabelën user_data_versions (versioni i të dhënave për ETag/304)
+CREATE TABLE IF NOT EXISTS user_data_versions (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Krijo tabelën daily_stats (përmbledhje ditore për statistikat)
+CREATE TABLE IF NOT EXISTS daily_stats (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    workouts INTEGER NOT NULL DEFAULT 0,
+    exercises INTEGER NOT NULL DEFAULT 0,
+    duration INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+
+-- Krijo tabelën daily_exercise_stats (përdorimi ditor i ushtrimeve)
+CREATE TABLE IF NOT EXISTS daily_exercise_stats (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    exercise_id INTEGER NOT NULL REFERENCES exercises(id) ON DELETE CASCADE,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day, exercise_id)
+);
+
+-- Krijo tabelën user_stats (totalet e përdoruesit për gjithë historinë, bashkë me daily_stats; migrimi 9)
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    workouts INTEGER NOT NULL DEFAULT 0,
+    exercises INTEGER NOT NULL DEFAULT 0,
+    duration INTEGER NOT NULL DEFAULT 0
+);
+
+-- Krijo tabelën exercise_usage_stats (sa herë përdoruesi ka regjistruar çdo ushtrim, gjithsej)
+CREATE TABLE IF NOT EXISTS exercise_usage_stats (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    exercise_id INTEGER NOT NULL REFERENCES exercises(id) ON DELETE CASCADE,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, exercise_id)
+);
+
+-- Krijo tabelën exercise_sessions (përmbledhja e çdo ushtrimi në çdo stërvitje, për rillogaritjen e rekordeve)
+CREATE TABLE IF NOT EXISTS exercise_sessions (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    exercise_id INTEGER NOT NULL REFERENCES exercises(id) ON DELETE CASCADE,
+    workout_id INTEGER NOT NULL REFERENCES workouts(id) ON DELETE CASCADE,
+    date TIMESTAMP NOT NULL,
+    sets INTEGER NOT NULL DEFAULT 0,
+    reps INTEGER NOT NULL DEFAULT 0,
+    volume FLOAT NOT NULL DEFAULT 0,
+    max_weight FLOAT NOT NULL DEFAULT 0,
+    estimated_1rm FLOAT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, exercise_id, workout_id)
+);
 
--- Krijo index për performance
-CREATE INDEX IF NOT EXISTS idx_workouts_user_id ON workouts(user_id);
-CREATE INDEX IF NOT EXISTS idx_workout_exercises_workout_id ON workout_exercises(workout_id);
-CREATE INDEX IF NOT EXISTS idx_workout_exercises_exercise_id ON workout_exercises(exercise_id);
+-- Më shumë përsëritje në një seri pa peshë, për rekordet e ushtrimeve me peshën e trupit (migrimi 10)
+ALTER TABLE exercise_sessions ADD COLUMN IF NOT EXISTS max_reps INTEGER NOT NULL DEFAULT 0;
+
+-- Krijo tabelën weekly_exercise_stats (totalet javore për ushtrim, për grafikët e progresit)
+CREATE TABLE IF NOT EXISTS weekly_exercise_stats (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    exercise_id INTEGER NOT NULL REFERENCES exercises(id) ON DELETE CASCADE,
+    week DATE NOT NULL,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    sets INTEGER NOT NULL DEFAULT 0,
+    reps INTEGER NOT NULL DEFAULT 0,
+    volume FLOAT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, exercise_id, week)
+);
+
+-- Krijo tabelën personal_records (rekordet personale për ushtrim)
+CREATE TABLE IF NOT EXISTS personal_records (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    exercise_id INTEGER NOT NULL REFERENCES exercises(id) ON DELETE CASCADE,
+    kind VARCHAR(20) NOT NULL,
+    value FLOAT NOT NULL,
+    workout_id INTEGER NOT NULL,
+    achieved_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, exercise_id, kind)
+);
+
+-- Krijo index për performance (të njëjtat si migrimi 2 në backend/schema.py)
+-- Historia e përdoruesit sipas datës, pa sort: WHERE user_id = ? ORDER BY date DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_workouts_user_date ON workouts (user_id, date DESC, id DESC);
+-- Ushtrimet e një workout-i sipas id, exercise_id lexohet nga indeksi
+CREATE INDEX IF NOT EXISTS idx_workout_exercises_workout_entry ON workout_exercises (workout_id, id, exercise_id);
+CREATE INDEX IF NOT EXISTS idx_workout_exercises_exercise_id ON workout_exercises (exercise_id);
+-- Zëvendësohen nga indekset e përbëra më sipër
+DROP INDEX IF EXISTS idx_workouts_user_id;
+DROP INDEX IF EXISTS idx_workout_exercises_workout_id;
+-- Filtrat e kërkimit të ushtrimeve sipas kategorisë dhe muskujve (migrimi 4)
+CREATE INDEX IF NOT EXISTS idx_exercises_category ON exercises (category);
+CREATE INDEX IF NOT EXISTS idx_exercise_muscles_muscle ON exercise_muscles (muscle, exercise_id);
+-- Ndryshimet që nga një token sinkronizimi, sipas versionit (migrimi 5)
+CREATE INDEX IF NOT EXISTS idx_workouts_user_change ON workouts (user_id, change_version, id);
+CREATE INDEX IF NOT EXISTS idx_workout_tombstones_user_change ON workout_tombstones (user_id, change_version, workout_id);
+-- Vëllimi javor i të gjithë përdoruesve për renditjet (migrimi 8, backend/leaderboards.py)
+CREATE INDEX IF NOT EXISTS idx_weekly_exercise_stats_week ON weekly_exercise_stats (week, user_id);
 
 -- Seed exercises data (vetëm nëse tabela është e zbrazët)
 INSERT INTO exercises (name, category, muscle, description, image) 
@@ -62,6 +210,41 @@ SELECT * FROM (VALUES
 ) AS v(name, category, muscle, description, image)
 WHERE NOT EXISTS (SELECT 1 FROM exercises LIMIT 1);
 
+-- Muskujt e normalizuar të ushtrimeve seed (si normalize_muscles në backend/search.py)
+INSERT INTO exercise_muscles (exercise_id, muscle)
+SELECT e.id, v.muscle FROM (VALUES
+    ('Push-ups', 'Chest'),
+    ('Push-ups', 'Triceps'),
+    ('Squats', 'Glutes'),
+    ('Squats', 'Quadriceps'),
+    ('Pull-ups', 'Biceps'),
+    ('Pull-ups', 'Lats'),
+    ('Deadlifts', 'Back'),
+    ('Deadlifts', 'Glutes'),
+    ('Deadlifts', 'Hamstrings'),
+    ('Bench Press', 'Chest'),
+    ('Bench Press', 'Shoulders'),
+    ('Bench Press', 'Triceps'),
+    ('Plank', 'Abs'),
+    ('Plank', 'Core'),
+    ('Lunges', 'Glutes'),
+    ('Lunges', 'Quadriceps'),
+    ('Shoulder Press', 'Shoulders'),
+    ('Shoulder Press', 'Triceps')
+) AS v(name, muscle)
+JOIN exercises e ON e.name = v.name
+ON CONFLICT DO NOTHING;
+
+-- Rrit versionin e katalogut që cache-t e serverit të rifreskohen
+INSERT INTO catalog_version (id, version) VALUES (1, 1)
+ON CONFLICT (id) DO UPDATE SET version = catalog_version.version + 1;
+
+-- Shëno versionin e skemës që përputhet me MIGRATIONS në backend/schema.py
+-- (në një databazë me të dhëna ekzistuese përdor python init_db.py në vend të këtij skripti:
+-- migrimet mbushin edhe progresin dhe muskujt e ushtrimeve ekzistuese)
+INSERT INTO schema_version (id, version) VALUES (1, 10)
+ON CONFLICT (id) DO UPDATE SET version = GREATEST(schema_version.version, EXCLUDED.version);
+
 -- Verifikim
 SELECT COUNT(*) as total_exercises FROM exercises;
 